@@ -0,0 +1,304 @@
+# batch.py
+# Fitting many pulsars over a process pool
+"""Batch fitting of many pulsars over a process pool.
+
+Each job is a (parfile, timfile) pair. The jobs are distributed over a
+`concurrent.futures.ProcessPoolExecutor` whose workers load the solar
+system ephemeris, the IERS tables and, optionally, the observatory clock
+files once, before their first job, so the following jobs of a worker reuse
+them. The jobs with the most TOAs are started first, so a large pulsar does
+not end the batch alone. A job that fails, or whose worker process dies, is
+reported in the summary and does not stop the other jobs (on Python 2, a
+`multiprocessing.Pool` is used and a dead worker process blocks the batch)::
+
+    summary = fit_batch([('J0001.par', 'J0001.tim'),
+                         ('J0002.par', 'J0002.tim')],
+                        processes=4, outdir='fitted')
+    print(summary)
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import time
+import traceback
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+try:
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+except ImportError:
+    # Python 2: the futures backport has no BrokenProcessPool, so a dead
+    # worker can not be detected there.
+    ProcessPoolExecutor = BrokenProcessPool = None
+import numpy as np
+from astropy import log
+from astropy.table import Table
+
+
+__all__ = ['fit_batch', 'fit_pulsar', 'warm_caches']
+
+# The (ephem, observatories) whose data this process has loaded
+_warmed_caches = set()
+
+
+def warm_caches(ephem="DE421", observatories=()):
+    """Load the data that all the jobs of a process share.
+
+    The IERS tables are read when pint.toa is imported, the ephemeris kernel
+    is loaded by a first position computation, and the clock files of the
+    observatories by a first clock correction. They are kept for the life
+    of the process.
+
+    Parameters
+    ----------
+    ephem: str
+        The solar system ephemeris name.
+    observatories: list of str, optional
+        The observatory codes whose clock files are read.
+    """
+    from astropy.time import Time
+    from . import toa
+    from .solar_system_ephemerides import objPosVel_wrt_SSB
+    from .observatory import get_observatory
+    t = Time(55000.0, format='mjd', scale='tdb')
+    objPosVel_wrt_SSB('earth', t, ephem)
+    for obs in observatories:
+        try:
+            get_observatory(obs).clock_corrections(t.utc)
+        except Exception as e:
+            log.warn("Could not read the clock files of observatory %s: %s"
+                     % (obs, e))
+
+
+def _failed_result(job, error=''):
+    """Return the summary dictionary of a job that did not succeed."""
+    return {'psr': '', 'parfile': job['parfile'], 'timfile': job['timfile'],
+            'outfile': '', 'ntoas': 0, 'chi2': np.nan, 'chi2_reduced': np.nan,
+            'load_time': np.nan, 'fit_time': np.nan, 'status': 'failed',
+            'error': error}
+
+
+def _init_batch_worker(ephem, observatories):
+    key = (ephem, tuple(observatories))
+    if key in _warmed_caches:
+        return
+    _warmed_caches.add(key)
+    try:
+        warm_caches(ephem, observatories)
+    except Exception as e:
+        # The jobs will load what they need and report their errors.
+        log.warn("Could not warm the worker caches: %s" % e)
+
+
+def _count_toa_lines(timfile):
+    """Return the number of TOA lines of a TOA file and its INCLUDEd files.
+
+    This only ranks the jobs by size, so the lines are not parsed: a line
+    with at least three fields that is not a comment counts as a TOA, also
+    in the SKIP sections, and the commands have fewer fields. As in
+    pint.toa, the INCLUDEd file names are relative to the current
+    directory. A file that cannot be read counts as 0.
+
+    Parameters
+    ----------
+    timfile: str
+        The TOA file name.
+    """
+    count = 0
+    try:
+        with open(timfile) as f:
+            for line in f:
+                k = line.split()
+                # The comments as in pint.toa.toa_format()
+                if not k or line[0] in ('C', '#'):
+                    continue
+                if k[0].upper() == 'INCLUDE' and len(k) > 1:
+                    count += _count_toa_lines(k[1])
+                elif len(k) >= 3:
+                    count += 1
+    except (IOError, OSError):
+        pass
+    return count
+
+
+def _fit_isolated(job):
+    """Fit one pulsar in its own worker process, so that if the process
+    dies only this job fails.
+    """
+    executor = ProcessPoolExecutor(max_workers=1)
+    try:
+        return executor.submit(fit_pulsar, job).result()
+    except BrokenProcessPool:
+        log.error("The worker process fitting %s with %s died"
+                  % (job['parfile'], job['timfile']))
+        return _failed_result(job, 'The worker process died')
+    except Exception as e:
+        return _failed_result(job, repr(e))
+    finally:
+        executor.shutdown()
+
+
+def fit_pulsar(job):
+    """Fit one pulsar and return a summary dictionary.
+
+    Parameters
+    ----------
+    job: dict
+        The 'parfile' and 'timfile' names, the 'fitter' class name in
+        pint.fitter, 'maxiter', 'ephem', 'observatories' (the observatories
+        whose clock files are read before the first job of a process),
+        'outdir' (the directory of the fitted par file, None for no file)
+        and 'fit_kwargs' (the other keyword arguments of fit_toas()).
+
+    Return
+    ----------
+    A dictionary with the pulsar name, the file names, the number of TOAs,
+    the chi2 and reduced chi2, the load and fit wall times in seconds, the
+    status ('ok' or 'failed') and the error message of a failed job.
+    """
+    result = _failed_result(job)
+    _init_batch_worker(job['ephem'], job['observatories'])
+    try:
+        t0 = time.time()
+        from . import toa, fitter
+        from .models import get_model
+        model = get_model(job['parfile'])
+        result['psr'] = str(model.PSR.value)
+        toas = toa.get_TOAs(job['timfile'], ephem=job['ephem'], model=model)
+        result['ntoas'] = toas.ntoas
+        t1 = time.time()
+        result['load_time'] = t1 - t0
+        f = getattr(fitter, job['fitter'])(toas, model)
+        f.fit_toas(maxiter=job['maxiter'], **job['fit_kwargs'])
+        f.update_resids()
+        result['fit_time'] = time.time() - t1
+        result['chi2'] = float(f.resids.chi2)
+        result['chi2_reduced'] = float(f.resids.chi2_reduced)
+        if job['outdir'] is not None:
+            name = os.path.splitext(os.path.basename(job['parfile']))[0]
+            outfile = os.path.join(job['outdir'], name + '.fit.par')
+            with open(outfile, 'w') as fout:
+                fout.write(f.model.as_parfile())
+            result['outfile'] = outfile
+        result['status'] = 'ok'
+    except Exception:
+        result['error'] = traceback.format_exc().strip().split('\n')[-1]
+        log.error("Fitting %s with %s failed:\n%s" % (job['parfile'],
+                  job['timfile'], traceback.format_exc()))
+    return result
+
+
+def _fit_executor(jobs, order, processes, results):
+    """Fit the jobs over a ProcessPoolExecutor, in the given order, and put
+    their results in results.
+    """
+    broken = []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = [(ii, executor.submit(fit_pulsar, jobs[ii]))
+                   for ii in order]
+        for ii, future in pending:
+            try:
+                results[ii] = future.result()
+            except BrokenProcessPool:
+                # A worker died, this job may not be the one that
+                # killed it.
+                broken.append(ii)
+            except Exception as e:
+                # e.g. a result that could not be sent back
+                results[ii] = _failed_result(jobs[ii], repr(e))
+    if broken:
+        log.warn("A worker process died, fitting %d pulsars again "
+                 "one per process" % len(broken))
+        retry = ThreadPool(min(processes, len(broken)))
+        try:
+            retried = retry.map(_fit_isolated, [jobs[ii] for ii in broken])
+        finally:
+            retry.close()
+            retry.join()
+        for ii, result in zip(broken, retried):
+            results[ii] = result
+
+
+def _fit_pool(jobs, order, processes, results):
+    """Fit the jobs over a multiprocessing.Pool, in the given order, and put
+    their results in results. A dead worker process never returns its
+    result, so this is only used where there is no ProcessPoolExecutor.
+    """
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        pending = [(ii, pool.apply_async(fit_pulsar, (jobs[ii],)))
+                   for ii in order]
+        for ii, res in pending:
+            try:
+                results[ii] = res.get()
+            except Exception as e:
+                # e.g. a result that could not be sent back
+                results[ii] = _failed_result(jobs[ii], repr(e))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def fit_batch(pairs, processes=None, fitter='WlsFitter', maxiter=1,
+              ephem="DE421", outdir=None, observatories=(), **fit_kwargs):
+    """Fit a list of pulsars over a process pool.
+
+    Parameters
+    ----------
+    pairs: list of (str, str)
+        The (parfile, timfile) pairs.
+    processes: int, optional
+        The number of worker processes. Default is the number of CPUs. With
+        1, the pulsars are fitted in this process. If a worker process
+        dies, e.g. out of memory, the jobs it took down with the pool are
+        fitted again each in its own process, and only the job that killed
+        its process is reported as failed (not on Python 2, where the batch
+        then waits for ever).
+    fitter: str, optional
+        The fitter class name in pint.fitter.
+    maxiter: int, optional
+        The maxiter argument of fit_toas().
+    ephem: str, optional
+        The solar system ephemeris.
+    outdir: str, optional
+        The directory of the fitted par files, named as the input par files
+        with '.fit.par'. Default is to write no par file.
+    observatories: list of str, optional
+        The observatories whose clock files are read before the first job
+        of a worker.
+    fit_kwargs:
+        The other keyword arguments of fit_toas().
+
+    Return
+    ----------
+    An astropy Table with a row per pulsar, in the order of pairs, with
+    the columns of fit_pulsar() results.
+    """
+    if outdir is not None and not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    jobs = [{'parfile': par, 'timfile': tim, 'fitter': fitter,
+             'maxiter': maxiter, 'ephem': ephem,
+             'observatories': tuple(observatories), 'outdir': outdir,
+             'fit_kwargs': fit_kwargs} for par, tim in pairs]
+
+    # The jobs with the most TOAs first
+    sizes = [_count_toa_lines(job['timfile']) for job in jobs]
+    order = sorted(range(len(jobs)), key=lambda ii: sizes[ii], reverse=True)
+
+    results = [None] * len(jobs)
+    if processes == 1:
+        for ii in order:
+            results[ii] = fit_pulsar(jobs[ii])
+    else:
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if ProcessPoolExecutor is None:
+            _fit_pool(jobs, order, processes, results)
+        else:
+            _fit_executor(jobs, order, processes, results)
+
+    names = ['psr', 'parfile', 'timfile', 'outfile', 'ntoas', 'chi2',
+             'chi2_reduced', 'load_time', 'fit_time', 'status', 'error']
+    if results == []:
+        return Table(names=names)
+    return Table(rows=[[r[n] for n in names] for r in results], names=names)
+
@@ -0,0 +1,240 @@
+# covariance.py
+# Structured TOA noise covariance matrices
+"""Solvers for structured TOA noise covariance matrices.
+
+The white noise of the TOAs, scaled by EFAC/EQUAD, is diagonal, and the
+ECORR noise adds one constant block per observing epoch. Such a covariance
+is applied epoch by epoch with the Sherman-Morrison formula, from the epoch
+number of each TOA, without forming the quantization matrix or the NxN
+covariance.
+
+The noise with a low rank basis, such as the Fourier basis of the red
+noise, is added with the Woodbury identity. The projections of the basis
+on the white noise are computed once, so changing only the basis weights
+(e.g. the red noise amplitude) costs O(k^3) for k basis vectors.
+"""
+from __future__ import absolute_import, print_function, division
+import numpy as np
+import scipy.linalg as sl
+import scipy.sparse as sparse
+
+__all__ = ['ShermanMorrison', 'Woodbury', 'weighted_gram']
+
+
+def weighted_gram(A, B, w):
+    """Return A^T diag(w) B as a dense array. A and B can be numpy arrays
+    or scipy.sparse matrices; the sparse ones are not densified.
+    """
+    if sparse.issparse(A):
+        result = A.T.dot(_scale_rows(B, w))
+    elif sparse.issparse(B):
+        result = B.T.dot(_scale_rows(A, w)).T
+    else:
+        result = np.dot(A.T, _scale_rows(B, w))
+    if sparse.issparse(result):
+        return result.toarray()
+    return np.asarray(result)
+
+
+def _scale_rows(A, w):
+    """Return diag(w) A for a numpy array or a scipy.sparse matrix."""
+    if sparse.issparse(A):
+        return sparse.diags(w).dot(A)
+    if A.ndim == 1:
+        return w * A
+    return w[:,None] * A
+
+
+class ShermanMorrison(object):
+    """The covariance N = diag(nvec) + sum_e J_e u_e u_e^T, where u_e is
+    the indicator vector of the TOAs in the epoch e.
+
+    Each epoch block is inverted with the Sherman-Morrison formula
+
+        N_e^-1 = D^-1 - alpha_e D^-1 u_e u_e^T D^-1,
+        alpha_e = J_e / (1 + J_e u_e^T D^-1 u_e),
+
+    so applying N^-1 costs O(N) per vector, independent of the number of
+    epochs.
+
+    Parameters
+    ----------
+    nvec: numpy.ndarray
+        The diagonal (white noise) variances of the TOAs, in s^2.
+    jvec: numpy.ndarray
+        The variance of each epoch (e.g. ECORR^2), in s^2.
+    index: numpy.ndarray
+        The epoch number of each TOA, -1 for the TOAs in no epoch.
+    """
+    def __init__(self, nvec, jvec, index):
+        self.nvec = np.asarray(nvec, dtype=np.float64)
+        self.jvec = np.asarray(jvec, dtype=np.float64)
+        self.index = np.asarray(index, dtype=int)
+        self.dinv = 1.0 / self.nvec
+        rows = np.nonzero(self.index >= 0)[0]
+        # Epoch indicator matrix, (ntoa, nepoch)
+        self.epochs = sparse.csr_matrix((np.ones(len(rows)),
+                                         (rows, self.index[rows])),
+                                        shape=(len(self.nvec),
+                                               len(self.jvec)))
+        self.epochs_t = self.epochs.T.tocsr()
+        self.dinv_sum = self.epochs_t.dot(self.dinv)
+        self.alpha = self.jvec / (1.0 + self.jvec * self.dinv_sum)
+        self._logdet = None
+
+    def epoch_sum(self, X):
+        """Return the per-epoch sums of D^-1 X, u_e^T D^-1 X."""
+        result = self.epochs_t.dot(_scale_rows(X, self.dinv))
+        if sparse.issparse(result):
+            return result.toarray()
+        return result
+
+    def dot(self, X):
+        """Return N X for a vector or a dense matrix X."""
+        X = np.asarray(X)
+        s = self.epochs_t.dot(X)
+        s = s * self.jvec if s.ndim == 1 else self.jvec[:,None] * s
+        return _scale_rows(X, self.nvec) + self.epochs.dot(s)
+
+    def solve(self, X):
+        """Return N^-1 X for a vector or a dense matrix X."""
+        X = np.asarray(X)
+        s = self.epoch_sum(X)
+        s = s * self.alpha if s.ndim == 1 else self.alpha[:,None] * s
+        return _scale_rows(X - self.epochs.dot(s), self.dinv)
+
+    def inner(self, A, B=None):
+        """Return A^T N^-1 B as a dense array, for numpy arrays or
+        scipy.sparse matrices. B defaults to A.
+        """
+        if B is None:
+            B = A
+        vector = not sparse.issparse(B) and np.ndim(B) == 1
+        if vector:
+            B = B[:,None]
+        result = weighted_gram(A, B, self.dinv) - \
+            np.dot(self.epoch_sum(A).T, self.alpha[:,None] *
+                   self.epoch_sum(B))
+        if vector:
+            return result[:, 0]
+        return result
+
+    def logdet(self):
+        """Return log(det(N))."""
+        if self._logdet is None:
+            self._logdet = np.sum(np.log(self.nvec)) + \
+                np.sum(np.log1p(self.jvec * self.dinv_sum))
+        return self._logdet
+
+    def epoch_offsets(self, r):
+        """Return the conditional mean of the epoch offsets given the
+        residuals r, (u_e^T D^-1 u_e + 1/J_e)^-1 u_e^T D^-1 r, expanded to the
+        TOAs (zero for the TOAs in no epoch).
+        """
+        return self.epochs.dot(self.alpha * self.epoch_sum(r))
+
+
+class Woodbury(object):
+    """The covariance C = N + T diag(phi) T^T, with the white noise N given
+    as a ShermanMorrison instance and a low rank noise basis T.
+
+    With Sigma = T^T N^-1 T + diag(1/phi), the Woodbury identity gives
+
+        C^-1 = N^-1 - N^-1 T Sigma^-1 T^T N^-1.
+
+    T^T N^-1 T is computed when the instance is created, so set_phi() only
+    factors the k x k matrix Sigma.
+
+    Parameters
+    ----------
+    white: ShermanMorrison
+        The white noise covariance N.
+    T: numpy.ndarray, scipy.sparse matrix or None
+        The (N, k) noise basis, None if there is no basis.
+    phi: numpy.ndarray, optional
+        The (k,) basis weights (prior variances), in s^2.
+    """
+    def __init__(self, white, T, phi=None):
+        self.white = white
+        self.T = T
+        self.phi = None
+        self.sigma_cf = None
+        if T is not None:
+            self.TNT = white.inner(T)
+            if phi is not None:
+                self.set_phi(phi)
+
+    @property
+    def nbasis(self):
+        return 0 if self.T is None else self.T.shape[1]
+
+    def set_phi(self, phi):
+        """Set the basis weights and factor Sigma. Unchanged weights are
+        not factored again.
+        """
+        phi = np.asarray(phi, dtype=np.float64)
+        if self.phi is not None and np.array_equal(phi, self.phi):
+            return
+        self.phi = phi
+        self.sigma_cf = sl.cho_factor(self.TNT + np.diag(1.0 / phi))
+
+    def project(self, A):
+        """Return T^T N^-1 A."""
+        return self.white.inner(self.T, A)
+
+    def inner(self, A, B=None, TNA=None, TNB=None):
+        """Return A^T C^-1 B as a dense array, for numpy arrays or
+        scipy.sparse matrices. B defaults to A. The projections
+        T^T N^-1 A and T^T N^-1 B can be given if they are known.
+        """
+        if B is None:
+            B = A
+            TNB = TNA
+        result = self.white.inner(A, B)
+        if self.nbasis == 0:
+            return result
+        if TNA is None:
+            TNA = self.project(A)
+        if TNB is None:
+            TNB = self.project(B)
+        return result - np.dot(TNA.T, sl.cho_solve(self.sigma_cf, TNB))
+
+    def dot(self, X):
+        """Return C X for a vector or a dense matrix X."""
+        result = self.white.dot(X)
+        if self.nbasis == 0:
+            return result
+        TX = self.T.T.dot(X)
+        TX = TX * self.phi if TX.ndim == 1 else self.phi[:,None] * TX
+        return result + self.T.dot(TX)
+
+    def solve(self, X):
+        """Return C^-1 X for a vector or a dense matrix X."""
+        result = self.white.solve(X)
+        if self.nbasis == 0:
+            return result
+        coeffs = sl.cho_solve(self.sigma_cf, self.project(X))
+        return result - self.white.solve(self.T.dot(coeffs))
+
+    def logdet(self):
+        """Return log(det(C))."""
+        result = self.white.logdet()
+        if self.nbasis == 0:
+            return result
+        return result + np.sum(np.log(self.phi)) + \
+            2 * np.sum(np.log(np.diag(self.sigma_cf[0])))
+
+    def basis_coefficients(self, r):
+        """Return the conditional mean of the basis coefficients given the
+        residuals r, Sigma^-1 T^T N^-1 r.
+        """
+        return sl.cho_solve(self.sigma_cf, self.project(r))
+
+    def noise_realization(self, r):
+        """Return the conditional mean of the correlated noise (basis and
+        epoch offsets) given the residuals r, at the TOAs.
+        """
+        result = np.zeros(len(r))
+        if self.nbasis > 0:
+            result += self.T.dot(self.basis_coefficients(r))
+        return result + self.white.epoch_offsets(r - result)
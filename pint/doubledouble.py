@@ -0,0 +1,278 @@
+# doubledouble.py
+# Vectorized double-double arithmetic
+"""Double-double arithmetic on numpy float64 arrays.
+
+A double-double number is the unevaluated sum hi + lo of two float64 numbers
+with |lo| <= ulp(hi)/2, which gives about 106 bits of mantissa. All the
+operations are plain float64 numpy operations, so they are vectorized and
+behave the same on all the platforms, unlike numpy.longdouble whose
+precision depends on the platform (80-bit x87 on x86, plain double on some
+others).
+
+The algorithms are the error-free transformations of Dekker (1971) and
+Knuth, as used in the QD library (Hida, Li & Bailey 2001).
+"""
+from __future__ import absolute_import, print_function, division
+import numpy as np
+from .toa_select import column_cache
+
+__all__ = ['DDArray', 'two_sum', 'quick_two_sum', 'two_prod', 'dd_taylor_horner',
+           'tdb_dd']
+
+# 2**27 + 1, for splitting a float64 in two 26-bit halves.
+_SPLITTER = 134217729.0
+DJM0 = 2400000.5
+
+
+def two_sum(a, b):
+    """Return s, e with s = fl(a + b) and s + e = a + b exactly."""
+    s = a + b
+    bb = s - a
+    e = (a - (s - bb)) + (b - bb)
+    return s, e
+
+
+def quick_two_sum(a, b):
+    """Same as `two_sum`, assuming |a| >= |b|."""
+    s = a + b
+    e = b - (s - a)
+    return s, e
+
+
+def _split(a):
+    t = _SPLITTER * a
+    hi = t - (t - a)
+    lo = a - hi
+    return hi, lo
+
+
+def two_prod(a, b):
+    """Return p, e with p = fl(a * b) and p + e = a * b exactly."""
+    p = a * b
+    ah, al = _split(a)
+    bh, bl = _split(b)
+    e = ((ah * bh - p) + ah * bl + al * bh) + al * bl
+    return p, e
+
+
+class DDArray(object):
+    """An array of double-double numbers.
+
+    Parameters
+    ----------
+    hi: array_like
+        The leading float64 part.
+    lo: array_like, optional
+        The trailing float64 part. Default is zero.
+    normalize: bool, optional
+        If True, renormalize hi and lo so |lo| <= ulp(hi)/2.
+    """
+    def __init__(self, hi, lo=None, normalize=True):
+        hi = np.asarray(hi, dtype=np.float64)
+        if lo is None:
+            lo = np.zeros_like(hi)
+        else:
+            lo = np.asarray(lo, dtype=np.float64)
+        if normalize:
+            hi, lo = two_sum(hi, lo)
+        self.hi = hi
+        self.lo = lo
+
+    @classmethod
+    def from_longdouble(cls, x):
+        """Convert a (numpy.longdouble) array to double-double."""
+        x = np.asarray(x, dtype=np.longdouble)
+        hi = x.astype(np.float64)
+        lo = (x - hi).astype(np.float64)
+        return cls(hi, lo)
+
+    @classmethod
+    def from_time(cls, t):
+        """Return the MJD of an astropy Time (array) as double-double.
+
+        The MJD is computed from the two-part Julian date (jd1, jd2) of the
+        time, so no precision is lost.
+        """
+        return cls(np.asarray(t.jd1) - DJM0, t.jd2)
+
+    @classmethod
+    def asdd(cls, x):
+        """Return x as a DDArray, converting a number or an array."""
+        if isinstance(x, cls):
+            return x
+        x = np.asarray(x)
+        if x.dtype == np.longdouble:
+            return cls.from_longdouble(x)
+        return cls(x, normalize=False)
+
+    @property
+    def shape(self):
+        return self.hi.shape
+
+    def __len__(self):
+        return len(self.hi)
+
+    def __getitem__(self, idx):
+        return DDArray(self.hi[idx], self.lo[idx], normalize=False)
+
+    def __repr__(self):
+        return "DDArray(%r, %r)" % (self.hi, self.lo)
+
+    def to_longdouble(self):
+        return np.longdouble(self.hi) + np.longdouble(self.lo)
+
+    def to_float(self):
+        return self.hi + self.lo
+
+    def __neg__(self):
+        return DDArray(-self.hi, -self.lo, normalize=False)
+
+    def __add__(self, other):
+        other = DDArray.asdd(other)
+        s, e = two_sum(self.hi, other.hi)
+        t, f = two_sum(self.lo, other.lo)
+        e += t
+        s, e = quick_two_sum(s, e)
+        e += f
+        s, e = quick_two_sum(s, e)
+        return DDArray(s, e, normalize=False)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self.__add__(-DDArray.asdd(other))
+
+    def __rsub__(self, other):
+        return DDArray.asdd(other).__add__(-self)
+
+    def __mul__(self, other):
+        other = DDArray.asdd(other)
+        p, e = two_prod(self.hi, other.hi)
+        e += self.hi * other.lo + self.lo * other.hi
+        p, e = quick_two_sum(p, e)
+        return DDArray(p, e, normalize=False)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        other = DDArray.asdd(other)
+        # Long division: q1 = a/b, r = a - q1*b, q2 = r/b, ...
+        q1 = self.hi / other.hi
+        r = self - other * q1
+        q2 = r.hi / other.hi
+        r = r - other * q2
+        q3 = r.hi / other.hi
+        q1, q2 = quick_two_sum(q1, q2)
+        return DDArray(q1, q2, normalize=False) + q3
+
+    __div__ = __truediv__
+
+    def __rtruediv__(self, other):
+        return DDArray.asdd(other).__truediv__(self)
+
+    __rdiv__ = __rtruediv__
+
+    def split_int_frac(self):
+        """Return the nearest integers and the fractional parts in
+        [-0.5, 0.5], as two float64 arrays.
+        """
+        ii = np.rint(self.hi)
+        # hi - ii is exact, since hi and ii are close.
+        ff = (self.hi - ii) + self.lo
+        carry = np.rint(ff)
+        return ii + carry, ff - carry
+
+
+def _horner_block(xh, xl, terms, hi, lo, work):
+    """Horner steps (hi, lo) <- (hi, lo) * (xh, xl) + term on one block.
+
+    The products use the two_prod and the sums the two_sum error-free
+    transformations, written with in-place operations on the work arrays.
+    """
+    mul, add, sub = np.multiply, np.add, np.subtract
+    p, e, s, t, u, rh, rl, xhh, xhl = work
+    # The split of x is the same for all the steps
+    mul(xh, _SPLITTER, out=t)
+    sub(t, xh, out=u)
+    sub(t, u, out=xhh)
+    sub(xh, xhh, out=xhl)
+    hi[:] = terms[-1][0]
+    lo[:] = terms[-1][1]
+    for c_hi, c_lo in terms[-2::-1]:
+        # p + e = (hi + lo) * (xh + xl)
+        mul(hi, xh, out=p)
+        mul(hi, _SPLITTER, out=t)
+        sub(t, hi, out=u)
+        sub(t, u, out=rh)
+        sub(hi, rh, out=rl)
+        mul(rh, xhh, out=e)
+        sub(e, p, out=e)
+        mul(rh, xhl, out=t)
+        add(e, t, out=e)
+        mul(rl, xhh, out=t)
+        add(e, t, out=e)
+        mul(rl, xhl, out=t)
+        add(e, t, out=e)
+        mul(hi, xl, out=t)
+        add(e, t, out=e)
+        mul(lo, xh, out=t)
+        add(e, t, out=e)
+        # s + e = p + e + c
+        add(p, c_hi, out=s)
+        sub(s, p, out=u)
+        sub(s, u, out=t)
+        sub(p, t, out=t)
+        add(e, t, out=e)
+        sub(c_hi, u, out=t)
+        add(t, c_lo, out=t)
+        add(e, t, out=e)
+        # Renormalize
+        add(s, e, out=hi)
+        sub(hi, s, out=t)
+        sub(e, t, out=lo)
+
+
+def dd_taylor_horner(x, coeffs, block_size=8192):
+    """Evaluate a Taylor series in double-double via the Horner scheme.
+
+    Same as `pint.utils.taylor_horner`, for a DDArray x and plain number
+    (or longdouble) coefficients in consistent units. The coefficients are
+    divided by the factorials once, so every Horner step is a double-double
+    multiply-add, and the TOAs are done in blocks of block_size, whose
+    intermediate arrays stay in the processor cache.
+    """
+    x = DDArray.asdd(x)
+    terms = []
+    fact = 1.0
+    for k, coeff in enumerate(coeffs):
+        fact *= max(k, 1)
+        term = DDArray.asdd(coeff) / fact
+        terms.append((float(term.hi), float(term.lo)))
+    xh = np.ravel(x.hi)
+    xl = np.ravel(x.lo)
+    hi = np.empty_like(xh)
+    lo = np.empty_like(xh)
+    work = [np.empty(min(block_size, len(xh))) for ii in range(9)]
+    for st in range(0, len(xh), block_size):
+        ed = min(st + block_size, len(xh))
+        _horner_block(xh[st:ed], xl[st:ed], terms, hi[st:ed], lo[st:ed],
+                      [w[:ed - st] for w in work])
+    return DDArray(hi.reshape(x.shape), lo.reshape(x.shape), normalize=False)
+
+
+def tdb_dd(toas):
+    """Return the TDB MJDs of a TOA table as a DDArray.
+
+    They are computed from the two-part Julian dates of the 'tdb' column,
+    so no precision is lost, and kept with the column (see
+    pint.toa_select.column_cache). Tables without a 'tdb' column use the
+    'tdbld' column.
+    """
+    if 'tdb' not in toas.colnames:
+        return DDArray.from_longdouble(np.asarray(toas['tdbld']))
+    cache = column_cache(toas['tdb'])
+    if 'tdb_dd' not in cache:
+        tdb = toas['tdb']
+        cache['tdb_dd'] = DDArray(np.array([t.jd1 for t in tdb]) - DJM0,
+                                  np.array([t.jd2 for t in tdb]))
+    return cache['tdb_dd']
@@ -0,0 +1,254 @@
+# dual.py
+# Vectorized dual numbers for forward-mode automatic differentiation
+"""Dual numbers for forward-mode automatic differentiation.
+
+A `Dual` holds a value array and the derivatives of that value with respect
+to a fixed set of k inputs, as an array with one extra leading axis of
+length k. The numpy arithmetic and the common ufuncs (np.sin, np.sqrt, ...)
+accept Duals, through the __array_ufunc__ protocol of numpy >= 1.13, so a
+formula written with numpy propagates all the derivatives in one
+evaluation.
+
+The derivatives are always kept in float64, while the value keeps the
+precision of the inputs (e.g. numpy.longdouble for times).
+"""
+from __future__ import absolute_import, print_function, division
+import numpy as np
+
+__all__ = ['Dual', 'seed_duals', 'value_of']
+
+
+def value_of(x):
+    """Return the value of a Dual, or x itself for a constant."""
+    if isinstance(x, Dual):
+        return x.value
+    return x
+
+
+def _expand(d, ndim):
+    """Add trailing axes to a derivative array so it broadcasts against a
+    value array of ndim dimensions.
+    """
+    extra = ndim - (d.ndim - 1)
+    if extra > 0:
+        d = d.reshape(d.shape + (1,) * extra)
+    return d
+
+
+def _as_float(x):
+    return np.asarray(x, dtype=np.float64)
+
+
+class Dual(object):
+    """A value with its derivatives with respect to k inputs.
+
+    Parameters
+    ----------
+    value: array_like
+        The value.
+    derivs: array_like
+        The derivatives, of shape (k,) + shape of value (or broadcastable to
+        it along the trailing axes).
+    """
+    # Make numpy defer to the Dual operators
+    __array_priority__ = 1000
+
+    def __init__(self, value, derivs):
+        self.value = value
+        self.derivs = np.asarray(derivs, dtype=np.float64)
+
+    @property
+    def nderivs(self):
+        return self.derivs.shape[0]
+
+    @property
+    def shape(self):
+        return np.shape(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __repr__(self):
+        return "Dual(%r, %r)" % (self.value, self.derivs)
+
+    def __getitem__(self, idx):
+        d = self.full_derivs()
+        if not isinstance(idx, tuple):
+            idx = (idx,)
+        return Dual(self.value[idx], d[(slice(None),) + idx])
+
+    def full_derivs(self):
+        """Return the derivatives broadcast to (k,) + shape of the value."""
+        d = _expand(self.derivs, np.ndim(self.value))
+        return np.broadcast_to(d, (self.nderivs,) + np.shape(self.value))
+
+    def _chain(self, value, dvalue):
+        """Return a Dual of value, with derivatives dvalue * self.derivs."""
+        ndim = max(np.ndim(value), self.derivs.ndim - 1)
+        return Dual(value, _expand(self.derivs, ndim) * _as_float(dvalue))
+
+    # Arithmetic
+    def __neg__(self):
+        return Dual(-self.value, -self.derivs)
+
+    def __pos__(self):
+        return self
+
+    def __add__(self, other):
+        if not isinstance(other, Dual):
+            return Dual(self.value + other, self.derivs)
+        value = self.value + other.value
+        ndim = np.ndim(value)
+        return Dual(value, _expand(self.derivs, ndim) +
+                    _expand(other.derivs, ndim))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self.__add__(-other)
+
+    def __rsub__(self, other):
+        return (-self).__add__(other)
+
+    def __mul__(self, other):
+        if not isinstance(other, Dual):
+            return self._chain(self.value * other, other)
+        value = self.value * other.value
+        ndim = np.ndim(value)
+        return Dual(value, _expand(self.derivs, ndim) * _as_float(other.value)
+                    + _expand(other.derivs, ndim) * _as_float(self.value))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if not isinstance(other, Dual):
+            return self._chain(self.value / other, 1.0 / _as_float(other))
+        value = self.value / other.value
+        ndim = np.ndim(value)
+        inv = 1.0 / _as_float(other.value)
+        return Dual(value, (_expand(self.derivs, ndim) -
+                            _expand(other.derivs, ndim) * _as_float(value)) *
+                    inv)
+
+    def __rtruediv__(self, other):
+        value = other / self.value
+        return self._chain(value, -_as_float(value) / _as_float(self.value))
+
+    __div__ = __truediv__
+    __rdiv__ = __rtruediv__
+
+    def __pow__(self, other):
+        if isinstance(other, Dual):
+            return np.exp(other * np.log(self))
+        value = self.value ** other
+        fv = _as_float(self.value)
+        return self._chain(value, other * fv ** (other - 1))
+
+    def __rpow__(self, other):
+        value = other ** self.value
+        return self._chain(value, _as_float(value) * np.log(other))
+
+    # Comparisons act on the values
+    def __lt__(self, other):
+        return self.value < value_of(other)
+
+    def __le__(self, other):
+        return self.value <= value_of(other)
+
+    def __gt__(self, other):
+        return self.value > value_of(other)
+
+    def __ge__(self, other):
+        return self.value >= value_of(other)
+
+    # numpy ufuncs
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != '__call__' or kwargs:
+            return NotImplemented
+        if ufunc in _binary_ufuncs:
+            return _binary_ufuncs[ufunc](*inputs)
+        if ufunc in _unary_ufuncs:
+            x = inputs[0]
+            value, dvalue = _unary_ufuncs[ufunc](x.value)
+            return x._chain(value, dvalue)
+        if ufunc is np.arctan2:
+            y, x = inputs
+            yv, xv = _as_float(value_of(y)), _as_float(value_of(x))
+            r2 = xv ** 2 + yv ** 2
+            value = np.arctan2(value_of(y), value_of(x))
+            ndim = np.ndim(value)
+            d = 0.0
+            if isinstance(y, Dual):
+                d = d + _expand(y.derivs, ndim) * (xv / r2)
+            if isinstance(x, Dual):
+                d = d - _expand(x.derivs, ndim) * (yv / r2)
+            return Dual(value, d)
+        if ufunc in (np.floor, np.ceil, np.rint, np.sign):
+            return ufunc(inputs[0].value)
+        return NotImplemented
+
+
+def _sqrt(v):
+    r = np.sqrt(v)
+    return r, 0.5 / _as_float(r)
+
+
+def _exp(v):
+    r = np.exp(v)
+    return r, r
+
+
+def _tan(v):
+    r = np.tan(v)
+    return r, 1.0 + _as_float(r) ** 2
+
+
+_unary_ufuncs = {
+    np.sin: lambda v: (np.sin(v), np.cos(_as_float(v))),
+    np.cos: lambda v: (np.cos(v), -np.sin(_as_float(v))),
+    np.tan: _tan,
+    np.arcsin: lambda v: (np.arcsin(v), 1.0 / np.sqrt(1 - _as_float(v) ** 2)),
+    np.arccos: lambda v: (np.arccos(v), -1.0 / np.sqrt(1 - _as_float(v) ** 2)),
+    np.arctan: lambda v: (np.arctan(v), 1.0 / (1 + _as_float(v) ** 2)),
+    np.sqrt: _sqrt,
+    np.exp: _exp,
+    np.log: lambda v: (np.log(v), 1.0 / _as_float(v)),
+    np.negative: lambda v: (-v, -1.0),
+    np.absolute: lambda v: (np.absolute(v), np.sign(_as_float(v))),
+    np.square: lambda v: (v ** 2, 2 * _as_float(v)),
+}
+
+_binary_ufuncs = {
+    np.add: lambda a, b: a + b if isinstance(a, Dual) else b.__radd__(a),
+    np.subtract: lambda a, b: a - b if isinstance(a, Dual) else b.__rsub__(a),
+    np.multiply: lambda a, b: a * b if isinstance(a, Dual) else b.__rmul__(a),
+    np.true_divide: lambda a, b: a / b if isinstance(a, Dual) else
+    b.__rtruediv__(a),
+    np.power: lambda a, b: a ** b if isinstance(a, Dual) else b.__rpow__(a),
+}
+
+
+def seed_duals(values, scales=None):
+    """Make independent Duals for a list of input values.
+
+    Parameters
+    ----------
+    values: list
+        The input values. The i-th Dual gets a derivative of scales[i] in
+        the i-th derivative slot.
+    scales: list, optional
+        The seed of each input. Default is one.
+
+    Return
+    ----------
+    A list of Duals.
+    """
+    k = len(values)
+    if scales is None:
+        scales = [1.0] * k
+    duals = []
+    for ii, v in enumerate(values):
+        d = np.zeros((k,) + np.shape(v))
+        d[ii] = scales[ii]
+        duals.append(Dual(v, d))
+    return duals
@@ -1,9 +1,27 @@
-import copy, numbers
+import copy, numbers, time
 import numpy as np
 import astropy.units as u
 import abc
 import scipy.optimize as opt, scipy.linalg as sl
+import scipy.sparse as sparse
+from astropy import log
 from .residuals import resids
+from .phase import Phase
+from .covariance import ShermanMorrison, weighted_gram
+
+
+def qr_update(R, qtr, M, r):
+    """Add the rows M, with the data r, to an incremental QR decomposition.
+
+    Given the triangular factor R and Q^T r of the rows seen so far (None
+    for no rows), return the ones of all the rows. Q is never formed, so the
+    memory is bounded by the number of new rows.
+    """
+    if R is not None:
+        M = np.vstack((R, M))
+        r = np.concatenate((qtr, r))
+    Q, R = sl.qr(M, mode='economic')
+    return R, np.dot(Q.T, r)
 
 
 class Fitter(object):
@@ -87,6 +105,24 @@ class Fitter(object):
         return self.model.designmatrix(toas=self.toas.table,
                 incfrozen=False, incoffset=True)
 
+    def get_designmatrix_chunks(self, chunk_size):
+        """Yield the design matrix in chunks of chunk_size TOAs, as
+        (start, end, M, params, units, scale_by_F0), where M is the rows
+        start:end of get_designmatrix().
+        """
+        table = self.toas.table
+        ntoas = len(table)
+        chunk_size = int(chunk_size)
+        for st in range(0, ntoas, chunk_size):
+            ed = min(st + chunk_size, ntoas)
+            if st == 0 and ed == ntoas:
+                tbl = table
+            else:
+                tbl = table[st:ed].group_by('obs')
+            M, params, units, scale_by_F0 = self.model.designmatrix(
+                toas=tbl, incfrozen=False, incoffset=True)
+            yield st, ed, M, params, units, scale_by_F0
+
     def minimize_func(self, x, *args):
         """Wrapper function for the residual class, meant to be passed to
         scipy.optimize.minimize. The function must take a single list of input
@@ -132,42 +168,72 @@ class WlsFitter(Fitter):
         super(WlsFitter, self).__init__(toas=toas, model=model)
         self.method = 'weighted_least_square'
 
-    def fit_toas(self, maxiter=1, threshold=False):
-        """Run a linear weighted least-squared fitting method"""
+    def fit_toas(self, maxiter=1, threshold=False, chunk_size=None):
+        """Run a linear weighted least-squared fitting method
+
+        If chunk_size is given, the design matrix is computed in chunks of
+        chunk_size TOAs and added to an incremental QR decomposition (see
+        qr_update()), so only one chunk of the design matrix is in memory.
+        The parameter updates and uncertainties are the same as from the
+        full design matrix.
+        """
         chi2 = 0
         for i in range(maxiter):
             fitp = self.get_fitparams()
             fitpv = self.get_fitparams_num()
             fitperrs = self.get_fitparams_uncertainty()
-            # Define the linear system
-            M, params, units, scale_by_F0 = self.get_designmatrix()
             # Get residuals and TOA uncertainties in seconds
             self.update_resids()
             residuals = self.resids.time_resids.to(u.s).value
             Nvec = self.toas.get_errors().to(u.s).value
-
-            # "Whiten" design matrix and residuals by dividing by uncertainties
-            M = M/Nvec.reshape((-1,1))
-            residuals = residuals / Nvec
-
-            # For each column in design matrix except for col 0 (const. pulse
-            # phase), subtract the mean value, and scale by the column RMS.
-            # This helps avoid numerical problems later.  The scaling factors need
-            # to be saved to recover correct parameter units.
-            # NOTE, We remove subtract mean value here, since it did not give us a
-            # fast converge fitting.
-            # M[:,1:] -= M[:,1:].mean(axis=0)
-            fac = M.std(axis=0)
-            fac[0] = 1.0
-            M /= fac
-
-            # Singular value decomp of design matrix:
-            #   M = U s V^T
-            # Dimensions:
-            #   M, U are Ntoa x Nparam
-            #   s is Nparam x Nparam diagonal matrix encoded as 1-D vector
-            #   V^T is Nparam x Nparam
-            U, s, Vt = sl.svd(M, full_matrices=False)
+            if chunk_size is None:
+                # Define the linear system
+                M, params, units, scale_by_F0 = self.get_designmatrix()
+
+                # "Whiten" design matrix and residuals by dividing by uncertainties
+                M = M/Nvec.reshape((-1,1))
+                residuals = residuals / Nvec
+
+                # For each column in design matrix except for col 0 (const. pulse
+                # phase), subtract the mean value, and scale by the column RMS.
+                # This helps avoid numerical problems later.  The scaling factors need
+                # to be saved to recover correct parameter units.
+                # NOTE, We remove subtract mean value here, since it did not give us a
+                # fast converge fitting.
+                # M[:,1:] -= M[:,1:].mean(axis=0)
+                fac = M.std(axis=0)
+                fac[0] = 1.0
+                M /= fac
+                shape = M.shape
+
+                # Singular value decomp of design matrix:
+                #   M = U s V^T
+                # Dimensions:
+                #   M, U are Ntoa x Nparam
+                #   s is Nparam x Nparam diagonal matrix encoded as 1-D vector
+                #   V^T is Nparam x Nparam
+                U, s, Vt = sl.svd(M, full_matrices=False)
+                utr = np.dot(U.T, residuals)
+            else:
+                # Whitened design matrix M = Q R, accumulated by chunks with
+                # the column sums for the RMS scaling. Then M/fac =
+                # Q (R/fac), so the SVD of R/fac gives s and V of M/fac,
+                # and U^T r = U_R^T Q^T r.
+                R = qtr = None
+                colsum = colsq = 0
+                for st, ed, M, params, units, scale_by_F0 in \
+                        self.get_designmatrix_chunks(chunk_size):
+                    M = M/Nvec[st:ed].reshape((-1,1))
+                    colsum = colsum + M.sum(axis=0)
+                    colsq = colsq + (M**2).sum(axis=0)
+                    R, qtr = qr_update(R, qtr, M,
+                                       residuals[st:ed] / Nvec[st:ed])
+                shape = (len(residuals), R.shape[1])
+                mean = colsum / shape[0]
+                fac = np.sqrt(np.maximum(colsq / shape[0] - mean**2, 0))
+                fac[0] = 1.0
+                U, s, Vt = sl.svd(R / fac, full_matrices=False)
+                utr = np.dot(U.T, qtr)
 
             # Note, here we could do various checks like report
             # matrix condition number or zero out low singular values.
@@ -175,7 +241,7 @@ class WlsFitter(Fitter):
             # Note, Check the threshold from data precision level.Borrowed from
             # np Curve fit.
             if threshold:
-                threshold_val = np.finfo(np.longdouble).eps * max(M.shape) * s[0]
+                threshold_val = np.finfo(np.longdouble).eps * max(shape) * s[0]
                 s[s<threshold_val] = 0.0
             # Sigma = np.dot(Vt.T / s, U.T)
             # The post-fit parameter covariance matrix
@@ -187,7 +253,7 @@ class WlsFitter(Fitter):
             # The delta-parameter values
             #   dpars = V s^-1 U^T r
             # Scaling by fac recovers original units
-            dpars = np.dot(Vt.T, np.dot(U.T,residuals)/s) / fac
+            dpars = np.dot(Vt.T, utr/s) / fac
             for ii, pn in enumerate(fitp.keys()):
                 uind = params.index(pn)             # Index of designmatrix
                 un = 1.0 / (units[uind])     # Unit in designmatrix
@@ -203,6 +269,291 @@ class WlsFitter(Fitter):
 
         return chi2
 
+class IncrementalFitter(WlsFitter):
+    """
+       A weighted least square fitter that is updated with new TOAs without
+       refitting the existing ones.
+
+       The fit is linearized at a copy of the model: the QR factor R and
+       Q^T r of the whitened design matrix and residuals are kept (see
+       qr_update()). The TOAs given to add_toas() are evaluated with the
+       linearization model and added to the factor, so an update with k
+       TOAs costs O(k P^2) for P parameters. The fit is linearized again at
+       the updated model, with all the TOAs, only when a parameter moves
+       by more than tolerance times its uncertainty from the linearization
+       point.
+    """
+    def __init__(self, toas=None, model=None, tolerance=1.0,
+                 chunk_size=None):
+        super(IncrementalFitter, self).__init__(toas=toas, model=model)
+        self.method = 'incremental_least_square'
+        self.tolerance = tolerance
+        self.chunk_size = chunk_size
+        self.model_lin = None
+
+    def fit_toas(self, maxiter=1, threshold=False):
+        """Run a linear weighted least-squared fitting method on all the
+        TOAs, and linearize the fit at the fitted model.
+        """
+        chi2 = super(IncrementalFitter, self).fit_toas(
+            maxiter=maxiter, threshold=threshold, chunk_size=self.chunk_size)
+        self.linearize()
+        return chi2
+
+    def linearize(self):
+        """Factor the whitened design matrix of all the TOAs at the current
+        model, which becomes the linearization model.
+        """
+        self.model_lin = copy.deepcopy(self.model)
+        self.values_lin = self.get_fitparams_num()
+        # The residuals are the pulse phases relative to this reference
+        ph = self.model.phase(self.toas.table)
+        self.phase_ref = Phase(ph.int[0], ph.frac[0]) - \
+            Phase(0.0, self.resids.phase_resids[0])
+        residuals = self.resids.time_resids.to(u.s).value
+        Nvec = self.toas.get_errors().to(u.s).value
+        self.R = self.qtr = None
+        self.colsum = self.colsq = self.rtr = 0
+        self.nrows = 0
+        chunk_size = self.chunk_size or max(len(residuals), 1)
+        for st, ed, M, params, units, scale_by_F0 in \
+                self.get_designmatrix_chunks(chunk_size):
+            self.add_rows(M, residuals[st:ed], Nvec[st:ed])
+        self.params, self.units, self.scale_by_F0 = params, units, scale_by_F0
+
+    def add_rows(self, M, residuals, Nvec):
+        """Add rows of the design matrix and the residuals, in second, with
+        the TOA uncertainties, in second, to the factored normal equations.
+        """
+        M = M/Nvec.reshape((-1,1))
+        residuals = residuals / Nvec
+        self.colsum = self.colsum + M.sum(axis=0)
+        self.colsq = self.colsq + (M**2).sum(axis=0)
+        self.rtr = self.rtr + np.dot(residuals, residuals)
+        self.nrows += len(residuals)
+        self.R, self.qtr = qr_update(self.R, self.qtr, M, residuals)
+
+    def add_toas(self, toas, threshold=False):
+        """Append new TOAs and update the fit.
+
+        The new TOAs are appended to the fitter TOAs (see TOAs.append()).
+        The model parameters and uncertainties are updated, but the
+        residuals are not recomputed unless the fit is linearized again;
+        call update_resids() to get them.
+
+        Parameters
+        ----------
+        toas: TOAs
+            The new TOAs, processed the same way as the fitter TOAs.
+        threshold: bool, optional
+            Zero out the singular values below the precision level, as in
+            WlsFitter.fit_toas().
+
+        Return
+        ----------
+        The linearized chi2 of the updated fit.
+        """
+        if self.model_lin is None:
+            raise ValueError("The fit has to be linearized first; "
+                             "run fit_toas().")
+        t = toas.table
+        M, params, units, scale_by_F0 = self.model_lin.designmatrix(
+            t, incfrozen=False, incoffset=True)
+        if params != self.params:
+            raise ValueError("The free parameters changed since the fit "
+                             "was linearized; run fit_toas().")
+        ph = self.model_lin.phase(t)
+        residuals = (ph - self.phase_ref).frac.value / self.model_lin.F0.value
+        self.add_rows(M, np.asarray(residuals, dtype=np.float64),
+                      toas.get_errors().to(u.s).value)
+        self.toas.append(toas)
+        chi2, dpars, errs = self.solve(threshold)
+        # Parameter moves from the linearization point, in uncertainties
+        moved = np.abs(dpars[1:]) > self.tolerance * errs[1:]
+        if np.any(moved):
+            self.update_resids()
+            self.linearize()
+            chi2 = self.solve(threshold)[0]
+        return chi2
+
+    def solve(self, threshold=False):
+        """Solve the factored normal equations, and set the model parameters
+        and uncertainties.
+
+        Return
+        ----------
+        The linearized chi2, and the parameter changes from the
+        linearization model and their uncertainties, in design matrix units.
+        """
+        # Scale the columns by their RMS, as in WlsFitter.fit_toas()
+        mean = self.colsum / self.nrows
+        fac = np.sqrt(np.maximum(self.colsq / self.nrows - mean**2, 0))
+        fac[0] = 1.0
+        U, s, Vt = sl.svd(self.R / fac, full_matrices=False)
+        if threshold:
+            threshold_val = np.finfo(np.longdouble).eps * \
+                max(self.nrows, len(fac)) * s[0]
+            s[s<threshold_val] = 0.0
+        Sigma = np.dot(Vt.T / (s**2), Vt)
+        errs = np.sqrt(np.diag(Sigma)) / fac
+        dpars = np.dot(Vt.T, np.dot(U.T, self.qtr)/s) / fac
+        # The residual sum of squares, with Q^T r split into its fitted and
+        # unfitted parts
+        qres = self.qtr - np.dot(self.R, dpars)
+        chi2 = self.rtr - np.dot(self.qtr, self.qtr) + np.dot(qres, qres)
+
+        fitp = self.get_fitparams()
+        fitpv = {}
+        fitperrs = {}
+        for pn in fitp.keys():
+            uind = self.params.index(pn)             # Index of designmatrix
+            un = 1.0 / (self.units[uind])     # Unit in designmatrix
+            if self.scale_by_F0:
+                un *= u.s
+            pv = self.values_lin[pn] * fitp[pn].units
+            dpv = dpars[uind] * un
+            fitpv[pn] = np.longdouble((pv+dpv) / fitp[pn].units)
+            fitperrs[pn] = errs[uind]
+        self.set_params(fitpv)
+        self.set_param_uncertainties(fitperrs)
+        return chi2, dpars, errs
+
+
+class LMFitter(Fitter):
+    """
+       A damped Gauss-Newton (Levenberg-Marquardt) weighted least square
+       fitter.
+
+       The step solves (A + lambda diag(A)) dx = M^T W r, with A = M^T W M,
+       and is only accepted if it lowers chi2; lambda is decreased after an
+       accepted step and increased after a rejected one. After an accepted
+       step, the design matrix is updated with the Broyden rank-one formula
+       from the change of the residuals, instead of being computed again.
+       It is computed again when the Broyden matrix gives a poor prediction
+       of the chi2 decrease or a rejected step.
+    """
+    def __init__(self, toas=None, model=None):
+        super(LMFitter, self).__init__(toas=toas, model=model)
+        self.method = 'levenberg_marquardt'
+        self.iterations = []
+
+    def fit_toas(self, maxiter=20, chi2_tol=1e-3, param_tol=1e-3,
+                 lambda_init=1e-3, broyden=True):
+        """Run a damped Gauss-Newton fit until convergence.
+
+        The fit stops after an accepted step that decreases chi2 by less
+        than chi2_tol and changes every parameter by less than param_tol
+        times its uncertainty, or after maxiter steps. The parameter
+        uncertainties are computed from the exact design matrix at the
+        fitted parameters.
+
+        The steps are recorded in self.iterations as dictionaries with the
+        chi2, the damping lambda, whether the step was accepted, the
+        Jacobian used ('exact' or 'broyden') and the wall time in seconds.
+        """
+        fitp = self.get_fitparams()
+        names = list(fitp.keys())
+        self.update_resids()
+        chi2 = float(self.resids.chi2)
+        Nvec = self.toas.get_errors().to(u.s).value
+        lam = lambda_init
+        M = None
+        self.iterations = []
+        for i in range(maxiter):
+            t0 = time.time()
+            if M is None:
+                M, norm, params, units, scale_by_F0 = \
+                    self.whitened_designmatrix(Nvec)
+                jacobian = 'exact'
+            used = jacobian
+            r = self.resids.time_resids.to(u.s).value / Nvec
+            A = np.dot(M.T, M)
+            b = np.dot(M.T, r)
+            dx = sl.solve(A + lam * np.diag(np.diag(A)), b, assume_a='pos')
+            values = self.get_fitparams_num()
+            resids_old = self.resids
+            chi2_new = float(self.minimize_func(
+                list(self.step_values(values, dx / norm, params, units,
+                                      scale_by_F0).values()), *names))
+            # chi2 decrease over the one predicted by the linear model
+            predicted = chi2 - np.sum((r - np.dot(M, dx))**2)
+            small = np.all(np.abs(dx) <= param_tol *
+                           np.sqrt(np.diag(sl.pinvh(A))))
+            accepted = chi2_new < chi2
+            if accepted:
+                rho = (chi2 - chi2_new) / predicted if predicted > 0 else 0
+                converged = chi2 - chi2_new < chi2_tol and small
+                chi2 = chi2_new
+                lam = lam / 10
+                if broyden and rho > 0.25:
+                    r_new = self.resids.time_resids.to(u.s).value / Nvec
+                    M += np.outer((r - r_new) - np.dot(M, dx), dx) / \
+                        np.dot(dx, dx)
+                    jacobian = 'broyden'
+                else:
+                    M = None
+            else:
+                # At the minimum, within the numerical noise of chi2
+                converged = small and predicted < chi2_tol and \
+                    jacobian == 'exact'
+                self.set_params(values)
+                self.resids = resids_old
+                if jacobian == 'exact':
+                    lam = lam * 10
+                else:
+                    # Try again with the exact design matrix first
+                    M = None
+            self.iterations.append({'chi2': chi2, 'lambda': lam,
+                                    'accepted': accepted,
+                                    'jacobian': used,
+                                    'time': time.time() - t0})
+            log.info("LM iteration %d: chi2 %.8g, lambda %.3g, %s, %s "
+                     "Jacobian, %.3f s" % (i, chi2, lam, 'accepted' if
+                     accepted else 'rejected', used,
+                     self.iterations[-1]['time']))
+            if converged:
+                break
+
+        # Uncertainties from the exact design matrix
+        if M is None or jacobian != 'exact':
+            M, norm, params, units, scale_by_F0 = \
+                self.whitened_designmatrix(Nvec)
+        errs = np.sqrt(np.diag(sl.pinvh(np.dot(M.T, M)))) / norm
+        fitperrs = {}
+        for pn in names:
+            fitperrs[pn] = errs[params.index(pn)]
+        self.set_param_uncertainties(fitperrs)
+        return chi2
+
+    def whitened_designmatrix(self, Nvec):
+        """Return the design matrix divided by the TOA uncertainties and
+        normalized by the column norms, the column norms, the parameter
+        names, their units and scale_by_F0.
+        """
+        M, params, units, scale_by_F0 = self.get_designmatrix()
+        M = M / Nvec.reshape((-1,1))
+        norm = np.sqrt(np.sum(M**2, axis=0))
+        if np.any(norm == 0):
+            print("Warning: one or more of the design-matrix columns is null.")
+            norm[norm == 0] = 1
+        return M / norm, norm, params, units, scale_by_F0
+
+    def step_values(self, values, dpars, params, units, scale_by_F0):
+        """Return the fit parameter values changed by dpars, in design
+        matrix units.
+        """
+        fitp = self.get_fitparams()
+        result = {}
+        for pn in fitp.keys():
+            uind = params.index(pn)             # Index of designmatrix
+            un = 1.0 / (units[uind])     # Unit in designmatrix
+            if scale_by_F0:
+                un *= u.s
+            pv, dpv = values[pn] * fitp[pn].units, dpars[uind] * un
+            result[pn] = np.longdouble((pv+dpv) / fitp[pn].units)
+        return result
+
+
 class GLSFitter(Fitter):
     """
        A class for weighted least square fitting method. The design matrix is
@@ -212,53 +563,150 @@ class GLSFitter(Fitter):
         super(GLSFitter, self).__init__(toas=toas, model=model)
         self.method = 'generalized_least_square'
 
-    def fit_toas(self, maxiter=1, threshold=False, full_cov=False):
-        """Run a Generalized least-squared fitting method"""
+    def fit_toas(self, maxiter=1, threshold=False, full_cov=False,
+                 sparse_blocks=False, epoch_blocks=False, woodbury=False,
+                 chunk_size=None):
+        """Run a Generalized least-squared fitting method
+
+        If sparse_blocks is True, the parameters with sparse derivatives
+        (e.g. DMX) are kept in a scipy.sparse design matrix block (see
+        TimingModel.designmatrix_blocks), which is never densified.
+
+        If full_cov is True, the noise bases are not fitted: the normal
+        equations and chi2 are computed with the full noise covariance of
+        the TOAs. It is applied in the structured form of
+        TimingModel.covariance_matrix(structured=True), without the NxN
+        matrix.
+
+        If epoch_blocks is True, the noise given as epoch blocks (ECORR) is
+        not added to the design matrix. It is included in the white noise
+        covariance instead, which is applied epoch by epoch with the
+        Sherman-Morrison formula (see pint.covariance.ShermanMorrison).
+        It has no effect with full_cov, nor if the epochs overlap (e.g. two
+        ECORRs select the same TOAs).
+
+        If woodbury is True, the noise basis coefficients are marginalized
+        instead of fitted along with the timing parameters: the normal
+        equations are formed with the noise covariance from
+        TimingModel.noise_engine(), applied with the Woodbury identity. The
+        white noise and the noise basis projections are cached there
+        between iterations and fits. It has no effect with full_cov.
+
+        If chunk_size is given, the timing design matrix is computed in
+        chunks of chunk_size TOAs, and the normal equations are accumulated
+        chunk by chunk (see normal_equations_chunks()), so only one chunk
+        of the timing design matrix is in memory. The results are the same
+        as without chunks. It has no effect with full_cov, and
+        sparse_blocks has no effect with it.
+        """
         chi2 = 0
         for i in range(maxiter):
             fitp = self.get_fitparams()
             fitpv = self.get_fitparams_num()
             fitperrs = self.get_fitparams_uncertainty()
 
-            # Define the linear system
-            M, params, units, scale_by_F0 = self.get_designmatrix()
-
             # Get residuals and TOA uncertainties in seconds
             self.update_resids()
             residuals = self.resids.time_resids.to(u.s).value
 
             # get any noise design matrices and weight vectors
-            if not full_cov:
-                Mn = self.model.noise_model_designmatrix(self.toas.table)
-                phi = self.model.noise_model_basis_weight(self.toas.table)
-                phiinv = np.zeros(M.shape[1])
-                if Mn is not None and phi is not None:
-                    phiinv = np.concatenate((phiinv, 1/phi))
-                    M = np.hstack((M, Mn))
-
-            # normalize the design matrix
-            norm = np.sqrt(np.sum(M**2, axis=0))
-            ntmpar = len(fitp)
-            if M.shape[1] > ntmpar:
-                norm[ntmpar:] = 1
-            if np.any(norm == 0):
-                print("Warning: one or more of the design-matrix columns is null.")
-            M /= norm
-
-            # compute covariance matrices
+            white = None
+            engine = None
+            Mn = phi = None
             if full_cov:
-                cov = self.model.covariance_matrix(self.toas.table)
-                cf = sl.cho_factor(cov)
-                cm = sl.cho_solve(cf, M)
-                mtcm = np.dot(M.T, cm)
-                mtcy = np.dot(cm.T, residuals)
-
+                # The full noise covariance, in the structured form of
+                # TimingModel.covariance_matrix()
+                engine = self.model.covariance_matrix(self.toas.table,
+                                                      structured=True)
             else:
+                use_blocks = epoch_blocks and \
+                    self.model.epoch_blocks_available(self.toas.table)
+                if woodbury:
+                    engine = self.model.noise_engine(self.toas.table,
+                                                     use_blocks)
+                else:
+                    Mn = self.model.noise_model_designmatrix(
+                        self.toas.table, use_blocks)
+                    phi = self.model.noise_model_basis_weight(
+                        self.toas.table, use_blocks)
                 Nvec = self.model.scaled_sigma(self.toas.table).to(u.s).value**2
                 cinv = 1 / Nvec
-                mtcm = np.dot(M.T, cinv[:,None]*M)
+                if use_blocks and engine is None:
+                    index, jvec = self.model.noise_model_epoch_blocks(
+                        self.toas.table)
+                    white = ShermanMorrison(Nvec, jvec, index)
+
+            if chunk_size is not None and not full_cov:
+                S = None
+                mtcm, mtcy, norm, params, units, scale_by_F0, chi2_func = \
+                    self.normal_equations_chunks(chunk_size, residuals, Nvec,
+                                                 Mn, white, engine)
+                phiinv = np.zeros(len(params))
+                if Mn is not None and phi is not None:
+                    phiinv = np.concatenate((phiinv, 1/phi))
+                mtcm += np.diag(phiinv)
+            else:
+                chi2_func = None
+                # Define the linear system
+                S = None
+                if sparse_blocks:
+                    M, S, params, units, scale_by_F0 = \
+                        self.model.designmatrix_blocks(self.toas.table)
+                    if S.shape[1] == 0:
+                        M = np.hstack((M, S.toarray()))
+                        S = None
+                else:
+                    M, params, units, scale_by_F0 = self.get_designmatrix()
+
+                nsparse = 0 if S is None else S.shape[1]
+                phiinv = np.zeros(M.shape[1] + nsparse)
+                if Mn is not None and phi is not None:
+                    phiinv = np.concatenate((phiinv, 1/phi))
+                    M = np.hstack((M, Mn))
+
+                # normalize the design matrix
+                norm = np.sqrt(np.sum(M**2, axis=0))
+                ntmpar = len(fitp)
+                if S is None:
+                    if M.shape[1] > ntmpar:
+                        norm[ntmpar:] = 1
+                    if np.any(norm == 0):
+                        print("Warning: one or more of the design-matrix columns is null.")
+                    M /= norm
+                else:
+                    # The unknowns are ordered as the dense timing columns, the
+                    # sparse columns, then the noise columns.
+                    ndense = len(params) - S.shape[1]
+                    norm[ndense:] = 1
+                    M /= norm
+                    snorm = np.sqrt(np.asarray(S.multiply(S).sum(axis=0)).ravel())
+                    if np.any(snorm == 0):
+                        print("Warning: one or more of the design-matrix columns is null.")
+                        snorm[snorm == 0] = 1
+                    S = S.dot(sparse.diags(1 / snorm)).tocsc()
+                    norm = np.concatenate((norm[:ndense], snorm, norm[ndense:]))
+
+                # compute covariance matrices
+                if white is None and engine is None and S is None:
+                    mtcm = np.dot(M.T, cinv[:,None]*M)
+                    mtcy = np.dot(M.T, cinv*residuals)
+                else:
+                    if engine is not None:
+                        gram = engine.inner
+                    elif white is not None:
+                        gram = white.inner
+                    else:
+                        gram = lambda bi, bj: weighted_gram(bi, bj, cinv)
+                    if S is None:
+                        blocks = [M]
+                    else:
+                        blocks = [M[:, :ndense], S, M[:, ndense:]]
+                    mtcm = np.vstack([np.hstack([gram(bi, bj)
+                                                 for bj in blocks])
+                                      for bi in blocks])
+                    mtcy = np.concatenate([gram(bi, residuals)
+                                           for bi in blocks])
                 mtcm += np.diag(phiinv)
-                mtcy = np.dot(M.T, cinv*residuals)
 
 
             try:
@@ -269,7 +717,8 @@ class GLSFitter(Fitter):
                 U, s, Vt = sl.svd(mtcm, full_matrices=False)
 
                 if threshold:
-                    threshold_val = np.finfo(np.longdouble).eps * max(M.shape) * s[0]
+                    threshold_val = np.finfo(np.longdouble).eps * \
+                        max(len(residuals), len(mtcy)) * s[0]
                     s[s<threshold_val] = 0.0
 
                 xvar = np.dot(Vt.T / s, Vt)
@@ -277,11 +726,28 @@ class GLSFitter(Fitter):
 
 
             # compute linearized chisq
-            newres = residuals - np.dot(M, xhat)
-            if full_cov:
-                chi2 = np.dot(newres, sl.cho_solve(cf, newres))
+            if chi2_func is not None:
+                chi2 = chi2_func(xhat)
             else:
-                chi2 = np.dot(newres, cinv*newres)
+                if S is None:
+                    newres = residuals - np.dot(M, xhat)
+                else:
+                    nsparse = S.shape[1]
+                    newres = residuals - np.dot(M, np.concatenate(
+                        (xhat[:ndense], xhat[ndense + nsparse:]))) - \
+                        S.dot(xhat[ndense:ndense + nsparse])
+                if full_cov:
+                    chi2 = np.dot(newres, engine.solve(newres))
+                else:
+                    if engine is not None:
+                        # Remove the noise realization, as the fitted noise
+                        # basis coefficients would be
+                        newres = newres - engine.noise_realization(newres)
+                    elif white is not None:
+                        # Remove the epoch offsets, as the ECORR basis
+                        # coefficients would be
+                        newres = newres - white.epoch_offsets(newres)
+                    chi2 = np.dot(newres, cinv*newres)
 
             # compute absolute estimates, normalized errors, covariance matrix
             dpars = xhat/norm
@@ -301,3 +767,93 @@ class GLSFitter(Fitter):
             self.set_param_uncertainties(fitperrs)
 
         return chi2
+
+    def normal_equations_chunks(self, chunk_size, residuals, Nvec, Mn=None,
+                                white=None, engine=None):
+        """Accumulate the GLS normal equations over chunks of chunk_size TOAs.
+
+        The rows of A = [M, Mn, T, r], with the timing design matrix M, the
+        fitted noise basis Mn, the noise basis T of the engine and the
+        residuals r, are added chunk by chunk to G = A^T D^-1 A and
+        E = U^T D^-1 A, where D is the diagonal white noise and U the epoch
+        indicator matrix of the white noise. The white noise covariance
+        N = D + U J U^T and the noise basis T are then applied to G and E
+        with the Sherman-Morrison and the Woodbury formulas. Only M is
+        computed by chunks; Mn, T and r are given for all the TOAs.
+
+        Parameters
+        ----------
+        chunk_size: int
+            The number of TOAs in a chunk.
+        residuals: numpy.ndarray
+            The residuals, in second.
+        Nvec: numpy.ndarray
+            The scaled TOA variances, in s^2.
+        Mn: numpy.ndarray, optional
+            The noise basis fitted along with the timing parameters.
+        white: ShermanMorrison, optional
+            The white noise with epoch blocks. Default is diag(Nvec), or the
+            white noise of the engine.
+        engine: Woodbury, optional
+            The noise covariance whose basis is marginalized.
+
+        Return
+        ----------
+        M^T C^-1 M (without the basis prior), M^T C^-1 r, the column norms
+        of the normalization, the timing parameter names, their units,
+        scale_by_F0, and a function returning the linearized chi2 for the
+        normalized solution.
+        """
+        if engine is not None:
+            white = engine.white
+        if white is None:
+            white = ShermanMorrison(Nvec, np.zeros(0),
+                                    np.zeros(len(Nvec), dtype=int) - 1)
+        extra = [B for B in [Mn, None if engine is None else engine.T]
+                 if B is not None]
+        G = E = colsq = 0
+        for st, ed, M, params, units, scale_by_F0 in \
+                self.get_designmatrix_chunks(chunk_size):
+            colsq = colsq + np.sum(M**2, axis=0)
+            A = np.hstack([M] + [B[st:ed].toarray() if sparse.issparse(B)
+                                 else B[st:ed] for B in extra] +
+                          [residuals[st:ed, None]])
+            DA = white.dinv[st:ed, None] * A
+            G = G + np.dot(A.T, DA)
+            E = E + np.asarray(white.epochs[st:ed].T.dot(DA))
+
+        # normalize the timing columns
+        norm = np.sqrt(colsq)
+        if np.any(norm == 0):
+            print("Warning: one or more of the design-matrix columns is null.")
+        scale = np.ones(G.shape[0])
+        scale[:len(norm)] = 1 / norm
+        G = G * np.outer(scale, scale)
+        E = E * scale
+        nx = len(norm) + (0 if Mn is None else Mn.shape[1])
+        nt = 0 if engine is None else engine.nbasis
+        norm = np.concatenate((norm, np.ones(nx - len(norm))))
+
+        # A^T N^-1 A, then marginalize the engine basis
+        H = G - np.dot(E.T, white.alpha[:, None] * E)
+        mtcm = H[:nx, :nx].copy()
+        mtcy = H[:nx, -1].copy()
+        if nt > 0:
+            HT = H[nx:nx + nt]
+            SiHT = sl.cho_solve(engine.sigma_cf, HT)
+            mtcm -= np.dot(HT[:, :nx].T, SiHT[:, :nx])
+            mtcy -= np.dot(HT[:, :nx].T, SiHT[:, -1])
+
+        def chi2_func(xhat):
+            # The post-fit residuals are A w, less the epoch offsets U o
+            w = np.concatenate((-xhat, np.zeros(nt), [1.0]))
+            if nt > 0:
+                # Remove the noise basis realization, see
+                # Woodbury.noise_realization()
+                w[nx:nx + nt] = -np.dot(SiHT, w)
+            Ew = np.dot(E, w)
+            o = white.alpha * Ew
+            return np.dot(w, np.dot(G, w)) - 2 * np.dot(o, Ew) + \
+                np.dot(o, white.dinv_sum * o)
+
+        return mtcm, mtcy, norm, params, units, scale_by_F0, chi2_func
@@ -1,10 +1,12 @@
 # astrometry.py
 # Defines Astrometry timing model class
 import numpy
+from collections import OrderedDict
 import astropy.coordinates as coords
 import astropy.units as u
 import astropy.constants as const
 from astropy.coordinates.angles import Angle
+from astropy.coordinates.matrix_utilities import rotation_matrix
 from astropy import log
 from . import parameter as p
 from .timing_model import DelayComponent, MissingParameter
@@ -21,6 +23,25 @@ try:
 except ImportError:
     from astropy._erfa import DAYSEC as SECS_PER_DAY
 
+
+def _same_epoch(old, new):
+    """Check if two epoch inputs (None or arrays) are equal."""
+    if old is None or new is None:
+        return old is None and new is None
+    new = numpy.asarray(new)
+    return old.shape == new.shape and old.dtype == new.dtype and \
+        numpy.array_equal(old, new)
+
+
+def _unit_vector(lon, lat):
+    """Cartesian unit vector(s) in the shape of (N, 3), or (3,) for scalar
+    input, from longitude and latitude in radian.
+    """
+    cos_lat = numpy.cos(lat)
+    return numpy.array([cos_lat * numpy.cos(lon), cos_lat * numpy.sin(lon),
+                        numpy.sin(lat)]).transpose()
+
+
 class Astrometry(DelayComponent):
     register = True
     def __init__(self):
@@ -35,6 +56,12 @@ class Astrometry(DelayComponent):
         self.delay_funcs_component += [self.solar_system_geometric_delay,]
         self.category = 'astrometry'
         self.register_deriv_funcs(self.d_delay_astrometry_d_PX, 'PX')
+        # Parameters the pulsar direction depends on, and the cache of the
+        # last direction computed.
+        self.psr_dir_params = ['POSEPOCH']
+        self._psr_dir_cache = None
+        # Longitude, latitude and their proper motions, in that order
+        self.sky_params = []
 
     def setup(self):
         super(Astrometry, self).setup()
@@ -44,9 +71,48 @@ class Astrometry(DelayComponent):
         """Returns unit vector(s) from SSB to pulsar system barycenter under ICRS.
 
         If epochs (MJD) are given, proper motion is included in the calculation.
+
+        The result is cached for the current astrometric parameter values and
+        epochs, so the components evaluated on the same TOAs (geometric delay,
+        Shapiro delay, binary models, ...) share one calculation. The
+        returned array is read-only.
         """
         # TODO: would it be better for this to return a 6-vector (pos, vel)?
-        return self.coords_as_ICRS(epoch=epoch).cartesian.xyz.transpose()
+        key = tuple(getattr(self, p).value for p in self.psr_dir_params)
+        cache = self._psr_dir_cache
+        if cache is not None and cache[0] == key and \
+           _same_epoch(cache[1], epoch):
+            return cache[2]
+        result = self.psr_direction_ICRS(epoch=epoch)
+        result.flags.writeable = False
+        if epoch is not None:
+            epoch = numpy.array(epoch)
+        self._psr_dir_cache = (key, epoch, result)
+        return result
+
+    def psr_direction_ICRS(self, epoch=None):
+        """Compute the unit vector(s) from SSB to the pulsar under ICRS with
+        numpy, applying the proper motion linearly in the angles as
+        get_psr_coords() does. This avoids building astropy coordinates.
+        """
+        lon, lat = self.psr_lonlat(epoch)
+        xyz = _unit_vector(lon, lat)
+        rot = self.frame_rotation()
+        if rot is not None:
+            xyz = numpy.dot(xyz, rot)
+        return xyz * u.Unit('')
+
+    def psr_lonlat(self, epoch=None):
+        """Return the pulsar longitude and latitude in radian, in the frame
+        of the astrometric parameters, at the epochs (MJD) if given.
+        """
+        raise NotImplementedError
+
+    def frame_rotation(self):
+        """Return the rotation matrix from ICRS to the frame of the
+        astrometric parameters, or None for ICRS.
+        """
+        return None
 
     def barycentric_radio_freq(self, toas):
         """Return radio frequencies (MHz) of the toas corrected for Earth motion"""
@@ -61,32 +127,101 @@ class Astrometry(DelayComponent):
         NOTE: currently assumes XYZ location of TOA relative to SSB is
         available as 3-vector toa.xyz, in units of light-seconds.
         """
-        L_hat = self.ssb_to_psb_xyz_ICRS(epoch=toas['tdbld'].astype(numpy.float64))
-        re_dot_L = numpy.sum(toas['ssb_obs_pos']*L_hat, axis=1)
-        delay = -re_dot_L.to(ls).value
-        if self.PX.value != 0.0 \
-           and numpy.count_nonzero(toas['ssb_obs_pos']) > 0:
-            L = ((1.0 / self.PX.value) * u.kpc)
-            # TODO: numpy.sum currently loses units in some cases...
-            re_sqr = numpy.sum(toas['ssb_obs_pos']**2, axis=1) * toas['ssb_obs_pos'].unit**2
-            delay += (0.5 * (re_sqr / L) * (1.0 - re_dot_L**2 / re_sqr)).to(ls).value
-        return delay * u.second
+        return self.astrometric_delay_and_partials(toas)[0]
+
+    def astrometric_delay_and_partials(self, toas, params=()):
+        """Return the solar system geometric delay and its derivatives with
+        respect to a list of astrometric parameters, in one pass over
+        ssb_obs_pos.
+
+        The angle derivatives follow d_delay_astrometry_d_RAJ etc., i.e. the
+        derivatives of the Roemer delay -r.L_hat, with the pulsar direction
+        at the TOA epochs.
+
+        Parameters
+        ----------
+        toas: TOAs table
+            The TOAs the delay is evaluated at.
+        params: list, optional
+            Parameter names from PX and sky_params.
+
+        Return
+        ----------
+        The delay in second and an ordered dictionary maps parameter name to
+        the delay derivative in the unit of second/parameter unit.
+        """
+        epoch = toas['tdbld'].astype(numpy.float64)
+        re = toas['ssb_obs_pos'].quantity.to(ls).value
+        L_hat = self.ssb_to_psb_xyz_ICRS(epoch=epoch).value
+        re_dot_L = numpy.sum(re * L_hat, axis=1)
+        # Square of the distance to the observatory perpendicular to L_hat
+        px_r2 = numpy.sum(re**2, axis=1) - re_dot_L**2
+        delay = -re_dot_L
+        if self.PX.value != 0.0 and numpy.count_nonzero(re) > 0:
+            L = ((1.0 / self.PX.value) * u.kpc).to(ls).value
+            delay = delay + 0.5 * px_r2 / L
+
+        derivs = OrderedDict()
+        sky = [par for par in params if par in self.sky_params]
+        if sky != []:
+            lon, lat = self.psr_lonlat(epoch)
+            rot = self.frame_rotation()
+            re_frame = re if rot is None else numpy.dot(re, rot.T)
+            cos_lat, sin_lat = numpy.cos(lat), numpy.sin(lat)
+            cos_lon, sin_lon = numpy.cos(lon), numpy.sin(lon)
+            # -r.dL_hat/dlon and -r.dL_hat/dlat, in second/radian
+            d_lon = cos_lat * (re_frame[:,0] * sin_lon -
+                               re_frame[:,1] * cos_lon)
+            d_lat = sin_lat * (re_frame[:,0] * cos_lon +
+                               re_frame[:,1] * sin_lon) - \
+                    cos_lat * re_frame[:,2]
+            if any(par in self.sky_params[2:] for par in sky):
+                te = (numpy.asarray(toas['tdbld']) - time_to_longdouble(
+                      self.POSEPOCH.quantity)) * u.day
+                lat0 = getattr(self, self.sky_params[1]).quantity.radian
+            parts = {self.sky_params[0]: lambda: d_lon * u.s / u.rad,
+                     self.sky_params[1]: lambda: d_lat * u.s / u.rad,
+                     self.sky_params[2]: lambda: d_lon * te / numpy.cos(lat0)
+                                                 * u.s / u.rad,
+                     self.sky_params[3]: lambda: d_lat * te * u.s / u.rad}
+        for par in params:
+            if par == 'PX':
+                d = 0.5 * px_r2 / const.au.to(ls).value * u.s / u.rad
+            else:
+                d = parts[par]()
+            derivs[par] = d.to(u.s / getattr(self, par).units,
+                               equivalencies=u.dimensionless_angles())
+        return delay * u.second, derivs
+
+    def d_delay_d_params(self, toas, params, acc_delay=None):
+        """Return the derivatives of the astrometric delay with respect to
+        a group of parameters. The parameters using the default astrometry
+        derivative functions are computed by one
+        astrometric_delay_and_partials call.
+        """
+        astro_pars = [par for par in params
+                      if (par == 'PX' or par in self.sky_params) and
+                      self.deriv_funcs[par] ==
+                      [getattr(self, 'd_delay_astrometry_d_' + par)]]
+        others = [par for par in params if par not in astro_pars]
+        result = self._d_params(toas, others, acc_delay, u.s)
+        if astro_pars != []:
+            result.update(self.astrometric_delay_and_partials(
+                toas, astro_pars)[1])
+        return result
 
     def get_d_delay_quantities(self, toas):
         """Calculate values needed for many d_delay_d_param functions """
         # TODO: Move all these calculations in a separate class for elegance
         rd = dict()
 
-        # TODO: Should delay not have units of u.second?
-        delay = self.delay(toas)
-
         # TODO: toas['tdbld'].quantity should have units of u.day
         # NOTE: Do we need to include the delay here?
         rd['epoch'] = toas['tdbld'].quantity * u.day #- delay * u.second
 
         # Distance from SSB to observatory, and from SSB to psr
         ssb_obs = toas['ssb_obs_pos'].quantity
-        ssb_psr = self.ssb_to_psb_xyz_ICRS(epoch=numpy.array(rd['epoch']))
+        ssb_psr = self.ssb_to_psb_xyz_ICRS(epoch=toas['tdbld'].astype(numpy.float64))
 
         # Cartesian coordinates, and derived quantities
         rd['ssb_obs_r'] = numpy.sqrt(numpy.sum(ssb_obs**2, axis=1))
@@ -165,6 +300,8 @@ class AstrometryEquatorial(Astrometry):
             units="mas/year", value=0.0,
             description="Proper motion in DEC"))
         self.set_special_params(['RAJ', 'DECJ', 'PMRA', 'PMDEC'])
+        self.psr_dir_params += ['RAJ', 'DECJ', 'PMRA', 'PMDEC']
+        self.sky_params = ['RAJ', 'DECJ', 'PMRA', 'PMDEC']
         for param in ['RAJ', 'DECJ', 'PMRA', 'PMDEC']:
             deriv_func_name = 'd_delay_astrometry_d_' + param
             func = getattr(self, deriv_func_name)
@@ -213,6 +350,16 @@ class AstrometryEquatorial(Astrometry):
     def coords_as_ICRS(self, epoch=None):
         return self.get_psr_coords(epoch)
 
+    def psr_lonlat(self, epoch=None):
+        ra = self.RAJ.quantity.to_value(u.rad)
+        dec = self.DECJ.quantity.to_value(u.rad)
+        if epoch is not None and (self.PMRA.value != 0.0 or
+                                  self.PMDEC.value != 0.0):
+            dt = (epoch - self.POSEPOCH.quantity.mjd) * u.d
+            ra = ra + (dt * self.PMRA.quantity / numpy.cos(dec)).to_value(u.rad)
+            dec = dec + (dt * self.PMDEC.quantity).to_value(u.rad)
+        return ra, dec
+
     def get_params_as_ICRS(self):
         result  = {'RAJ': self.RAJ.quantity,
                    'DECJ': self.DECJ.quantity,
@@ -333,6 +480,8 @@ class AstrometryEcliptic(Astrometry):
             description="Obliquity angle value secetion"))
 
         self.set_special_params(['ELONG', 'ELAT', 'PMELONG','PMELAT'])
+        self.psr_dir_params += ['ELONG', 'ELAT', 'PMELONG', 'PMELAT', 'ECL']
+        self.sky_params = ['ELONG', 'ELAT', 'PMELONG', 'PMELAT']
         for param in ['ELAT', 'ELONG', 'PMELAT', 'PMELONG']:
             deriv_func_name = 'd_delay_astrometry_d_' + param
             func = getattr(self, deriv_func_name)
@@ -381,6 +530,26 @@ class AstrometryEcliptic(Astrometry):
         pos_ecl = self.get_psr_coords(epoch=epoch)
         return pos_ecl.transform_to(coords.ICRS)
 
+    def frame_rotation(self):
+        try:
+            obliquity = OBL[self.ECL.value]
+        except KeyError:
+            raise ValueError("No obliquity " + str(self.ECL.value) + " provided. "
+                             "Check your pint/datafile/ecliptic.dat file.")
+        # Same rotation as the ICRS to PulsarEcliptic transformation
+        return numpy.asarray(rotation_matrix(obliquity, 'x'))
+
+    def psr_lonlat(self, epoch=None):
+        elong = self.ELONG.quantity.to_value(u.rad)
+        elat = self.ELAT.quantity.to_value(u.rad)
+        if epoch is not None and (self.PMELONG.value != 0.0 or
+                                  self.PMELAT.value != 0.0):
+            dt = (epoch - self.POSEPOCH.quantity.mjd) * u.d
+            elong = elong + (dt * self.PMELONG.quantity /
+                             numpy.cos(elat)).to_value(u.rad)
+            elat = elat + (dt * self.PMELAT.quantity).to_value(u.rad)
+        return elong, elat
+
     def get_d_delay_quantities_ecliptical(self, toas):
         """Calculate values needed for many d_delay_d_param functions """
         # TODO: Move all these calculations in a separate class for elegance
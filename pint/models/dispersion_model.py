@@ -6,9 +6,9 @@ from . import parameter as p
 from .timing_model import DelayComponent
 import astropy.units as u
 import numpy as np
+import scipy.sparse as sparse
 import pint.utils as ut
 import astropy.time as time
-from ..toa_select import TOASelect
 from ..utils import taylor_horner, split_prefixed_name
 
 # The units on this are not completely correct
@@ -121,6 +121,21 @@ class Dispersion(DelayComponent):
                 result += getattr(self, pm).as_parfile_line()
         return result
 
+    def barycentric_freq_key(self):
+        """Return the values of the parameters that the barycentric radio
+        frequencies depend on, i.e. the parameters of the component that
+        provides barycentric_radio_freq() (the astrometry). The cached
+        derivatives that divide by the frequencies use it in their key.
+        """
+        parent = getattr(self, '_parent', None)
+        if parent is None:
+            return None
+        key = []
+        for cp in parent.components.values():
+            if getattr(type(cp), 'barycentric_radio_freq', None) is not None:
+                key += [(p, str(getattr(cp, p).value)) for p in cp.params]
+        return tuple(key)
+
     def d_delay_d_DMs(self, toas, param_name, acc_delay=None): # NOTE we should have a better name for this.
         """Derivatives for constant DM
         """
@@ -198,49 +213,140 @@ class DispersionDMX(Dispersion):
         # create d_delay_d_dmx functions
         for prefix_par in self.get_params_of_type('prefixParameter'):
             if prefix_par.startswith('DMX_'):
-                self.register_deriv_funcs(self.d_delay_d_DMX, prefix_par)
+                self.register_deriv_funcs(self.d_delay_d_DMX, prefix_par,
+                                          constant=True)
 
-    def dmx_dm(self, toas):
-        condition = {}
-        if not hasattr(self, 'dmx_toas_selector'):
-            self.dmx_toas_selector = TOASelect(is_range=True)
+    @property
+    def sparse_deriv_params(self):
+        """The parameters whose derivatives d_delay_d_params_sparse()
+        provides.
+        """
+        return [par for par in self.deriv_funcs.keys() if
+                par.startswith('DMX_') and
+                self.deriv_funcs[par] == [self.d_delay_d_DMX]]
+
+    def deriv_cache_key(self, param):
+        """The DMX derivatives depend on the range of the DMX bins and,
+        through the barycentric frequencies, on the astrometric parameters.
+        """
+        if param.startswith('DMX_'):
+            dmx_index = getattr(self, param).index
+            DMXR1_mapping = self.get_prefix_mapping_component('DMXR1_')
+            DMXR2_mapping = self.get_prefix_mapping_component('DMXR2_')
+            r1 = getattr(self, DMXR1_mapping[dmx_index]).quantity
+            r2 = getattr(self, DMXR2_mapping[dmx_index]).quantity
+            return ((r1.mjd, r2.mjd), self.barycentric_freq_key())
+        return super(DispersionDMX, self).deriv_cache_key(param)
+
+    def get_dmx_ranges(self):
+        """Return the DMX parameter names and their (DMXR1, DMXR2) ranges in
+        MJD, in the order of the DMX index.
+        """
         DMX_mapping = self.get_prefix_mapping_component('DMX_')
         DMXR1_mapping = self.get_prefix_mapping_component('DMXR1_')
         DMXR2_mapping = self.get_prefix_mapping_component('DMXR2_')
-        for epoch_ind in DMX_mapping.keys():
+        names = []
+        ranges = []
+        for epoch_ind in sorted(DMX_mapping.keys()):
             r1 = getattr(self, DMXR1_mapping[epoch_ind]).quantity
             r2 = getattr(self, DMXR2_mapping[epoch_ind]).quantity
-            condition[DMX_mapping[epoch_ind]] = (r1.mjd, r2.mjd)
-        select_idx = self.dmx_toas_selector.get_select_index(condition, toas['mjd_float'])
-        #Get DMX delays
-        dm = np.zeros(len(toas)) * self.DM.units
-        for k, v in select_idx.items():
-           dm[v] = getattr(self, k).quantity
-        return dm
+            names.append(DMX_mapping[epoch_ind])
+            ranges.append((r1.mjd, r2.mjd))
+        return names, ranges
 
-    def d_delay_d_DMX(self, toas, param_name, acc_delay=None):
-        condition = {}
-        if not hasattr(self, 'dmx_toas_selector'):
-            self.dmx_toas_selector = TOASelect(is_range=True)
-        param = getattr(self, param_name)
-        dmx_index = param.index
-        DMXR1_mapping = self.get_prefix_mapping_component('DMXR1_')
-        DMXR2_mapping = self.get_prefix_mapping_component('DMXR2_')
-        r1 = getattr(self, DMXR1_mapping[dmx_index]).quantity
-        r2 = getattr(self, DMXR2_mapping[dmx_index]).quantity
-        condition = {param_name:(r1.mjd, r2.mjd)}
-        select_idx = self.dmx_toas_selector.get_select_index(condition, toas['mjd_float'])
+    def dmx_bin_index(self, toas):
+        """Return the DMX parameter names and the index of the DMX bin
+        (in the order of the names) of each TOA, -1 for the TOAs outside all
+        the bins.
+
+        The bins are sorted once and each TOA is located with one
+        searchsorted, instead of comparing all the TOAs with every bin. The
+        index is cached until the TOAs or the bin ranges change. If the bins
+        overlap, a TOA is assigned to the last bin (in the index order) that
+        contains it, as dmx_dm() used to do.
+        """
+        names, ranges = self.get_dmx_ranges()
+
+        def compute():
+            mjd = np.asarray(toas['mjd_float'], dtype=np.float64)
+            idx = np.empty(len(mjd), dtype=int)
+            idx.fill(-1)
+            if ranges == []:
+                return idx
+            r1 = np.array([r[0] for r in ranges], dtype=np.float64)
+            r2 = np.array([r[1] for r in ranges], dtype=np.float64)
+            order = np.argsort(r1, kind='mergesort')
+            r1s, r2s = r1[order], r2[order]
+            if np.all(r1s[1:] > r2s[:-1]):
+                pos = np.searchsorted(r1s, mjd, side='right') - 1
+                inside = pos >= 0
+                inside[inside] = mjd[inside] <= r2s[pos[inside]]
+                idx[inside] = order[pos[inside]]
+            else:
+                for ii in range(len(ranges)):
+                    idx[(mjd >= r1[ii]) & (mjd <= r2[ii])] = ii
+            return idx
 
+        idx = self.cached_column(toas, 'dmx_bin_index', tuple(ranges),
+                                 compute)
+        return names, idx
+
+    def dmx_dm(self, toas):
+        names, idx = self.dmx_bin_index(toas)
+        # Get DMX delays by gathering the bin values, the last entry is for
+        # the TOAs outside the bins.
+        values = np.zeros(len(names) + 1)
+        for ii, name in enumerate(names):
+            values[ii] = getattr(self, name).quantity.to(self.DM.units).value
+        return values[idx] * self.DM.units
+
+    def d_delay_d_DMX(self, toas, param_name, acc_delay=None):
+        names, idx = self.dmx_bin_index(toas)
         try:
             bfreq = self.barycentric_radio_freq(toas)
         except AttributeError:
             warn("Using topocentric frequency for dedispersion!")
             bfreq = toas['freq']
-        dmx = np.zeros(len(toas))
-        for k, v in select_idx.items():
-           dmx[v] = 1.0
+        dmx = (idx == names.index(param_name)).astype(float)
         return DMconst * dmx / bfreq**2.0
 
+    def d_delay_d_params_sparse(self, toas, params):
+        """Return the derivatives of the delay with respect to a list of
+        DMX parameters as a sparse matrix.
+
+        Each TOA belongs to at most one DMX bin, so the block has at most one
+        entry per row.
+
+        Parameters
+        ----------
+        toas: TOAs table
+            The TOAs the derivatives are evaluated at.
+        params: list
+            DMX parameter names, from sparse_deriv_params.
+
+        Return
+        ----------
+        A scipy.sparse.csc_matrix in the shape of (number of TOAs,
+        len(params)) with the derivatives in second/(pc cm^-3).
+        """
+        names, idx = self.dmx_bin_index(toas)
+        try:
+            bfreq = self.barycentric_radio_freq(toas)
+        except AttributeError:
+            warn("Using topocentric frequency for dedispersion!")
+            bfreq = toas['freq']
+        col_of_bin = np.empty(len(names) + 1, dtype=int)
+        col_of_bin.fill(-1)
+        for ii, par in enumerate(params):
+            col_of_bin[names.index(par)] = ii
+        cols = col_of_bin[idx]
+        rows = np.where(cols >= 0)[0]
+        unit = u.s / self.DM.units
+        data = (DMconst / u.Quantity(bfreq)**2.0).to(unit).value
+        data = np.asarray(data, dtype=np.float64)[rows]
+        return sparse.csc_matrix((data, (rows, cols[rows])),
+                                 shape=(len(toas), len(params)))
+
     def print_par(self,):
         result = ''
         DMX_mapping = self.get_prefix_mapping_component('DMX_')
@@ -13,6 +13,7 @@ from .timing_model import PhaseComponent, MissingParameter
 from ..phase import *
 from ..utils import time_from_mjd_string, time_to_longdouble, str2longdouble, \
     taylor_horner, split_prefixed_name
+from ..doubledouble import DDArray, tdb_dd
 
 # The maximum number of glitches we allow
 maxglitches = 10  # Have not use this one in the new version.
@@ -21,6 +22,7 @@ maxglitches = 10  # Have not use this one in the new version.
 class Glitch(PhaseComponent):
     """This class provides glitches."""
     register = True
+    thread_safe_derivs = True
     def __init__(self):
         super(Glitch, self).__init__()
 
@@ -102,12 +104,49 @@ class Glitch(PhaseComponent):
                 result += par.as_parfile_line()
         return result
 
+    def glitch_phase_dd(self, toas, delay):
+        """Glitch phase function in double-double arithmetic.
+        returns a DDArray of phases in cycles
+        """
+        tdb = tdb_dd(toas)
+        delay_s = delay.to(u.second).value
+        phs = DDArray(numpy.zeros(len(toas)))
+        glepnames = [x for x in self.params if x.startswith('GLEP_')]
+        with u.set_enabled_equivalencies(dimensionless_cycles):
+            for glepnm in glepnames:
+                glep = getattr(self, glepnm)
+                idx = glep.index
+                dphs = getattr(self, "GLPH_%d" % idx).quantity.to(u.cycle).value
+                dF0 = getattr(self, "GLF0_%d" % idx).quantity.to(u.Hz).value
+                dF1 = getattr(self, "GLF1_%d" % idx).quantity.to(u.Hz/u.s).value
+                dF2 = getattr(self, "GLF2_%d" % idx).quantity.to(
+                    u.Hz/u.s**2).value
+                dt = (tdb - DDArray.from_time(glep.quantity)) * SECS_PER_DAY \
+                    - delay_s
+                affected = dt.hi > 0.0  # TOAs affected by glitch
+                # decay term
+                dF0D = getattr(self, "GLF0D_%d" % idx).quantity
+                if dF0D != 0.0:
+                    tau = getattr(self, "GLTD_%d" % idx).quantity.to(u.s).value
+                    dt_aff = numpy.where(affected, dt.hi, 0.0)
+                    decayterm = dF0D.to(u.Hz).value * tau * \
+                        (1.0 - numpy.exp(- dt_aff / tau))
+                else:
+                    decayterm = 0.0
+                gphs = dt * (dt * (dt * (dF2 / 6.0) + 0.5 * dF1) + dF0) + \
+                    dphs + decayterm
+                phs = phs + gphs * affected.astype(numpy.float64)
+        return phs
+
     def glitch_phase(self, toas, delay):
         """Glitch phase function.
         delay is the time delay from the TOA to time of pulse emission
         at the pulsar, in seconds.
-        returns an array of phases in long double
+        returns an array of phases in long double, or a DDArray if the
+        model phase_backend is 'dd'
         """
+        if getattr(self, 'phase_backend', 'longdouble') == 'dd':
+            return self.glitch_phase_dd(toas, delay)
         phs = numpy.zeros_like(toas, dtype=numpy.longdouble) * u.cycle
         glepnames = [x for x in self.params if x.startswith('GLEP_')]
         with u.set_enabled_equivalencies(dimensionless_cycles):
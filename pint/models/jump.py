@@ -29,7 +29,7 @@ class DelayJump(DelayComponent):
             if mask_par.startswith('JUMP'):
                 self.jumps.append(mask_par)
         for j in self.jumps:
-            self.register_deriv_funcs(self.d_delay_d_jump, j)
+            self.register_deriv_funcs(self.d_delay_d_jump, j, constant=True)
 
     def jump_delay(self, toas, acc_delay=None):
         """This method returns the jump delays for each toas section collected by
@@ -92,11 +92,23 @@ class PhaseJump(PhaseComponent):
             jphase[mask] += jump_par.quantity * self.F0.quantity
         return jphase
 
-    def d_phase_d_jump(self, toas, jump_param, delay):
+    def jump_indicator(self, toas, jump_param):
+        """Return an array which is 1.0 for the TOAs selected by the jump
+        parameter and 0.0 for the others. The array only depends on the TOAs
+        and the jump selection, so it is cached.
+        """
         jpar = getattr(self, jump_param)
-        d_phase_d_j = numpy.zeros(len(toas))
-        mask = jpar.select_toa_mask(toas)
-        d_phase_d_j[mask] = self.F0.value
+
+        def indicator():
+            ind = numpy.zeros(len(toas))
+            ind[jpar.select_toa_mask(toas)] = 1.0
+            return ind
+
+        return self.cached_column(toas, ('indicator', jump_param),
+                                  self.deriv_cache_key(jump_param), indicator)
+
+    def d_phase_d_jump(self, toas, jump_param, delay):
+        d_phase_d_j = self.jump_indicator(toas, jump_param) * self.F0.value
         with u.set_enabled_equivalencies(dimensionless_cycles):
             return (d_phase_d_j * self.F0.units).to(u.cycle/u.second)
 
@@ -3,6 +3,7 @@
 from .timing_model import Component,  MissingParameter
 from . import parameter as p
 import numpy as np
+import scipy.sparse as sparse
 import astropy.units as u
 
 
@@ -12,6 +13,36 @@ class NoiseComponent(Component):
         self.covariance_matrix_funcs = []
         self.scaled_sigma_funcs = []
         self.basis_funcs = []
+        # Functions returning the noise as epoch blocks, (epoch number of
+        # each TOA, variance of each epoch). A component that registers one
+        # describes the same noise as its basis_funcs with it.
+        self.epoch_block_funcs = []
+        # Functions returning the bases of basis_funcs, in the same order,
+        # as scipy.sparse matrices. noise_engine() uses them if given.
+        self.sparse_basis_funcs = []
+
+    def noise_cache_key(self):
+        """Return the parameter values and masks that define the noise of
+        this component, to validate the cached noise matrices.
+        """
+        key = []
+        for pn in self.params:
+            par = getattr(self, pn)
+            key.append((pn, par.value, getattr(par, 'key', None),
+                        str(getattr(par, 'key_value', None))))
+        return tuple(key)
+
+    def basis_cache_key(self):
+        """Return the values that define the noise basis matrix of this
+        component (not the basis weights).
+        """
+        return self.noise_cache_key()
+
+    def epoch_blocks_disjoint(self, toas):
+        """Return True if the epochs of epoch_block_funcs do not overlap, so
+        the noise can be given as epoch blocks.
+        """
+        return True
 
 class ScaleToaError(NoiseComponent):
     """This is a class to correct template fitting timing noise.
@@ -42,6 +73,7 @@ class ScaleToaError(NoiseComponent):
                                                   " the unit of log10(second)."))
         self.covariance_matrix_funcs += [self.sigma_scaled_cov_matrix, ]
         self.scaled_sigma_funcs += [self.scale_sigma, ]
+        self._EF_EQ_pairs = None
 
     def setup(self):
         super(ScaleToaError, self).setup()
@@ -97,31 +129,72 @@ class ScaleToaError(NoiseComponent):
             l  = list(getattr(self, el).values())
             if [x for x in l if l.count(x) > 1] != []:
                 raise ValueError("'%s' have duplicated keys and key values." % el)
+        # The pairing is made at the first use, since a model without
+        # scaled TOA errors does not need to pair up.
+        self._EF_EQ_pairs = None
+
+    def mask_key(self):
+        """Return the masks of the EFACs and EQUADs, to validate the cached
+        pairing and TOA groups.
+        """
+        names = sorted(list(self.EFACs.keys()) + list(self.EQUADs.keys()))
+        return tuple((pn, getattr(self, pn).key,
+                      str(getattr(self, pn).key_value)) for pn in names)
 
     # pairing up EFAC and EQUAD
     def pair_EFAC_EQUAD(self):
+        """Return the (EFAC, EQUAD) parameter pairs with the same mask. The
+        pairing is computed once and kept until a mask changes.
+        """
+        key = self.mask_key()
+        if self._EF_EQ_pairs is not None and self._EF_EQ_pairs[0] == key:
+            return list(self._EF_EQ_pairs[1])
         pairs = []
-        for efac, efac_key in list(self.EFACs.items()):
-            for equad, equad_key in list(self.EQUADs.items()):
-                if efac_key == equad_key:
-                    pairs.append((getattr(self, efac), getattr(self, equad)))
+        for efac in list(self.EFACs.keys()):
+            efac_par = getattr(self, efac)
+            for equad in list(self.EQUADs.keys()):
+                equad_par = getattr(self, equad)
+                if (efac_par.key, efac_par.key_value) == \
+                        (equad_par.key, equad_par.key_value):
+                    pairs.append((efac_par, equad_par))
         if len(pairs) != len(list(self.EFACs.items())):
             # TODO may be define an parameter error would be helpful
             raise ValueError("Can not pair up EFACs and EQUADs, please "
                              " check the EFAC/EQUAD keys and key values.")
-        return pairs
+        self._EF_EQ_pairs = (key, pairs)
+        return list(pairs)
+
+    def toa_pair_index(self, toas):
+        """Return the number of the EFAC/EQUAD pair (in the order of
+        pair_EFAC_EQUAD()) of each TOA, -1 for the TOAs in no mask. A TOA
+        selected by several masks belongs to the last one. The result is
+        cached for the TOA table and the masks.
+        """
+        pairs = self.pair_EFAC_EQUAD()
+
+        def compute():
+            index = np.zeros(len(toas), dtype=int) - 1
+            for ii, (efac, equad) in enumerate(pairs):
+                index[efac.select_toa_mask(toas)] = ii
+            return index
+
+        return self.cached_column(toas, 'efac_equad_index', self.mask_key(),
+                                  compute)
 
     def scale_sigma(self, toas):
         sigma_old = toas['error'].quantity
-        sigma_scaled = np.zeros_like(sigma_old)
+        unit = sigma_old.unit
         EF_EQ_pairs = self.pair_EFAC_EQUAD()
-        for pir in EF_EQ_pairs:
-            efac = pir[0]
-            equad = pir[1]
-            mask = efac.select_toa_mask(toas)
-            sigma_scaled[mask] = efac.quantity * np.sqrt(sigma_old[mask] ** 2 + \
-                                 (equad.quantity)**2)
-        return sigma_scaled
+        index = self.toa_pair_index(toas)
+        # The last entries are for the TOAs in no mask, which get 0.
+        efac = np.zeros(len(EF_EQ_pairs) + 1)
+        equad = np.zeros(len(EF_EQ_pairs) + 1)
+        for ii, (ef, eq) in enumerate(EF_EQ_pairs):
+            efac[ii] = ef.value
+            equad[ii] = eq.quantity.to(unit).value
+        sigma = np.asarray(sigma_old.value, dtype=np.float64)
+        sigma_scaled = efac[index] * np.sqrt(sigma**2 + equad[index]**2)
+        return sigma_scaled * unit
 
     def sigma_scaled_cov_matrix(self, toas):
         scaled_sigma = self.scale_sigma(toas).to(u.s).value**2
@@ -147,6 +220,8 @@ class EcorrNoise(NoiseComponent):
 
         self.covariance_matrix_funcs += [self.ecorr_cov_matrix, ]
         self.basis_funcs += [self.ecorr_basis_weight_pair, ]
+        self.epoch_block_funcs += [self.ecorr_epoch_block, ]
+        self.sparse_basis_funcs += [self.ecorr_basis_sparse, ]
 
     def setup(self):
         super(EcorrNoise, self).setup()
@@ -171,6 +246,87 @@ class EcorrNoise(NoiseComponent):
             ecorrs.append(getattr(self, ecorr))
         return ecorrs
 
+    def ecorr_epochs(self, toas):
+        """Return the observing epochs of the ECORR parameters in index form.
+
+        The epochs of each ECORR, in the order of get_ecorrs(), are numbered
+        one after another. The result is cached for the TOA table and the
+        ECORR mask definitions.
+
+        Return
+        ------
+        A (3, M) integer array. The rows are the TOA indices, the epoch
+        numbers of these TOAs, and the number of the ECORR parameter the
+        epoch belongs to. The TOAs in no epoch are not listed.
+        """
+        ecorrs = self.get_ecorrs()
+
+        def compute():
+            t = (toas['tdbld'].quantity * u.day).to(u.s).value
+            result = [np.zeros((3, 0), dtype=int)]
+            nctot = 0
+            for ii, ec in enumerate(ecorrs):
+                mask = np.asarray(ec.select_toa_mask(toas), dtype=int)
+                idx, nn = quantization_index(t[mask])
+                use = idx >= 0
+                result.append(np.array([mask[use], idx[use] + nctot,
+                                        np.zeros(use.sum(), dtype=int) + ii]))
+                nctot += nn
+            return np.hstack(result)
+
+        return self.cached_column(toas, 'ecorr_epochs',
+                                  self._ecorr_masks_key(), compute)
+
+    def _ecorr_masks_key(self):
+        return tuple((ec.key, str(ec.key_value)) for ec in self.get_ecorrs())
+
+    def epoch_blocks_disjoint(self, toas):
+        """Return True if no TOA is in the epochs of more than one ECORR.
+        Otherwise the ECORR noise can not be given as epoch blocks, and it
+        is kept as a basis.
+        """
+        def compute():
+            epochs = self.ecorr_epochs(toas)
+            return np.array(len(np.unique(epochs[0])) == epochs.shape[1])
+        return bool(self.cached_column(toas, 'ecorr_disjoint',
+                                       self._ecorr_masks_key(), compute))
+
+    def ecorr_weight(self, epochs):
+        """Return the ECORR weight (ECORR value squared, in s^2) of each
+        epoch, from ecorr_epochs().
+        """
+        ecorrs = self.get_ecorrs()
+        values = np.array([ec.quantity.to(u.s).value ** 2 for ec in ecorrs])
+        nc = epochs[1].max() + 1 if epochs.shape[1] > 0 else 0
+        weight = np.zeros(nc)
+        weight[epochs[1]] = values[epochs[2]]
+        return weight
+
+    def ecorr_epoch_block(self, toas):
+        """Return the epoch number of each TOA (-1 for the TOAs in no
+        epoch) and the ECORR weights, for the Sherman-Morrison solver.
+        """
+        epochs = self.ecorr_epochs(toas)
+        weight = self.ecorr_weight(epochs)
+        if not self.epoch_blocks_disjoint(toas):
+            raise ValueError("TOAs selected by more than one ECORR can not "
+                             "be treated as epoch blocks.")
+        index = np.empty(len(toas), dtype=int)
+        index.fill(-1)
+        index[epochs[0]] = epochs[1]
+        return (index, weight)
+
+    def ecorr_basis_sparse(self, toas):
+        """Return the quantization matrix as a scipy.sparse.csc_matrix and
+        the ECORR weights. It has one entry per TOA in an epoch.
+        """
+        epochs = self.ecorr_epochs(toas)
+        weight = self.ecorr_weight(epochs)
+        U = sparse.csc_matrix((np.ones(epochs.shape[1]),
+                               (epochs[0], epochs[1])),
+                              shape=(len(toas), len(weight)))
+        return (U, weight)
+
     def ecorr_basis_weight_pair(self, toas):
         """Return a quantization matrix and ECORR weights.
 
@@ -178,28 +334,16 @@ class EcorrNoise(NoiseComponent):
         The weights used are the square of the ECORR values.
 
         """
-        t = (toas['tdbld'].quantity * u.day).to(u.s).value
-        ecorrs = self.get_ecorrs()
-        Umats = []
-        for ec in ecorrs:
-            mask = ec.select_toa_mask(toas)
-            Umats.append(create_quantization_matrix(t[mask]))
-        nc = np.sum(U.shape[1] for U in Umats)
-        Umat = np.zeros((len(t), nc))
-        weight = np.zeros(nc)
-        nctot = 0
-        for ct, ec in enumerate(ecorrs):
-            mask = ec.select_toa_mask(toas)
-            nn = Umats[ct].shape[1]
-            Umat[mask, nctot:nn+nctot] = Umats[ct]
-            weight[nctot:nn+nctot] = ec.quantity.to(u.s).value ** 2
-            nctot += nn
+        epochs = self.ecorr_epochs(toas)
+        weight = self.ecorr_weight(epochs)
+        Umat = np.zeros((len(toas), len(weight)))
+        Umat[epochs[0], epochs[1]] = 1
         return (Umat, weight)
 
     def ecorr_cov_matrix(self, toas):
         """Full ECORR covariance matrix."""
-        U, Jvec = self.ecorr_basis_weight_pair(toas)
-        return np.dot(U * Jvec[None,:], U.T)
+        U, Jvec = self.ecorr_basis_sparse(toas)
+        return (U.dot(sparse.diags(Jvec)).dot(U.T)).toarray()
 
 
 class PLRedNoise(NoiseComponent):
@@ -262,38 +406,88 @@ class PLRedNoise(NoiseComponent):
 
         t = (toas['tdbld'].quantity * u.day).to(u.s).value
         amp, gam, nf = self.get_pl_vals()
-        Fmat, f = create_fourier_design_matrix(t, nf)
+        # The basis only depends on the TOAs and the number of frequencies
+        Fmat = self.cached_column(toas, 'fourier_basis', nf,
+                                  lambda: create_fourier_design_matrix(t, nf)[0])
+        f = fourier_frequencies(t, nf)
         weight = powerlaw(f, amp, gam) * f[0]
         return (Fmat, weight)
 
+    def basis_cache_key(self):
+        return (self.get_pl_vals()[2],)
+
     def pl_rn_cov_matrix(self, toas):
         Fmat, phi = self.pl_rn_basis_weight_pair(toas)
         return np.dot(Fmat * phi[None,:], Fmat.T)
 
 
-def create_quantization_matrix(toas, dt=1, nmin=2):
-    """Create quantization matrix mapping TOAs to observing epochs."""
-    isort = np.argsort(toas)
-
-    bucket_ref = [toas[isort[0]]]
-    bucket_ind = [[isort[0]]]
-
-    for i in isort[1:]:
-        if toas[i] - bucket_ref[-1] < dt:
-            bucket_ind[-1].append(i)
-        else:
-            bucket_ref.append(toas[i])
-            bucket_ind.append([i])
-
-    # find only epochs with more than 1 TOA
-    bucket_ind2 = [ind for ind in bucket_ind if len(ind) >= nmin]
+def quantization_index(toas, dt=1, nmin=2):
+    """Group TOAs into observing epochs.
+
+    An epoch starts at the first TOA (in time order) that is at least dt
+    after the first TOA of the previous epoch. The TOAs are sorted once and
+    split at the gaps of at least dt; only the groups longer than dt are
+    split further.
+
+    Parameters
+    ----------
+    toas: numpy.ndarray
+        The TOA times.
+    dt: float
+        The epoch length, in the unit of toas.
+    nmin: int
+        The minimum number of TOAs in an epoch.
+
+    Return
+    ------
+    An integer array with the epoch number of each TOA, in time order of
+    the epochs, -1 for the TOAs in the epochs with fewer than nmin TOAs,
+    and the number of epochs.
+    """
+    toas = np.asarray(toas)
+    ntoa = len(toas)
+    index = np.empty(ntoa, dtype=int)
+    index.fill(-1)
+    if ntoa == 0:
+        return index, 0
+    isort = np.argsort(toas, kind='mergesort')
+    ts = toas[isort]
+    starts = np.concatenate(([0], np.nonzero(np.diff(ts) >= dt)[0] + 1))
+    ends = np.append(starts[1:], ntoa)
+    extra = []
+    for lo, hi in zip(starts, ends):
+        if ts[hi - 1] - ts[lo] < dt:
+            continue
+        while True:
+            nxt = np.searchsorted(ts[lo:hi], ts[lo] + dt) + lo
+            # Follow the comparison with the epoch reference exactly
+            while nxt < hi and ts[nxt] - ts[lo] < dt:
+                nxt += 1
+            while nxt - 1 > lo and ts[nxt - 1] - ts[lo] >= dt:
+                nxt -= 1
+            if nxt >= hi:
+                break
+            extra.append(nxt)
+            lo = nxt
+    if extra != []:
+        starts = np.union1d(starts, extra)
+    sizes = np.diff(np.append(starts, ntoa))
+    keep = sizes >= nmin
+    number = np.cumsum(keep) - 1
+    number[~keep] = -1
+    index[isort] = np.repeat(number, sizes)
+    return index, int(keep.sum())
 
-    U = np.zeros((len(toas),len(bucket_ind2)),'d')
-    for i,l in enumerate(bucket_ind2):
-        U[l,i] = 1
 
+def create_quantization_matrix(toas, dt=1, nmin=2):
+    """Create quantization matrix mapping TOAs to observing epochs."""
+    index, nepoch = quantization_index(toas, dt, nmin)
+    U = np.zeros((len(toas), nepoch), 'd')
+    use = index >= 0
+    U[np.nonzero(use)[0], index[use]] = 1
     return U
 
+
 def create_fourier_design_matrix(t, nmodes, Tspan=None):
     """
     Construct fourier design matrix from eq 11 of Lentati et al, 2013
@@ -308,6 +502,22 @@ def create_fourier_design_matrix(t, nmodes, Tspan=None):
     N = len(t)
     F = np.zeros((N, 2 * nmodes))
 
+    Ffreqs = fourier_frequencies(t, nmodes, Tspan)
+    f = Ffreqs[0::2]
+
+    F[:,::2] = np.sin(2*np.pi*t[:,None]*f[None,:])
+    F[:,1::2] = np.cos(2*np.pi*t[:,None]*f[None,:])
+
+    return F, Ffreqs
+
+def fourier_frequencies(t, nmodes, Tspan=None):
+    """Return the sampling frequencies of the fourier design matrix, each
+    one repeated for the sine and cosine columns.
+
+    :param t: vector of time series in seconds
+    :param nmodes: number of fourier coefficients to use
+    :param Tspan: option to some other Tspan
+    """
     if Tspan is not None:
         T = Tspan
     else:
@@ -318,11 +528,7 @@ def create_fourier_design_matrix(t, nmodes, Tspan=None):
     Ffreqs = np.zeros(2 * nmodes)
     Ffreqs[0::2] = f
     Ffreqs[1::2] = f
-
-    F[:,::2] = np.sin(2*np.pi*t[:,None]*f[None,:])
-    F[:,1::2] = np.cos(2*np.pi*t[:,None]*f[None,:])
-
-    return F, Ffreqs
+    return Ffreqs
 
 def powerlaw(f, A=1e-16, gamma=5):
     """Power-law PSD.
@@ -76,6 +76,9 @@ class PulsarBinary(DelayComponent):
 
         self.interal_params = []
         self.warn_default_params = ['ECC', 'OM']
+        # Evaluation options of the binary model object, see use_dual and
+        # use_phase_table
+        self._binary_options = {'use_dual': False, 'use_phase_table': False}
         # Set up delay function
         self.delay_funcs_component += [self.binarymodel_delay,]
 
@@ -85,6 +88,51 @@ class PulsarBinary(DelayComponent):
             self.register_deriv_funcs(self.d_binary_delay_d_xxxx, bpar)
         # Setup the model isinstance
         self.binary_instance = self.binary_model_class()
+        for name, value in self._binary_options.items():
+            self._set_binary_option(name, value)
+
+    def _set_binary_option(self, name, value):
+        value = bool(value)
+        instance = getattr(self, 'binary_instance', None)
+        if instance is None:
+            instance = self.binary_model_class()
+        if value:
+            if name == 'use_dual' and not instance.has_dual_delay:
+                raise ValueError("The %s binary model does not have dual "
+                                 "number derivatives." % self.binary_model_name)
+            if name == 'use_phase_table' and \
+                    not hasattr(instance, 'tabulated_delay'):
+                raise ValueError("The %s binary model does not have an orbital "
+                                 "phase table." % self.binary_model_name)
+        self._binary_options[name] = value
+        if getattr(self, 'binary_instance', None) is not None:
+            setattr(self.binary_instance, name, value)
+
+    @property
+    def use_dual(self):
+        """If True, the binary delay derivatives of binary_delay_and_jacobian()
+        (and so of the design matrix) are computed with dual numbers in one
+        evaluation of the delay. Setting it raises a ValueError if the binary
+        model has no dual number delay.
+        """
+        return self._binary_options['use_dual']
+
+    @use_dual.setter
+    def use_dual(self, value):
+        self._set_binary_option('use_dual', value)
+
+    @property
+    def use_phase_table(self):
+        """If True, the binary delay is interpolated from an orbital phase
+        table when the model allows it (see ELL1BaseModel.tabulated_delay).
+        Setting it raises a ValueError if the binary model has no phase table
+        (only the ELL1 type models have one).
+        """
+        return self._binary_options['use_phase_table']
+
+    @use_phase_table.setter
+    def use_phase_table(self, value):
+        self._set_binary_option('use_phase_table', value)
 
     # With new parameter class set up, do we need this?
     def apply_units(self):
@@ -151,6 +199,49 @@ class PulsarBinary(DelayComponent):
         self.update_binary_object(toas, acc_delay)
         return self.binary_instance.d_binarydelay_d_par(param)
 
+    def binary_delay_and_jacobian(self, toas, params=None, acc_delay=None):
+        """Return the binary delay and its derivatives respect to a list of
+        parameters, updating the binary object only once.
+
+        Parameters
+        ----------
+        toas: TOAs table
+            The TOAs the delay is evaluated at.
+        params: list, optional
+            Parameter names. Default is all the free parameters of this
+            component.
+        acc_delay: numpy.ndarray, optional
+            The accumulated delay up to the binary model. If not provided,
+            it will be computed.
+
+        Return
+        ----------
+        The binary delay in second and an ordered dictionary maps parameter
+        name to the delay derivative in the unit of second/parameter unit.
+        """
+        if params is None:
+            params = [p for p in self.params if not getattr(self, p).frozen]
+        self.update_binary_object(toas, acc_delay)
+        delay, jac = self.binary_instance.binary_delay_and_jacobian(params)
+        for p in params:
+            unit = u.s / getattr(self, p).units
+            jac[p] = jac[p].to(unit, equivalencies=u.dimensionless_angles())
+        return delay, jac
+
+    def d_delay_d_params(self, toas, params, acc_delay=None):
+        """Return the derivatives of the binary delay with respect to a
+        group of parameters from one binary_delay_and_jacobian call.
+        """
+        binary_pars = [p for p in params
+                       if self.deriv_funcs[p] == [self.d_binary_delay_d_xxxx]]
+        others = [p for p in params if p not in binary_pars]
+        result = self._d_params(toas, others, acc_delay, u.s)
+        if binary_pars != []:
+            jac = self.binary_delay_and_jacobian(toas, binary_pars,
+                                                 acc_delay)[1]
+            result.update(jac)
+        return result
+
     def print_par(self,):
         result = "BINARY {0}\n".format(self.binary_model_name)
         for p in self.params:
@@ -31,6 +31,8 @@ class SolarSystemShapiro(DelayComponent):
                     "saturn": Tsaturn.value,
                     "uranus": Turanus.value,
                     "neptune": Tneptune.value}
+    # The planets included when PLANET_SHAPIRO is set
+    _planets = ('jupiter', 'saturn', 'venus', 'uranus')
 
     @staticmethod
     def ss_obj_shapiro_delay(obj_pos, psr_dir, T_obj):
@@ -54,12 +56,46 @@ class SolarSystemShapiro(DelayComponent):
         # Tempo2 uses the postion vector sign differently between the sun and planets
         return -2.0 * T_obj * numpy.log((r-rcostheta)/const.au).value
 
+    @staticmethod
+    def ss_objs_shapiro_delay(obj_pos, psr_dir, T_obj):
+        """
+        ss_objs_shapiro_delay(obj_pos, psr_dir, T_obj)
+
+        returns the total Shapiro delay in seconds for a set of solar system
+        objects, computed for all of them at once.
+
+        Inputs:
+          obj_pos : (nbody, N, 3) array of position vectors from Earth to
+                    the objects, in km
+          psr_dir : (N, 3) array of unit vectors in direction of pulsar
+          T_obj : (nbody,) array of masses of the objects in seconds
+                  (GM/c^3)
+        """
+        r = numpy.sqrt(numpy.sum(obj_pos**2, axis=2))
+        rcostheta = numpy.einsum('bij,ij->bi', obj_pos, psr_dir)
+        au = const.au.to(u.km).value
+        return -2.0 * numpy.dot(T_obj, numpy.log((r - rcostheta) / au))
+
+    def shapiro_bodies(self):
+        """Return the solar system objects included in the Shapiro delay.
+        The Sun is always included, the planets only if PLANET_SHAPIRO is
+        set.
+        """
+        if self.PLANET_SHAPIRO.value:
+            return ('sun',) + self._planets
+        return ('sun',)
+
     def solar_system_shapiro_delay(self, toas, acc_delay=None):
         """
         Returns total shapiro delay to due solar system objects.
         If the PLANET_SHAPIRO model param is set to True then
         planets are included, otherwise only the value for the
-        Sun is calculated.
+        Sun is calculated, and the planet columns are not read.
+
+        All the objects and TOAs are computed at once, from a stacked
+        (nbody, N, 3) position array and one evaluation of the pulsar
+        direction for the whole table (shared with the astrometric delay
+        through the ssb_to_psb_xyz_ICRS cache).
 
         Requires Astrometry or similar model that provides the
         ssb_to_psb_xyz method for direction to pulsar.
@@ -67,20 +103,30 @@ class SolarSystemShapiro(DelayComponent):
         If planets are to be included, TOAs.compute_posvels() must
         have been called with the planets=True argument.
         """
-        # Start out with 0 delay with units of seconds
+        bodies = self.shapiro_bodies()
+        cols = ['obs_' + b + '_pos' for b in bodies]
+        missing = [c for c in cols if c not in toas.colnames]
+        if missing != []:
+            raise ValueError("TOAs have no %s column(s). Planet positions "
+                             "are only computed by TOAs.compute_posvels() "
+                             "with planets=True." % ', '.join(missing))
+        obs = numpy.char.lower(numpy.asarray(toas['obs']).astype(str))
+        bary = obs == 'barycenter'
+        if numpy.any(bary):
+            log.info("Skipping Shapiro delay for Barycentric TOAs")
         delay = numpy.zeros(len(toas))
-        for ii, key in enumerate(toas.groups.keys):
-            grp = toas.groups[ii]
-            obs = toas.groups.keys[ii]['obs']
-            loind, hiind = toas.groups.indices[ii:ii+2]
-            if key['obs'].lower() == 'barycenter':
-                log.info("Skipping Shapiro delay for Barycentric TOAs")
-                continue
-            psr_dir = self.ssb_to_psb_xyz_ICRS(epoch=grp['tdbld'].astype(numpy.float64))
-            delay[loind:hiind] += self.ss_obj_shapiro_delay(grp['obs_sun_pos'],
-                                    psr_dir, self._ss_mass_sec['sun'])
-            if self.PLANET_SHAPIRO.value:
-                for pl in ('jupiter', 'saturn', 'venus', 'uranus'):
-                    delay[loind:hiind] += self.ss_obj_shapiro_delay(grp['obs_'+pl+'_pos'],
-                                                   psr_dir, self._ss_mass_sec[pl])
+        if numpy.all(bary):
+            return delay * u.second
+        psr_dir = self.ssb_to_psb_xyz_ICRS(
+            epoch=toas['tdbld'].astype(numpy.float64)).value
+        obj_pos = numpy.empty((len(bodies), len(toas), 3))
+        for ii, c in enumerate(cols):
+            obj_pos[ii] = toas[c].quantity.to(u.km).value
+        T_obj = numpy.array([self._ss_mass_sec[b] for b in bodies])
+        if numpy.any(bary):
+            use = ~bary
+            delay[use] = self.ss_objs_shapiro_delay(obj_pos[:, use],
+                                                    psr_dir[use], T_obj)
+        else:
+            delay = self.ss_objs_shapiro_delay(obj_pos, psr_dir, T_obj)
         return delay * u.second
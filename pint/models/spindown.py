@@ -13,12 +13,14 @@ from .timing_model import PhaseComponent, MissingParameter
 from ..phase import *
 from ..utils import time_from_mjd_string, time_to_longdouble, str2longdouble,\
     taylor_horner, time_from_longdouble, split_prefixed_name, taylor_horner_deriv
+from ..doubledouble import DDArray, dd_taylor_horner, tdb_dd
 from pint import dimensionless_cycles
 
 
 class Spindown(PhaseComponent):
     """This class provides a simple timing model for an isolated pulsar."""
     register = True
+    thread_safe_derivs = True
     def __init__(self):
         super(Spindown, self).__init__()
         self.add_param(p.floatParameter(name="F0", value=0.0, units="Hz",
@@ -101,6 +103,31 @@ class Spindown(PhaseComponent):
         dt_pepoch = (time_to_longdouble(self.PEPOCH.value) - self.TZRMJDld) * u.day
         return dt_tzrmjd, dt_pepoch
 
+    def get_dt_dd(self, toas, delay):
+        """Return dt from the phase 0 epoch and from PEPOCH, same as
+        get_dt(), as double-double arrays in seconds.
+        """
+        if self.TZRMJD.value is None:
+            self.TZRMJD.value = toas['tdb'][0] - delay[0]
+        tzrmjd = DDArray.from_time(self.TZRMJD.quantity)
+        pepoch = DDArray.from_time(self.PEPOCH.quantity)
+        dt_tzrmjd = (tdb_dd(toas) - tzrmjd) * SECS_PER_DAY - \
+            delay.to(u.second).value
+        dt_pepoch = (pepoch - tzrmjd) * SECS_PER_DAY
+        return dt_tzrmjd, dt_pepoch
+
+    def spindown_phase_dd(self, toas, delay):
+        """Spindown phase function in double-double arithmetic.
+
+        returns a DDArray of phases in cycles
+        """
+        dt_tzrmjd, dt_pepoch = self.get_dt_dd(toas, delay)
+        fterms = [0.0] + [f.to(u.Hz/u.s**ii).value for ii, f in
+                          enumerate(self.get_spin_terms())]
+        phs_tzrmjd = dd_taylor_horner(dt_tzrmjd - dt_pepoch, fterms)
+        phs_pepoch = dd_taylor_horner(-dt_pepoch, fterms)
+        return phs_tzrmjd - phs_pepoch
+
     def spindown_phase(self, toas, delay):
         """Spindown phase function.
 
@@ -109,8 +136,11 @@ class Spindown(PhaseComponent):
 
         This routine should implement Eq 120 of the Tempo2 Paper II (2006, MNRAS 372, 1549)
 
-        returns an array of phases in long double
+        returns an array of phases in long double, or a DDArray if the
+        model phase_backend is 'dd'
         """
+        if getattr(self, 'phase_backend', 'longdouble') == 'dd':
+            return self.spindown_phase_dd(toas, delay)
         dt_tzrmjd, dt_pepoch = self.get_dt(toas, delay)
         # Add the [0.0] because that is the constant phase term
         fterms = [0.0 * u.cycle] + self.get_spin_terms()
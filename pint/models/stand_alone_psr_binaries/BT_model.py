@@ -1,4 +1,4 @@
-from .binary_generic import PSR_BINARY
+from .binary_generic import PSR_BINARY, cache_result
 import numpy as np
 import astropy.units as u
 import astropy.constants as c
@@ -82,11 +82,13 @@ class BTmodel(PSR_BINARY):
         self.set_param_values() # Set parameters to default values.
         self.binary_delay_funcs = [self.BTdelay]
         self.d_binarydelay_d_par_funcs = [self.d_BTdelay_d_par]
+        self.dual_delay_func = self.BTdelay_dual
         if t is not None:
             self.t = t
         if input_params is not None:
             self.update_input(param_dict=input_params)
 
+    @cache_result
     def delayL1(self):
         """First term of Blandford & Teukolsky (1976), ApJ, 205,
         580-591, eq 2.33/ First left-hand term of W.M. Smart, (1962),
@@ -98,6 +100,7 @@ class BTmodel(PSR_BINARY):
         """
         return self.a1()/c.c*np.sin(self.omega())*(np.cos(self.E())-self.ecc())
 
+    @cache_result
     def delayL2(self):
         """Second term of Blandford & Teukolsky (1976), ApJ, 205,
         580-591, eq 2.33/ / Second left-hand term of W.M. Smart, (1962),
@@ -111,6 +114,7 @@ class BTmodel(PSR_BINARY):
         return (a1*np.cos(self.omega())*\
                 np.sqrt(1-self.ecc()**2)+self.GAMMA)*np.sin(self.E())
 
+    @cache_result
     def delayR(self):
         """Third term of Blandford & Teukolsky (1976), ApJ, 205,
         580-591, eq 2.33 / Right-hand term of W.M. Smart, (1962),
@@ -138,6 +142,24 @@ class BTmodel(PSR_BINARY):
         """Full BT model delay"""
         return (self.delayL1() + self.delayL2()) * self.delayR()
 
+    def BTdelay_dual(self, pv):
+        """Full BT model delay evaluated on dual numbers (see
+        PSR_BINARY.binary_delay_and_jacobian_dual), in second.
+        """
+        a1 = self.dual_a1(pv)
+        omega = self.dual_omega(pv)
+        ecc = self.dual_ecc(pv)
+        E = self.dual_E(pv)
+        sinE, cosE = np.sin(E), np.cos(E)
+        sqrt1Me2 = np.sqrt(1 - ecc**2)
+        delayL1 = a1 * np.sin(omega) * (cosE - ecc)
+        delayL2 = (a1 * np.cos(omega) * sqrt1Me2 + pv.GAMMA) * sinE
+        num = a1 * np.cos(omega) * sqrt1Me2 * cosE - \
+              a1 * np.sin(omega) * sinE
+        den = 1.0 - ecc * cosE
+        delayR = 1.0 - 2 * np.pi * num / (den * pv.PB)
+        return (delayL1 + delayL2) * delayR
+
 
 
     # NOTE: Below, OMEGA is supposed to be in RADIANS!
@@ -1,4 +1,5 @@
 from .DD_model import DDmodel
+from .binary_generic import cache_result, cache_dual
 import numpy as np
 import astropy.units as u
 import astropy.constants as c
@@ -33,6 +34,9 @@ class DDKmodel(DDmodel):
         # Remove unused parameter SINI
         del self.param_default_value['SINI']
         self.set_param_values()
+        self.dual_units.update({'KIN': u.rad, 'KOM': u.rad, 'PX': u.mas,
+                                'PMRA_DDK': u.rad/u.s,
+                                'PMDEC_DDK': u.rad/u.s})
 
     @property
     def KOM(self):
@@ -112,6 +116,7 @@ class DDKmodel(DDmodel):
                   self.PMDEC_DDK * self.cos_KOM) * self.tt0
         return d_KIN.to(self.KIN.unit)
 
+    @cache_result
     def kin(self):
         if self.K96:
             return self.KIN + self.delta_kin_proper_motion()
@@ -435,9 +440,10 @@ class DDKmodel(DDmodel):
         mask = [proper_motion, parallax]
         for ii, cf in enumerate(corr_funs):
             if mask[ii]:
-                a1 += cf()
+                a1 = a1 + cf()
         return a1
 
+    @cache_result
     def a1(self):
         if self.K96:
             return self.a1_k()
@@ -453,7 +459,7 @@ class DDKmodel(DDmodel):
                     ko_func = getattr(self, ko_func_name[ii] + par)
                 except:
                     ko_func = lambda : np.zeros(len(self.tt0)) * result.unit
-                result += ko_func()
+                result = result + ko_func()
         return result
 
     def d_a1_d_par(self, par):
@@ -477,9 +483,10 @@ class DDKmodel(DDmodel):
         mask = [proper_motion, parallax]
         for ii, cf in enumerate(corr_funs):
             if mask[ii]:
-                omega += cf()
+                omega = omega + cf()
         return omega
 
+    @cache_result
     def omega(self):
         if self.K96:
             return self.omega_k()
@@ -495,7 +502,7 @@ class DDKmodel(DDmodel):
                     ko_func = getattr(self, ko_func_name[ii] + par)
                 except:
                     ko_func = lambda : np.zeros(len(self.tt0)) * result.unit
-                result += ko_func()
+                result = result + ko_func()
         return result
 
     def d_omega_d_par(self, par):
@@ -503,3 +510,52 @@ class DDKmodel(DDmodel):
             return self.d_omega_k_d_par(par)
         else:
             return self.d_omega_k_d_par(par, proper_motion=False)
+
+    # Dual number (forward-mode automatic differentiation) versions of the
+    # Kopeikin corrections, see PSR_BINARY.binary_delay_and_jacobian_dual.
+    @cache_dual
+    def dual_kin(self, pv):
+        if self.K96:
+            return pv.KIN + (-pv.PMRA_DDK * np.sin(pv.KOM) +
+                             pv.PMDEC_DDK * np.cos(pv.KOM)) * pv.tt0
+        else:
+            return pv.KIN
+
+    def dual_sini(self, pv):
+        return np.sin(self.dual_kin(pv))
+
+    @cache_dual
+    def dual_parallax_projections(self, pv):
+        """delta_I0 and delta_J0 divided by the pulsar distance.
+        """
+        kpc_ls = (1.0 * u.kpc).to(ls).value
+        I0 = self.delta_I0().to(ls).value
+        J0 = self.delta_J0().to(ls).value
+        return I0 * pv.PX / kpc_ls, J0 * pv.PX / kpc_ls
+
+    @cache_dual
+    def dual_a1(self, pv):
+        """Same as a1(), in light-second.
+        """
+        a1 = super(DDKmodel, self).dual_a1(pv)
+        kin = self.dual_kin(pv)
+        tan_kin = np.tan(kin)
+        sin_KOM, cos_KOM = np.sin(pv.KOM), np.cos(pv.KOM)
+        if self.K96:
+            d_kin = (-pv.PMRA_DDK * sin_KOM + pv.PMDEC_DDK * cos_KOM) * pv.tt0
+            a1 = a1 + a1 * d_kin / tan_kin
+        I0, J0 = self.dual_parallax_projections(pv)
+        return a1 + a1 / tan_kin * (I0 * sin_KOM - J0 * cos_KOM)
+
+    @cache_dual
+    def dual_omega(self, pv):
+        """Same as omega(), in radian.
+        """
+        omega = super(DDKmodel, self).dual_omega(pv)
+        sin_kin = np.sin(self.dual_kin(pv))
+        sin_KOM, cos_KOM = np.sin(pv.KOM), np.cos(pv.KOM)
+        if self.K96:
+            omega = omega + 1.0 / sin_kin * (pv.PMRA_DDK * cos_KOM +
+                                             pv.PMDEC_DDK * sin_KOM) * pv.tt0
+        I0, J0 = self.dual_parallax_projections(pv)
+        return omega - 1.0 / sin_kin * (I0 * cos_KOM + J0 * sin_KOM)
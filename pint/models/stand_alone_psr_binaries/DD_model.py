@@ -1,4 +1,4 @@
-from .binary_generic import PSR_BINARY
+from .binary_generic import PSR_BINARY, cache_result, cache_dual
 import numpy as np
 import astropy.units as u
 import astropy.constants as c
@@ -43,6 +43,9 @@ class DDmodel(PSR_BINARY):
         self.set_param_values() # Set parameters to default values.
         self.binary_delay_funcs = [self.DDdelay]
         self.d_binarydelay_d_par_funcs = [self.d_DDdelay_d_par]
+        self.dual_delay_func = self.DDdelay_dual
+        self.dual_units.update({'A0': u.s, 'B0': u.s, 'DR': u.Unit(''),
+                                'DTH': u.Unit('')})
         if t is not None:
             self.t = t
         if input_params is not None:
@@ -50,6 +53,7 @@ class DDmodel(PSR_BINARY):
     # calculations for delays in DD model
 
     # DDmodel special omega.
+    @cache_result
     def omega(self):
         """T. Damour and N. Deruelle(1986)equation [25]
            omega = OM+nu*k
@@ -125,6 +129,7 @@ class DDmodel(PSR_BINARY):
 
     ############################################################
     # Calculate er
+    @cache_result
     def er(self):
         return self.ecc()+self.DR
 
@@ -148,6 +153,7 @@ class DDmodel(PSR_BINARY):
                 return np.longdouble(np.zeros(len(self.tt0)))* u.Unit("") / par_obj.unit
 
     ##########
+    @cache_result
     def eTheta(self):
         return self.ecc()+self.DTH
 
@@ -170,6 +176,7 @@ class DDmodel(PSR_BINARY):
             else:
                 return np.longdouble(np.zeros(len(self.tt0))) * u.Unit("") / par_obj.unit
     ##########
+    @cache_result
     def alpha(self):
         """Alpha defined in
            T. Damour and N. Deruelle(1986)equation [46]
@@ -219,6 +226,7 @@ class DDmodel(PSR_BINARY):
     #     return self.tt0/c.c*sinOmg
     ##############################################
 
+    @cache_result
     def beta(self):
         """Beta defined in
            T. Damour and N. Deruelle(1986)equation [47]
@@ -336,6 +344,7 @@ class DDmodel(PSR_BINARY):
         return self.a1()/c.c*(-eTheta)/np.sqrt(1-eTheta**2)*cosOmg
 
     ##################################################
+    @cache_result
     def Dre(self):
         """Dre defined in
            T. Damour and N. Deruelle(1986)equation [48]
@@ -376,6 +385,7 @@ class DDmodel(PSR_BINARY):
             return (term1 + term2 + term3 +term4).to(Dre.unit/par_obj.unit)
 
     #################################################
+    @cache_result
     def Drep(self):
         """Dervitive of Dre respect to E
            T. Damour and N. Deruelle(1986)equation [49]
@@ -410,6 +420,7 @@ class DDmodel(PSR_BINARY):
             return (term1+term2+term3).to(Drep.unit/par_obj.unit)
 
     #################################################
+    @cache_result
     def Drepp(self):
         """Dervitive of Drep respect to E
            T. Damour and N. Deruelle(1986)equation [50]
@@ -444,6 +455,7 @@ class DDmodel(PSR_BINARY):
             return (term1+term2+term3).to(Drepp.unit/par_obj.unit)
     #################################################
 
+    @cache_result
     def nhat(self):
         """nhat defined as
            T. Damour and N. Deruelle(1986)equation [51]
@@ -473,6 +485,7 @@ class DDmodel(PSR_BINARY):
                     self.ecc()*sinE*self.prtl_der('E',par))/oneMeccTcosE)
 
     #################################################
+    @cache_result
     def delayInverse(self):
         """DD model Inverse timing delay.
         T. Damour and N. Deruelle(1986)equation [46-52]
@@ -540,6 +553,7 @@ class DDmodel(PSR_BINARY):
                    dnhat_dpar*diDelay_dnhat
 
     #################################################
+    @cache_result
     def delayS(self):
         """Binary shapiro delay
            T. Damour and N. Deruelle(1986)equation [26]
@@ -587,6 +601,7 @@ class DDmodel(PSR_BINARY):
                    dSINI_dpar*dsDelay_dSINI
 
     #################################################
+    @cache_result
     def delayE(self):
         """Binary Einstein delay
             T. Damour and N. Deruelle(1986)equation [25]
@@ -605,6 +620,7 @@ class DDmodel(PSR_BINARY):
         return sE*self.prtl_der('GAMMA',par)+self.GAMMA*cE*self.prtl_der('E',par)
     #################################################
 
+    @cache_result
     def delayA(self):
         """Binary Abberation delay
             T. Damour and N. Deruelle(1986)equation [27]
@@ -655,6 +671,52 @@ class DDmodel(PSR_BINARY):
         """Full DD model delay"""
         return self.delayInverse()+self.delayS()+self.delayA()
 
+    # Dual number (forward-mode automatic differentiation) version of the
+    # DD delay, see PSR_BINARY.binary_delay_and_jacobian_dual.
+    @cache_dual
+    def dual_omega(self, pv):
+        """DD omega = OM + nu * k, k = OMDOT / n
+        """
+        k = pv.OMDOT * pv.PB / (2 * np.pi)
+        return pv.OM + self.dual_nu(pv) * k
+
+    def dual_sini(self, pv):
+        return pv.SINI
+
+    def DDdelay_dual(self, pv):
+        """DD delay evaluated on dual numbers. The same formulas as
+        delayInverse(), delayS() and delayA(), with all the quantities in
+        second and radian (a1 in light-second).
+        """
+        ecc = self.dual_ecc(pv)
+        E = self.dual_E(pv)
+        nu = self.dual_nu(pv)
+        omega = self.dual_omega(pv)
+        a1 = self.dual_a1(pv)
+        sinE, cosE = np.sin(E), np.cos(E)
+        sinOmg, cosOmg = np.sin(omega), np.cos(omega)
+        er = ecc + pv.DR
+        eTheta = ecc + pv.DTH
+        alpha = a1 * sinOmg
+        beta = a1 * np.sqrt(1 - eTheta**2) * cosOmg
+        Dre = alpha * (cosE - er) + (beta + pv.GAMMA) * sinE
+        Drep = -alpha * sinE + (beta + pv.GAMMA) * cosE
+        Drepp = -alpha * cosE - (beta + pv.GAMMA) * sinE
+        oneMeccTcosE = 1 - ecc * cosE
+        nHat = 2.0 * np.pi / pv.PB / oneMeccTcosE
+        delayI = Dre * (1 - nHat * Drep + (nHat * Drep)**2 +
+                        1.0/2 * nHat**2 * Dre * Drepp -
+                        1.0/2 * ecc * sinE / oneMeccTcosE * nHat**2 * Dre *
+                        Drep)
+        TM2 = pv.M2 * Tsun.to(u.s).value
+        delayS = -2 * TM2 * np.log(oneMeccTcosE - self.dual_sini(pv) *
+                                   (sinOmg * (cosE - ecc) +
+                                    np.sqrt(1 - ecc**2) * cosOmg * sinE))
+        omgPlusAe = omega + nu
+        delayA = pv.A0 * (np.sin(omgPlusAe) + ecc * sinOmg) + \
+                 pv.B0 * (np.cos(omgPlusAe) + ecc * cosOmg)
+        return delayI + delayS + delayA
+
     def d_DDdelay_d_par(self,par):
         """Full DD model delay derivtive
         """
@@ -1,5 +1,5 @@
 # This Python file uses the following encoding: utf-8
-from .ELL1_model import ELL1BaseModel
+from .ELL1_model import ELL1BaseModel, harmonic_bound
 import numpy as np
 import astropy.units as u
 import astropy.constants as c
@@ -42,6 +42,8 @@ class ELL1Hmodel(ELL1BaseModel):
                              self.delayS_H3_STIGMA_exact,
                              self.delayS3p_H3_STIGMA_exact]
         self.ds_func = self.delayS3p_H3_STIGMA_approximate
+        self.dual_delay_func = self.ELL1Hdelay_dual
+        self.dual_units.update({'H3': u.s, 'H4': u.s, 'STIGMA': u.Unit('')})
 
     def delayS(self):
         if set(self.fit_params) == set(['H3', 'H4']):
@@ -57,8 +59,83 @@ class ELL1Hmodel(ELL1BaseModel):
 
     def ELL1Hdelay(self):
         # TODO need aberration
+        if self.use_phase_table:
+            delay = self.tabulated_delay()
+            if delay is not None:
+                return delay
         return self.delayI() + self.delayS()
 
+    def phase_table_shapiro(self):
+        """Shapiro delay shape per second of H3 for the orbital phase table,
+        using the dual version of the selected ds_func.
+        """
+        if set(self.fit_params) == set(['H3', 'H4']):
+            stigma = self.H4/self.H3
+        elif set(self.fit_params) == set(['H3', 'STIGMA']):
+            stigma = self.STIGMA
+        elif set(self.fit_params) == set(['H3']):
+            stigma = 0.0
+        else:
+            raise NotImplementedError("ELL1H did not implemented %s parameter"
+                                      " set yet." % str(self.fit_params))
+        stigma = float(getattr(stigma, 'value', stigma))
+        nharms = int(getattr(self.NHARMS, 'value', self.NHARMS))
+        name = self.ds_func.__name__
+        if name == 'delayS3p_H3_STIGMA_approximate':
+            m4 = 4 * harmonic_bound(stigma, 3, nharms)
+        elif name == 'delayS3p_H3_STIGMA_exact':
+            m4 = 4 * harmonic_bound(stigma, 3)
+        else:
+            m4 = 4 * harmonic_bound(stigma, 1)
+        ds_func = getattr(self, name + '_dual')
+        shape = lambda Phi: ds_func(1.0, stigma, Phi, nharms)
+        return shape, m4, self.H3.to_value(u.s), (stigma, name, nharms)
+
+    def ELL1Hdelay_dual(self, pv):
+        """ELL1H delay evaluated on dual numbers (see
+        PSR_BINARY.binary_delay_and_jacobian_dual), in second. The Shapiro
+        delay uses the dual version of the selected ds_func.
+        """
+        if set(self.fit_params) == set(['H3', 'H4']):
+            stigma = pv.H4 / pv.H3
+        elif set(self.fit_params) == set(['H3', 'STIGMA']):
+            stigma = pv.STIGMA
+        elif set(self.fit_params) == set(['H3']):
+            stigma = 0.0
+        else:
+            raise NotImplementedError("ELL1H did not implemented %s parameter"
+                                      " set yet." % str(self.fit_params))
+        ds_func = getattr(self, self.ds_func.__name__ + '_dual')
+        ds = ds_func(pv.H3, stigma, self.dual_Phi(pv), int(pv.NHARMS))
+        return self.dual_delayI(pv) + ds
+
+    def delayS3p_H3_STIGMA_approximate_dual(self, H3, stigma, Phi,
+                                            end_harm=6):
+        """Dual number version of delayS3p_H3_STIGMA_approximate.
+        """
+        sum_fharms = 0.0
+        for k in range(3, end_harm + 1):
+            pwr, basis_func = self._ELL1H_fourier_basis(k)
+            # stigma is factored out to the power of 3
+            coeff = (-1) ** pwr * 2.0 / k
+            if k > 3:
+                coeff = coeff * stigma ** (k - 3)
+            sum_fharms = sum_fharms + coeff * basis_func(k * Phi)
+        return -2.0 * H3 * sum_fharms
+
+    def delayS3p_H3_STIGMA_exact_dual(self, H3, stigma, Phi, end_harm=None):
+        """Dual number version of delayS3p_H3_STIGMA_exact.
+        """
+        lognum = 1 + stigma ** 2 - 2 * stigma * np.sin(Phi)
+        return -2 * H3 / stigma ** 3 * (np.log(lognum) +
+               2 * stigma * np.sin(Phi) - stigma * stigma * np.cos(2 * Phi))
+
+    def delayS_H3_STIGMA_exact_dual(self, H3, stigma, Phi, end_harm=None):
+        """Dual number version of delayS_H3_STIGMA_exact.
+        """
+        lognum = 1 + stigma ** 2 - 2 * stigma * np.sin(Phi)
+        return -2 * H3 / stigma ** 3 * np.log(lognum)
+
     def get_SINI_from_STIGMA(self):
         return 2 * self.STIGMA / (1 + self.STIGMA ** 2)
 
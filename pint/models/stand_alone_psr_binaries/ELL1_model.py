@@ -1,8 +1,87 @@
-from .binary_generic import PSR_BINARY
+from .binary_generic import PSR_BINARY, cache_result, cache_dual
 import numpy as np
 import astropy.units as u
 import astropy.constants as c
 from pint import ls,GMsun,Tsun
+from pint.dual import Dual
+
+
+def harmonic_bound(sigma, kmin, kmax=None):
+    """Return sum(k**3 * sigma**(k - 3)) for k from kmin to kmax.
+
+    This bounds the fourth derivative of a Fourier series in the orbital
+    phase whose k-th harmonic has an amplitude of sigma**(k - 3) / k, e.g.
+    the ELL1H Shapiro delay series (P. Freire and N. Wex 2010 Eq (10)).
+    kmax = None sums the whole series.
+    """
+    sigma = abs(float(sigma))
+    if sigma == 0.0:
+        if kmin < 3:
+            return np.inf
+        return 27.0 if kmin == 3 and (kmax is None or kmax >= 3) else 0.0
+    if kmax is None:
+        if sigma >= 1.0:
+            return np.inf
+        if sigma > 0.5:
+            total = sigma * (1 + 4 * sigma + sigma ** 2) / (1 - sigma) ** 4
+            head = np.arange(1, kmin)
+            return (total - np.sum(head ** 3 * sigma ** head)) / sigma ** 3
+        # The terms after k = kmin + 80 are below 1e-18 of the first one.
+        kmax = kmin + 80
+    k = np.arange(kmin, kmax + 1, dtype=float)
+    return np.sum(k ** 3 * sigma ** (k - 3))
+
+
+class OrbitalPhaseTable(object):
+    """A cubic Hermite interpolation table of periodic functions of the
+    orbital phase on a uniform grid over [0, 2*pi].
+
+    The interpolation error of a function f is less than
+    step**4 / 384 * max|f''''|.
+
+    Parameters
+    ----------
+    values: numpy.ndarray
+        The functions at the nodes, in the shape of (number of functions,
+        number of intervals + 1).
+    derivs: numpy.ndarray
+        The derivatives of the functions respect to the phase at the nodes,
+        in the same shape as values.
+    key: tuple
+        The parameters the tabulated functions depend on.
+    """
+    def __init__(self, values, derivs, key):
+        self.values = np.asarray(values, dtype=np.float64)
+        self.derivs = np.asarray(derivs, dtype=np.float64)
+        self.key = key
+        self.size = self.values.shape[1] - 1
+        self.step = 2 * np.pi / self.size
+        self.error_factor = self.step ** 4 / 384.0
+
+    def evaluate(self, phase):
+        """Interpolate the tabulated functions at the phases in radian.
+
+        Return
+        ----------
+        An array in the shape of (number of functions, len(phase)).
+        """
+        x = np.mod(np.asarray(phase, dtype=np.float64), 2 * np.pi) / self.step
+        idx = np.minimum(np.floor(x).astype(int), self.size - 1)
+        t = x - idx
+        t2 = t * t
+        t3 = t2 * t
+        h00 = 2 * t3 - 3 * t2 + 1
+        h01 = 3 * t2 - 2 * t3
+        h10 = (t3 - 2 * t2 + t) * self.step
+        h11 = (t3 - t2) * self.step
+        result = np.empty((len(self.values), len(x)))
+        for ii in range(len(self.values)):
+            v = self.values[ii]
+            d = self.derivs[ii]
+            result[ii] = h00 * v[idx] + h01 * v[idx + 1] + \
+                         h10 * d[idx] + h11 * d[idx + 1]
+        return result
+
 
 class ELL1BaseModel(PSR_BINARY):
     """This is a class for base ELL1 pulsar binary model.
@@ -22,7 +101,17 @@ class ELL1BaseModel(PSR_BINARY):
         self.set_param_values() # Set parameters to default values.
         self.ELL1_interVars = ['eps1', 'eps2', 'Phi', 'Dre', 'Drep', 'Drepp', 'nhat']
         self.add_inter_vars(self.ELL1_interVars)
-
+        self.dual_units.update({'EPS1': u.Unit(''), 'EPS2': u.Unit(''),
+                                'EPS1DOT': 1/u.s, 'EPS2DOT': 1/u.s})
+        self.dual_epochs['TASC'] = 'ttasc'
+        # Tabulated binary delay, see tabulated_delay(). It is switched on
+        # through PulsarBinary.use_phase_table.
+        self.use_phase_table = False
+        self.phase_table_tol = 1e-9 * u.s
+        self.phase_table_max_size = 2 ** 20
+        self.phase_table = None
+
+    @cache_result
     def ttasc(self):
         """
         ttasc = t - TASC
@@ -33,6 +122,7 @@ class ELL1BaseModel(PSR_BINARY):
         ttasc = (t - self.TASC).to('second')
         return ttasc
 
+    @cache_result
     def a1(self):
         """ELL1 model a1 calculation. This method overrides the a1() method in
         pulsar_binary.py. Instead of tt0, it uses ttasc.
@@ -50,6 +140,7 @@ class ELL1BaseModel(PSR_BINARY):
     def d_a1_d_A1DOT(self):
         return self.ttasc()
 
+    @cache_result
     def eps1(self):
         return self.EPS1 + self.ttasc() * self.EPS1DOT
 
@@ -64,6 +155,7 @@ class ELL1BaseModel(PSR_BINARY):
     def d_eps1_d_EPS1DOT(self):
         return self.ttasc()
 
+    @cache_result
     def eps2(self):
         return self.EPS2 + self.ttasc() * self.EPS2DOT
 
@@ -79,6 +171,7 @@ class ELL1BaseModel(PSR_BINARY):
         return self.ttasc()
 
     # TODO Duplicate code. Do we need change here.
+    @cache_result
     def Phi(self):
         """Orbit phase in ELL1 model. Using TASC
         """
@@ -132,6 +225,7 @@ class ELL1BaseModel(PSR_BINARY):
                d_Dre_d_Phi * d_Phi_d_par + d_Dre_d_eps1 * self.prtl_der('eps1', par) + \
                d_Dre_d_eps2 * self.prtl_der('eps2', par)
 
+    @cache_result
     def Drep(self):
         """ dDre/dPhi
         """
@@ -164,6 +258,7 @@ class ELL1BaseModel(PSR_BINARY):
                d_Drep_d_Phi * d_Phi_d_par + d_Drep_d_eps1 * self.prtl_der('eps1', par) + \
                d_Drep_d_eps2 * self.prtl_der('eps2', par)
 
+    @cache_result
     def Drepp(self):
         a1 = self.a1()
         eps1 = self.eps1()
@@ -193,6 +288,7 @@ class ELL1BaseModel(PSR_BINARY):
                d_Drepp_d_eps1 * self.prtl_der('eps1', par) + \
                d_Drepp_d_eps2 * self.prtl_der('eps2', par)
 
+    @cache_result
     def delayR(self):
         """ELL1 Roemer delay in proper time. Ch. Lange,1 F. Camilo, 2001 eq. A6
         """
@@ -200,6 +296,7 @@ class ELL1BaseModel(PSR_BINARY):
         return (self.a1()/c.c*(np.sin(Phi) + 0.5 * (self.eps2() * np.sin(2*Phi)
                           - self.eps1() * np.cos(2*Phi)))).decompose()
 
+    @cache_result
     def delayI(self):
         """Inverse time delay formular. The treatment is similar to the one
         in DD model(T. Damour and N. Deruelle(1986)equation [46-52])
@@ -221,6 +318,7 @@ class ELL1BaseModel(PSR_BINARY):
         nhat = 2*np.pi/self.PB
         return (Dre*(1 - nhat*Drep + (nhat*Drep)**2 + 1.0/2*nhat**2*Dre*Drepp)).decompose()
 
+    @cache_result
     def nhat(self):
         return 2*np.pi/self.PB
 
@@ -251,6 +349,134 @@ class ELL1BaseModel(PSR_BINARY):
         return d_delayI_d_Dre * d_Dre_d_par + d_delayI_d_Drep * d_Drep_d_par + \
                d_delayI_d_Drepp * d_Drepp_d_par + d_delayI_d_nhat * d_nhat_d_par
 
+    # Dual number (forward-mode automatic differentiation) versions, see
+    # PSR_BINARY.binary_delay_and_jacobian_dual.
+    @cache_dual
+    def dual_a1(self, pv):
+        return pv.A1 + pv.ttasc * pv.A1DOT
+
+    @cache_dual
+    def dual_eps1(self, pv):
+        return pv.EPS1 + pv.ttasc * pv.EPS1DOT
+
+    @cache_dual
+    def dual_eps2(self, pv):
+        return pv.EPS2 + pv.ttasc * pv.EPS2DOT
+
+    @cache_dual
+    def dual_Phi(self, pv):
+        tp = pv.ttasc / pv.PB
+        orbits = tp - 0.5 * pv.PBDOT * tp**2
+        return (orbits - np.floor(orbits)) * 2 * np.pi
+
+    def dual_delayI(self, pv):
+        """Same as delayI(), in second.
+        """
+        a1 = self.dual_a1(pv)
+        eps1 = self.dual_eps1(pv)
+        eps2 = self.dual_eps2(pv)
+        Phi = self.dual_Phi(pv)
+        sinPhi, cosPhi = np.sin(Phi), np.cos(Phi)
+        sin2Phi, cos2Phi = np.sin(2 * Phi), np.cos(2 * Phi)
+        Dre = a1 * (sinPhi + 0.5 * (eps2 * sin2Phi - eps1 * cos2Phi))
+        Drep = a1 * (cosPhi + eps1 * sin2Phi + eps2 * cos2Phi)
+        Drepp = a1 * (-sinPhi + 2.0 * (eps1 * cos2Phi - eps2 * sin2Phi))
+        nhat = 2 * np.pi / pv.PB
+        return Dre * (1 - nhat * Drep + (nhat * Drep)**2 +
+                      1.0/2 * nhat**2 * Dre * Drepp)
+
+    # Tabulated delay for long event lists.
+    def phase_table_shapiro(self):
+        """Return the Shapiro delay as scale * shape(Phi).
+
+        Return
+        ----------
+        The shape function (it has to accept a Dual phase), the bound of the
+        fourth derivative of the shape, the scale in second and a tuple of
+        the parameters the shape depends on.
+        """
+        raise NotImplementedError("Shapiro delay table is not implemented "
+                                  "for %s." % self.binary_name)
+
+    def get_phase_table(self):
+        """Return the orbital phase table for the current parameters, or
+        None if the delay can not be tabulated.
+
+        The table holds the Roemer delay and its first two derivatives per
+        light second of a1 and the Shapiro delay shape as functions of the
+        orbital phase. It only depends on EPS1, EPS2 and the Shapiro shape
+        parameters, so it is rebuilt when one of those changes or when the
+        error bound for the current A1, PB and Shapiro scale exceeds
+        phase_table_tol. Changing PB, TASC, PBDOT, A1 or A1DOT alone does not
+        rebuild it.
+        """
+        if self.EPS1DOT.value != 0.0 or self.EPS2DOT.value != 0.0:
+            return None
+        eps1 = float(self.EPS1.value)
+        eps2 = float(self.EPS2.value)
+        shape, m4_shapiro, scale, shapiro_key = self.phase_table_shapiro()
+        key = (eps1, eps2) + shapiro_key
+        a1 = np.abs((self.a1() / c.c).to_value(u.s)).max()
+        nhat = (2 * np.pi / self.PB).to_value(1 / u.s)
+        eps = abs(eps1) + abs(eps2)
+        # Propagate the interpolation error of Dre, Drep and Drepp through
+        # delayI, plus the Shapiro delay error. The propagation is linear in
+        # the interpolation errors, and harmonic_bound() drops the harmonics
+        # past kmin + 80; the safety factor of 2 covers the neglected
+        # terms, which are smaller by a factor of order nhat * tol.
+        x = nhat * a1 * (1 + 2 * eps)
+        m4 = 2 * (a1 * ((1 + 8 * eps) * (1 + x + 2 * x ** 2) +
+                        (1 + 16 * eps) * x * (1 + 2 * x) +
+                        (1 + 32 * eps) * 0.5 * x ** 2) +
+                  abs(scale) * m4_shapiro)
+        tol = self.phase_table_tol.to_value(u.s)
+        table = self.phase_table
+        if table is not None and table.key == key and \
+           table.error_factor * m4 <= tol:
+            table.error_bound = table.error_factor * m4 * u.s
+            return table
+        if not np.isfinite(m4):
+            return None
+        # Build with half of the tolerance, so small changes of the scale
+        # parameters do not trigger a rebuild.
+        step = (384 * 0.5 * tol / max(m4, 1e-300)) ** 0.25
+        size = max(int(np.ceil(2 * np.pi / step)), 64)
+        if size > self.phase_table_max_size:
+            return None
+        Phi = Dual(np.linspace(0, 2 * np.pi, size + 1), np.ones(1))
+        sinPhi, cosPhi = np.sin(Phi), np.cos(Phi)
+        sin2Phi, cos2Phi = np.sin(2 * Phi), np.cos(2 * Phi)
+        funcs = [sinPhi + 0.5 * (eps2 * sin2Phi - eps1 * cos2Phi),
+                 cosPhi + eps1 * sin2Phi + eps2 * cos2Phi,
+                 -sinPhi + 2.0 * (eps1 * cos2Phi - eps2 * sin2Phi),
+                 shape(Phi)]
+        table = OrbitalPhaseTable([f.value for f in funcs],
+                                  [f.full_derivs()[0] for f in funcs], key)
+        table.error_bound = table.error_factor * m4 * u.s
+        self.phase_table = table
+        return table
+
+    def tabulated_delay(self):
+        """ELL1 delay (delayI + delayS) interpolated from the orbital phase
+        table, or None if it can not be tabulated. The error is less than
+        phase_table.error_bound, which is kept below phase_table_tol. The
+        bound is the linearized propagation of the interpolation errors
+        with a safety factor of 2 (see get_phase_table()).
+        """
+        table = self.get_phase_table()
+        if table is None:
+            return None
+        Dre, Drep, Drepp, shapiro = table.evaluate(self.Phi().to_value(u.rad))
+        a1 = (self.a1() / c.c).to_value(u.s)
+        Dre *= a1
+        Drep *= a1
+        Drepp *= a1
+        nhat = (2 * np.pi / self.PB).to_value(1 / u.s)
+        delayI = Dre * (1 - nhat * Drep + (nhat * Drep)**2 +
+                        1.0/2 * nhat**2 * Dre * Drepp)
+        scale = self.phase_table_shapiro()[2]
+        return (delayI + scale * shapiro) * u.s
+
     def ELL1_om(self):
         # arctan(om)
         om = np.arctan2(self.eps1(), self.eps2())
@@ -272,7 +498,9 @@ class ELL1model(ELL1BaseModel):
         self.binary_name = 'ELL1'
         self.binary_delay_funcs = [self.ELL1delay,]
         self.d_binarydelay_d_par_funcs = [self.d_ELL1delay_d_par,]
+        self.dual_delay_func = self.ELL1delay_dual
 
+    @cache_result
     def delayS(self):
         """ELL1 Shaprio delay. Ch. Lange,1 F. Camilo, 2001 eq. A16
         """
@@ -299,9 +527,38 @@ class ELL1model(ELL1BaseModel):
         return d_delayS_d_TM2 * d_TM2_d_par + d_delayS_d_SINI*d_SINI_d_par + \
                d_delayS_d_Phi * d_Phi_d_par
 
+    def phase_table_shapiro(self):
+        """The ELL1 Shapiro delay is -2 * TM2 * log(1 - SINI * sin(Phi)).
+        With SINI = 2r / (1 + r**2) the log is
+        -log(1 + r**2) - 2 * sum(r**k / k * cos(k * (Phi - pi/2))).
+        """
+        sini = float(self.SINI.value if hasattr(self.SINI, 'value')
+                     else self.SINI)
+        if abs(sini) >= 1.0:
+            m4 = np.inf
+        elif sini == 0.0:
+            m4 = 0.0
+        else:
+            r = (1 - np.sqrt(1 - sini ** 2)) / abs(sini)
+            m4 = 2 * r ** 3 * harmonic_bound(r, 1)
+        shape = lambda Phi: np.log(1 - sini * np.sin(Phi))
+        scale = -2 * self.TM2().to_value(u.s)
+        return shape, m4, scale, (sini,)
+
     def ELL1delay(self):
         # TODO need add aberration delay
+        if self.use_phase_table:
+            delay = self.tabulated_delay()
+            if delay is not None:
+                return delay
         return self.delayI() + self.delayS()
 
+    def ELL1delay_dual(self, pv):
+        """ELL1 delay evaluated on dual numbers, in second.
+        """
+        TM2 = pv.M2 * Tsun.to(u.s).value
+        delayS = -2 * TM2 * np.log(1 - pv.SINI * np.sin(self.dual_Phi(pv)))
+        return self.dual_delayI(pv) + delayS
+
     def d_ELL1delay_d_par(self, par):
         return self.d_delayI_d_par(par) + self.d_delayS_d_par(par)
@@ -12,6 +12,74 @@ except ImportError:
     from astropy._erfa import DAYSEC as SECS_PER_DAY
 SECS_PER_JUL_YEAR = SECS_PER_DAY*365.25
 from pint import ls,GMsun,Tsun,light_second_equivalency
+from pint.orbital.kepler import solve_kepler
+from pint.dual import Dual, value_of
+
+
+def _same_input(old, new):
+    """Check if a new binary model input is the same as the old one."""
+    if old is new:
+        return True
+    if old is None or new is None:
+        return False
+    try:
+        if np.shape(old) != np.shape(new):
+            return False
+        return bool(np.all(old == new))
+    except Exception:
+        return False
+
+
+def cache_result(func):
+    """Decorator to memoize a binary model intermediate variable.
+
+    The result is kept until one of the inputs (the barycentric TOAs, the
+    positions or a parameter) of the binary model changes, which bumps
+    `PSR_BINARY.input_version`. It only works for methods without argument.
+    The cached result is shared between the callers, so it must not be
+    modified in place.
+    """
+    @functools.wraps(func)
+    def wrapper(self):
+        version = self.input_version
+        hit = self._inter_var_cache.get(func)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+        result = func(self)
+        self._inter_var_cache[func] = (version, result)
+        return result
+    return wrapper
+
+
+def cache_dual(func):
+    """Decorator to compute a dual number intermediate variable only once
+    per evaluation. The result is kept in the `DualInputs` of the evaluation.
+    """
+    @functools.wraps(func)
+    def wrapper(self, pv):
+        if func not in pv.cache:
+            pv.cache[func] = func(self, pv)
+        return pv.cache[func]
+    return wrapper
+
+
+class DualInputs(dict):
+    """The inputs of a dual number evaluation of a binary model.
+
+    It maps the parameter names to plain numbers in the units given by
+    `PSR_BINARY.dual_units`, or to `pint.dual.Dual` for the parameters the
+    derivatives are taken with respect to. The items are also accessible as
+    attributes, so the formulas read like the Quantity ones.
+    """
+    def __init__(self, *args, **kwargs):
+        super(DualInputs, self).__init__(*args, **kwargs)
+        self.cache = {}
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
 
 
 class PSR_BINARY(object):
@@ -91,6 +159,10 @@ class PSR_BINARY(object):
     prtl_der()    partial derivatives respect to some variable
     """
     def __init__(self,):
+        # The version of the model inputs and the cache of the intermediate
+        # variables (see cache_result).
+        self.input_version = 0
+        self._inter_var_cache = {}
         # Necessary parameters for all binary model
         self.binary_name = None
         self.param_default_value = {'PB':np.longdouble(10.0)*u.day,
@@ -114,9 +186,36 @@ class PSR_BINARY(object):
                               'A1DOT':['XDOT']}
         self.binary_params = list(self.param_default_value.keys())
         self.inter_vars = ['E','M','nu','ecc','omega','a1','TM2']
-        self.cache_vars = ['E', 'nu']
         self.binary_delay_funcs = []
         self.d_binarydelay_d_par_funcs = []
+        # Forward-mode automatic differentiation (see
+        # binary_delay_and_jacobian_dual), switched on through
+        # PulsarBinary.use_dual. The parameters are converted to
+        # these units before the evaluation. The epochs enter the formulas
+        # through the time since the epoch, given by the named attribute.
+        self.use_dual = False
+        self.dual_delay_func = None
+        self.dual_units = {'PB': u.s, 'PBDOT': u.Unit(''),
+                           'ECC': u.Unit(''), 'EDOT': 1/u.s,
+                           'A1': ls, 'A1DOT': ls/u.s, 'OM': u.rad,
+                           'OMDOT': u.rad/u.s, 'XPBDOT': u.Unit(''),
+                           'M2': u.M_sun, 'SINI': u.Unit(''),
+                           'GAMMA': u.s}
+        self.dual_epochs = {'T0': 'tt0'}
+
+    def __setattr__(self, name, value):
+        # Bump the input version if a model input really changes, so the
+        # cached intermediate variables get recomputed.
+        if name in self.__dict__.get('binary_params', []) or \
+                name in ['t', 'obs_pos', 'psr_pos']:
+            try:
+                old = getattr(self, name, None)
+            except Exception:
+                old = None
+            if not _same_input(old, value):
+                self.__dict__['input_version'] = \
+                    self.__dict__.get('input_version', 0) + 1
+        super(PSR_BINARY, self).__setattr__(name, value)
 
     @property
     def t(self):
@@ -160,11 +259,6 @@ class PSR_BINARY(object):
                 parameters[key] = value
         self.set_param_values(parameters)
 
-        # Switch the cache off
-        # NOTE Having cache is needs to be very careful.
-        for cv in self.cache_vars:
-            setattr(self, '_' + cv, None)
-
     def set_param_values(self, valDict = None):
         """A function that sets the parameters and assign values
         If the valDict is not provided, it will set parameter as default value
@@ -251,6 +345,162 @@ class PSR_BINARY(object):
 
         return result
 
+    def binary_delay_and_jacobian(self, params):
+        """Get the binary delay and its derivatives respect to a list of
+        parameters in one pass, for the current inputs. The intermediate
+        variables are computed once and shared by all the derivatives.
+        Parameter
+        ---------
+        params : list
+            Parameter names.
+        Return
+        ----------
+        The binary delay and an ordered dictionary maps the parameter names
+        to the delay derivatives.
+        """
+        if self.use_dual:
+            return self.binary_delay_and_jacobian_dual(params)
+        delay = self.binary_delay()
+        jacobian = collections.OrderedDict()
+        for par in params:
+            jacobian[par] = self.d_binarydelay_d_par(par)
+        return delay, jacobian
+
+    @property
+    def has_dual_delay(self):
+        """True if the model provides a dual number delay function, which
+        binary_delay_and_jacobian_dual() requires.
+        """
+        return getattr(self, 'dual_delay_func', None) is not None
+
+    def dual_inputs(self, params):
+        """Set up the inputs of a dual number evaluation.
+        Parameter
+        ---------
+        params : list
+            Parameter names the derivatives are taken with respect to.
+        Return
+        ----------
+        A DualInputs instance and the list of the units of the derivative
+        slots.
+        """
+        names = []
+        for par in params:
+            if par not in self.binary_params:
+                parname = self.search_alias(par)
+                if parname is None:
+                    raise AttributeError('Can not find parameter ' + par +
+                                         ' in ' + self.binary_name + ' model')
+                par = parname
+            if par not in self.dual_units and par not in self.dual_epochs:
+                raise ValueError("Derivative respect to '%s' is not"
+                                 " supported by the dual evaluation." % par)
+            names.append(par)
+        k = len(names)
+        pv = DualInputs()
+        for par in self.binary_params:
+            val = getattr(self, par)
+            if par in self.dual_units:
+                val = val.to(self.dual_units[par]).value
+            elif hasattr(val, 'value'):
+                val = val.value
+            if par in names and par not in self.dual_epochs:
+                d = np.zeros(k)
+                d[names.index(par)] = 1.0
+                val = Dual(val, d)
+            pv[par] = val
+        # Times since the epochs, in second.
+        for epoch, tname in self.dual_epochs.items():
+            dt = getattr(self, tname)
+            if callable(dt):
+                dt = dt()
+            dt = dt.to(u.s).value
+            if epoch in names:
+                d = np.zeros((k,) + dt.shape)
+                d[names.index(epoch)] = -SECS_PER_DAY
+                dt = Dual(dt, d)
+            pv[tname] = dt
+        units = []
+        for par in names:
+            if par in self.dual_epochs:
+                units.append(u.s/u.day)
+            else:
+                units.append(u.s/self.dual_units[par])
+        return pv, units
+
+    def binary_delay_and_jacobian_dual(self, params):
+        """Get the binary delay and its derivatives respect to a list of
+        parameters with forward-mode automatic differentiation. The delay
+        formula is evaluated once on dual numbers, which carry the
+        derivatives respect to all the parameters.
+        Parameter
+        ---------
+        params : list
+            Parameter names.
+        Return
+        ----------
+        The binary delay and an ordered dictionary maps the parameter names
+        to the delay derivatives.
+        """
+        if not self.has_dual_delay:
+            raise ValueError("%s model does not have a dual number delay."
+                             % self.binary_name)
+        pv, units = self.dual_inputs(params)
+        result = self.dual_delay_func(pv)
+        delay = value_of(result) * u.s
+        jacobian = collections.OrderedDict()
+        for ii, par in enumerate(params):
+            if isinstance(result, Dual):
+                d = np.array(result.full_derivs()[ii])
+            else:
+                d = np.zeros(len(self.t))
+            jacobian[par] = d * units[ii]
+        return delay, jacobian
+
+    # Dual number versions of the intermediate variables. They take the
+    # DualInputs of the evaluation, and follow the Quantity versions above.
+    @cache_dual
+    def dual_ecc(self, pv):
+        return pv.ECC + pv.tt0 * pv.EDOT
+
+    @cache_dual
+    def dual_a1(self, pv):
+        return pv.A1 + pv.tt0 * pv.A1DOT
+
+    @cache_dual
+    def dual_orbits(self, pv):
+        tp = pv.tt0 / pv.PB
+        return tp - 0.5 * (pv.PBDOT + pv.XPBDOT) * tp**2
+
+    @cache_dual
+    def dual_M(self, pv):
+        orbits = self.dual_orbits(pv)
+        return (orbits - np.floor(orbits)) * 2 * np.pi
+
+    @cache_dual
+    def dual_E(self, pv):
+        """Eccentric anomaly. The value is solved from the Kepler equation,
+        one Newton step then carries the derivatives,
+        dE = (dM + sin(E) * de) / (1 - e * cos(E)).
+        """
+        ecc = self.dual_ecc(pv)
+        M = self.dual_M(pv)
+        E = solve_kepler(value_of(ecc), value_of(M))
+        return E + (M - E + ecc * np.sin(E)) / (1 - ecc * np.cos(E))
+
+    @cache_dual
+    def dual_nu(self, pv):
+        ecc = self.dual_ecc(pv)
+        nu = 2 * np.arctan(np.sqrt((1.0 + ecc)/(1.0 - ecc)) *
+                           np.tan(self.dual_E(pv) / 2.0))
+        # Normalize True anomaly to on orbit.
+        nu = nu + 2 * np.pi * (value_of(nu) < 0)
+        return 2 * np.pi * self.dual_orbits(pv) + nu - self.dual_M(pv)
+
+    @cache_dual
+    def dual_omega(self, pv):
+        return pv.OM + pv.OMDOT * pv.tt0
+
     def prtl_der(self,y,x):
         """Find the partial derivatives in binary model
            pdy/pdx
@@ -339,18 +589,11 @@ class PSR_BINARY(object):
         else:
             e = eccentricity
 
-        if any(e<0) or any(e>=1):
-            raise ValueError('Eccentricity should be in the range of [0,1).')
-
         if hasattr(mean_anomaly,'unit'):
             ma = np.longdouble(mean_anomaly).value
         else:
             ma = mean_anomaly
-        k = lambda E: E-e*np.sin(E)-ma   # Kepler Equation
-        dk = lambda E: 1-e*np.cos(E)     # derivative Kepler Equation
-        U = ma
-        while(np.max(abs(k(U)))>5e-15):  # Newton-Raphson method
-            U = U-k(U)/dk(U)
+        U = solve_kepler(e, ma)
         return U*u.rad
 
         ####################################
@@ -368,6 +611,7 @@ class PSR_BINARY(object):
         return tt0
 
     ####################################
+    @cache_result
     def ecc(self):
         """Calculate ecctricity with EDOT
         """
@@ -387,6 +631,7 @@ class PSR_BINARY(object):
         return self.tt0
 
     #####################################
+    @cache_result
     def a1(self):
         return self.A1 + self.tt0*self.A1DOT
 
@@ -415,6 +660,7 @@ class PSR_BINARY(object):
         return result
 
     ######################################
+    @cache_result
     def orbits(self):
         """Pulsar Orbit
         """
@@ -424,6 +670,7 @@ class PSR_BINARY(object):
         orbits = (self.tt0/PB - 0.5*(PBDOT+XPBDOT)*(self.tt0/PB)**2).decompose()
         return orbits
 
+    @cache_result
     def M(self):
         """Orbit phase
         """
@@ -463,12 +710,11 @@ class PSR_BINARY(object):
 
     ###############################################
 
+    @cache_result
     def E(self):
         """Eccentric Anomaly
         """
-        if not hasattr(self, '_E') or self._E is None:
-            self._E = self.compute_eccentric_anomaly(self.ecc(),self.M())
-        return self._E
+        return self.compute_eccentric_anomaly(self.ecc(),self.M())
 
     # Analytically calculate derivtives.
 
@@ -508,17 +754,15 @@ class PSR_BINARY(object):
         return self.tt0 * self.d_E_d_ECC()
 
     #####################################################
+    @cache_result
     def nu(self):
         """True anomaly  (Ae)
         """
-        if not hasattr(self, '_nu') or self._nu is None:
-            ecc = self.ecc()
-            nu = 2*np.arctan(np.sqrt((1.0+ ecc)/(1.0- ecc)) * np.tan(self.E()/2.0))
-            # Normalize True anomaly to on orbit.
-            nu[nu<0] += 2*np.pi*u.rad
-            nu2 = 2*np.pi*self.orbits()*u.rad + nu - self.M()
-            self._nu = nu2
-        return self._nu
+        ecc = self.ecc()
+        nu = 2*np.arctan(np.sqrt((1.0+ ecc)/(1.0- ecc)) * np.tan(self.E()/2.0))
+        # Normalize True anomaly to on orbit.
+        nu[nu<0] += 2*np.pi*u.rad
+        return 2*np.pi*self.orbits()*u.rad + nu - self.M()
 
     def d_nu_d_E(self):
         nu = self.nu()
@@ -576,6 +820,7 @@ class PSR_BINARY(object):
 
     #############################################
 
+    @cache_result
     def omega(self):
         """
         """
@@ -638,6 +883,7 @@ class PSR_BINARY(object):
         return Tsun/(1.0*u.Msun)
     ###########################################################
 
+    @cache_result
     def pbprime(self):
         return self.PB - self.PBDOT * self.tt0
 
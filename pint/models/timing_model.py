@@ -1,18 +1,27 @@
 # timing_model.py
 # Defines the basic timing model interface classes
 import functools
-from .parameter import Parameter, strParameter
+import hashlib
+import os
+import tempfile
+from .parameter import Parameter, strParameter, maskParameter
 from ..phase import Phase
+from ..toa_select import column_version, column_cache
+from ..parallel import get_worker_model, get_worker_table
+from ..covariance import ShermanMorrison, Woodbury
 from astropy import log
 import astropy.time as time
 import numpy as np
+import scipy.linalg as sl
 import pint.utils as utils
 import astropy.units as u
 from astropy.table import Table
+import scipy.sparse as sparse
 import copy
 import abc
 import six
 import inspect
+from multiprocessing.pool import ThreadPool
 from pint import dimensionless_cycles
 
 # parameters or lines in parfiles to ignore (for now?), or at
@@ -23,6 +32,12 @@ ignore_params = ['START', 'FINISH', 'SOLARN0', 'EPHEM', 'CLK', 'UNITS',
                  'NITS', 'IBOOT','BINARY']
 ignore_prefix = ['DMXF1_','DMXF2_','DMXEP_'] # DMXEP_ for now.
 
+# Central finite difference stencils, {order: (step multiples, weights)}
+num_deriv_stencils = {2: ([-1, 1], [-1.0/2, 1.0/2]),
+                      4: ([-2, -1, 1, 2], [1.0/12, -2.0/3, 2.0/3, -1.0/12]),
+                      6: ([-3, -2, -1, 1, 2, 3], [-1.0/60, 3.0/20, -3.0/4,
+                                                  3.0/4, -3.0/20, 1.0/60])}
+
 
 class TimingModel(object):
     """
@@ -64,6 +79,9 @@ class TimingModel(object):
     top_level_params : list
         A parameter name list for thoes parameters belong to the top timing
         model class rather than a specific component.
+    phase_backend : str
+        The arithmetic for the high precision phase calculation, 'longdouble'
+        (default) or 'dd' for double-double (see `pint.doubledouble`).
 
     Properties
     ----------
@@ -87,6 +105,7 @@ class TimingModel(object):
         self.name = name
         self.component_types = []
         self.top_level_params = []
+        self.phase_backend = 'longdouble'
         self.add_param_from_top(strParameter(name="PSR",
             description="Source name",
             aliases=["PSRJ", "PSRB"]), '')
@@ -193,6 +212,14 @@ class TimingModel(object):
                 bfs += nc.basis_funcs
         return bfs
 
+    @property
+    def epoch_block_funcs(self,):
+        ebfs = []
+        if 'NoiseComponent' in self.component_types:
+            for nc in self.NoiseComponent_list:
+                ebfs += nc.epoch_block_funcs
+        return ebfs
+
     @property
     def phase_deriv_funcs(self):
         return self.get_deriv_funcs('PhaseComponent')
@@ -335,6 +362,69 @@ class TimingModel(object):
         new_tm.top_level_params = self.top_level_params
         return new_tm
 
+    def snapshot(self, params=None):
+        """Return a light-weight copy of the parameter state.
+
+        Parameters
+        ----------
+        params: list, optional
+            The parameter names to record. Default is all the parameters.
+
+        Return
+        ----------
+        A dictionary maps parameter name to a tuple of (quantity, uncertainty,
+        frozen). It only contains plain values, so it is cheap to copy and to
+        send to other processes.
+        """
+        if params is None:
+            params = self.params
+        state = {}
+        for p in params:
+            par = getattr(self, p)
+            state[p] = (copy.copy(par.quantity), copy.copy(par.uncertainty),
+                        par.frozen)
+        return state
+
+    def restore(self, state):
+        """Set the parameter state from a snapshot.
+
+        Parameters
+        ----------
+        state: dict
+            The output from `snapshot()`. Parameters not in the model are
+            ignored, and a None quantity or uncertainty is left untouched.
+        """
+        params = self.params
+        for p, (qnt, ucty, frozen) in state.items():
+            if p not in params:
+                continue
+            par = getattr(self, p)
+            if qnt is not None:
+                par.quantity = qnt
+            if ucty is not None:
+                par.uncertainty = ucty
+            par.frozen = frozen
+
+    def __reduce__(self):
+        # Parameters hold lambda functions, which can not be pickled. The
+        # model is rebuilt from its parfile representation and the exact
+        # parameter values are put back from a snapshot.
+        return (_unpickle_timing_model,
+                (self.name, self.as_parfile(), self.snapshot(),
+                 {'phase_backend': self.phase_backend}))
+
+    def __copy__(self):
+        new_tm = self.__class__.__new__(self.__class__)
+        new_tm.__dict__.update(self.__dict__)
+        return new_tm
+
+    def __deepcopy__(self, memo):
+        new_tm = self.__class__.__new__(self.__class__)
+        memo[id(self)] = new_tm
+        for k, v in self.__dict__.items():
+            setattr(new_tm, k, copy.deepcopy(v, memo))
+        return new_tm
+
     def map_component(self, component):
         comps = self.components
         if isinstance(component, str):
@@ -486,11 +576,21 @@ class TimingModel(object):
             phase += Phase(pf(toas, delay))
         return phase
 
-    def covariance_matrix(self, toas):
+    def covariance_matrix(self, toas, structured=False):
         """This a function to get the TOA covariance matrix for noise models.
            If there is no noise model component provided, a diagonal matrix with
            TOAs error as diagonal element will be returned.
+
+           If structured is True, the covariance is returned as the
+           pint.covariance.Woodbury instance of noise_engine(), with the
+           ECORR noise as epoch blocks, or as a sparse basis if the ECORR
+           epochs overlap: the diagonal white noise, the epoch
+           blocks and the low rank noise bases are kept separate, and the
+           dot(), solve() and logdet() methods cost O(N k^2) for k basis
+           vectors instead of O(N^3), without the NxN matrix.
         """
+        if structured:
+            return self.noise_engine(toas, epoch_blocks=True)
         ntoa = len(toas)
         result = np.zeros((ntoa, ntoa))
         # When there is no noise model.
@@ -518,24 +618,205 @@ class TimingModel(object):
             result += nf(toas)
         return result
 
-    def noise_model_designmatrix(self, toas):
+    def get_basis_funcs(self, epoch_blocks=False, sparse_basis=False):
+        """Return the noise basis functions. If epoch_blocks is True, the
+        basis functions of the components providing epoch blocks are left
+        out, since that noise is given by noise_model_epoch_blocks(). If
+        sparse_basis is True, the functions returning the basis as a
+        scipy.sparse matrix are used where the components have them.
+        """
+        if not (epoch_blocks or sparse_basis):
+            return self.basis_funcs
+        bfs = []
+        if 'NoiseComponent' in self.component_types:
+            for nc in self.NoiseComponent_list:
+                if epoch_blocks and nc.epoch_block_funcs != []:
+                    continue
+                if sparse_basis and nc.sparse_basis_funcs != []:
+                    bfs += nc.sparse_basis_funcs
+                else:
+                    bfs += nc.basis_funcs
+        return bfs
+
+    def noise_model_designmatrix(self, toas, epoch_blocks=False,
+                                 sparse_basis=False):
         result = []
-        if len(self.basis_funcs) == 0:
+        basis_funcs = self.get_basis_funcs(epoch_blocks, sparse_basis)
+        if len(basis_funcs) == 0:
             return None
 
-        for nf in self.basis_funcs:
+        for nf in basis_funcs:
             result.append(nf(toas)[0])
-        return np.hstack((r for r in result))
+        if any(sparse.issparse(r) for r in result):
+            return sparse.hstack(result).tocsr()
+        return np.hstack([r for r in result])
 
 
-    def noise_model_basis_weight(self, toas):
+    def noise_model_basis_weight(self, toas, epoch_blocks=False,
+                                 sparse_basis=False):
         result = []
-        if len(self.basis_funcs) == 0:
+        basis_funcs = self.get_basis_funcs(epoch_blocks, sparse_basis)
+        if len(basis_funcs) == 0:
             return None
 
-        for nf in self.basis_funcs:
+        for nf in basis_funcs:
             result.append(nf(toas)[1])
-        return np.hstack((r for r in result))
+        return np.hstack([r for r in result])
+
+    def epoch_blocks_available(self, toas):
+        """Return True if there is noise given as epoch blocks (e.g. ECORR)
+        and its epochs do not overlap (e.g. no TOA is selected by two
+        ECORRs). Otherwise that noise has to be kept as a noise basis.
+        """
+        if len(self.epoch_block_funcs) == 0:
+            return False
+        for nc in self.NoiseComponent_list:
+            if nc.epoch_block_funcs != [] and \
+                    not nc.epoch_blocks_disjoint(toas):
+                return False
+        return True
+
+    def noise_engine(self, toas, epoch_blocks=True):
+        """Return the noise covariance of the TOAs as a
+        pint.covariance.Woodbury instance.
+
+        The white noise (scaled TOA uncertainties, and the epoch blocks if
+        epoch_blocks is True) and the noise basis projections are reused as
+        long as the TOAs, the white noise parameters and the basis
+        definitions are unchanged. Otherwise only the basis weights are
+        updated, e.g. for a new red noise amplitude or spectral index.
+
+        If the epochs overlap (see epoch_blocks_available()), the epoch
+        block noise is kept in the basis, as a scipy.sparse quantization
+        matrix, whatever epoch_blocks is.
+        """
+        use_blocks = epoch_blocks and self.epoch_blocks_available(toas)
+        white_key = [column_version(toas['error'])
+                     if hasattr(toas['error'], 'meta') else
+                     hash(np.ascontiguousarray(toas['error']).tobytes())]
+        basis_key = []
+        if 'NoiseComponent' in self.component_types:
+            for nc in self.NoiseComponent_list:
+                in_blocks = use_blocks and nc.epoch_block_funcs != []
+                if nc.scaled_sigma_funcs != [] or in_blocks:
+                    white_key.append(nc.noise_cache_key())
+                if nc.basis_funcs != [] and not in_blocks:
+                    basis_key.append(nc.basis_cache_key())
+        key = (toas_table_token(toas), use_blocks, tuple(white_key),
+               tuple(basis_key))
+        cached = getattr(self, '_noise_engine', None)
+        if cached is None or cached[0] != key:
+            nvec = self.scaled_sigma(toas).to(u.s).value**2
+            if use_blocks:
+                index, jvec = self.noise_model_epoch_blocks(toas)
+            else:
+                index = np.zeros(len(toas), dtype=int) - 1
+                jvec = np.zeros(0)
+            white = ShermanMorrison(nvec, jvec, index)
+            T = self.noise_model_designmatrix(toas, use_blocks,
+                                              sparse_basis=True)
+            self._noise_engine = (key, Woodbury(white, T))
+        engine = self._noise_engine[1]
+        if engine.nbasis > 0:
+            engine.set_phi(self.noise_model_basis_weight(toas, use_blocks,
+                                                         sparse_basis=True))
+        return engine
+
+    def noise_loglike(self, toas, resids, noise_params=None,
+                      epoch_blocks=True):
+        """Return the log likelihood of the residuals for the noise model,
+        marginalized over the timing model and the noise basis coefficients.
+
+        The likelihood is Gaussian with the covariance from noise_engine(),
+        and the timing model is linearized with its design matrix under a
+        flat prior:
+
+            -2 log L = r^T C^-1 r - d^T (M^T C^-1 M)^-1 d + log det(C)
+                       + log det(M^T C^-1 M) + (N - P) log(2 pi),
+
+        with d = M^T C^-1 r. The design matrix is kept while the TOAs and
+        the timing parameters are unchanged, and the white noise projections
+        of the design matrix and the residuals while the white noise is
+        unchanged. A sample that only changes the basis weights (e.g. the
+        red noise amplitude) then costs O(k^3 + k^2 P) for k basis vectors
+        and P timing parameters.
+
+        Parameters
+        ----------
+        toas: TOAs table
+            The TOAs the residuals are computed at.
+        resids: numpy.ndarray or astropy.units.Quantity
+            The time residuals, in second if no unit is given.
+        noise_params: dict, optional
+            Noise parameter names and values to set before the evaluation.
+        epoch_blocks: bool, optional
+            Treat the ECORR noise as epoch blocks (see noise_engine()). If
+            the ECORR epochs overlap, it is kept as a sparse basis instead.
+        """
+        if noise_params is not None:
+            for pn, value in noise_params.items():
+                getattr(self, pn).value = value
+        engine = self.noise_engine(toas, epoch_blocks)
+        r = u.Quantity(resids, u.s).value.astype(np.float64)
+
+        noise_names = []
+        if 'NoiseComponent' in self.component_types:
+            for nc in self.NoiseComponent_list:
+                noise_names += nc.params
+        timing_key = (toas_table_token(toas),
+                      tuple((pn, getattr(self, pn).value, getattr(self,
+                             pn).frozen) for pn in self.params
+                            if pn not in noise_names))
+        cache = getattr(self, '_noise_loglike_cache', None)
+        if cache is None or cache['timing_key'] != timing_key:
+            M = self.designmatrix(toas)[0]
+            norm = np.sqrt(np.sum(M**2, axis=0))
+            norm[norm == 0] = 1
+            cache = {'timing_key': timing_key, 'M': M / norm,
+                     'log_norm': np.sum(np.log(norm))}
+            self._noise_loglike_cache = cache
+        if cache.get('engine') is not engine or \
+                not np.array_equal(cache['r'], r):
+            X = np.hstack((cache['M'], r[:,None]))
+            cache['XNX'] = engine.white.inner(X)
+            cache['TNX'] = engine.project(X) if engine.nbasis > 0 else None
+            cache['engine'] = engine
+            cache['r'] = r.copy()
+
+        XCX = cache['XNX']
+        if engine.nbasis > 0:
+            XCX = XCX - np.dot(cache['TNX'].T,
+                               sl.cho_solve(engine.sigma_cf, cache['TNX']))
+        ntoa, npar = cache['M'].shape
+        MCM, d, rCr = XCX[:-1, :-1], XCX[:-1, -1], XCX[-1, -1]
+        cf = sl.cho_factor(MCM)
+        chi2 = rCr - np.dot(d, sl.cho_solve(cf, d))
+        logdet_MCM = 2 * np.sum(np.log(np.diag(cf[0]))) + \
+            2 * cache['log_norm']
+        return -0.5 * (chi2 + engine.logdet() + logdet_MCM +
+                       (ntoa - npar) * np.log(2 * np.pi))
+
+    def noise_model_epoch_blocks(self, toas):
+        """Return the noise that is constant within observing epochs (e.g.
+        ECORR) as the epoch number of each TOA, -1 for the TOAs in no
+        epoch, and the variance of each epoch in s^2. None is returned if
+        there is no such noise.
+        """
+        if len(self.epoch_block_funcs) == 0:
+            return None
+        index = np.empty(len(toas), dtype=int)
+        index.fill(-1)
+        weights = []
+        nepoch = 0
+        for ef in self.epoch_block_funcs:
+            idx, weight = ef(toas)
+            use = idx >= 0
+            if np.any(index[use] >= 0):
+                raise ValueError("TOAs belong to more than one epoch block.")
+            index[use] = idx[use] + nepoch
+            weights.append(weight)
+            nepoch += len(weight)
+        return (index, np.concatenate(weights))
 
 
 
@@ -600,6 +881,15 @@ class TimingModel(object):
         """
         pass
 
+    def d_phase_d_delay(self, toas, delay):
+        """Return the derivative of the total phase with respect to the total
+        delay.
+        """
+        dpdd_result = np.longdouble(np.zeros(len(toas))) * u.cycle/u.second
+        for dpddf in self.d_phase_d_delay_funcs:
+            dpdd_result += dpddf(toas, delay)
+        return dpdd_result
+
     def d_phase_d_param(self, toas, delay, param):
         """ Return the derivative of phase with respect to the parameter.
         """
@@ -608,13 +898,11 @@ class TimingModel(object):
         # phase indirectly (and vice-versa)??
         par = getattr(self, param)
         result = np.longdouble(np.zeros(len(toas))) * u.cycle/par.units
-        param_phase_derivs = []
         phase_derivs = self.phase_deriv_funcs
-        delay_derivs = self.delay_deriv_funcs
         if param in list(phase_derivs.keys()):
-            for df in phase_derivs[param]:
-                result += df(toas, param, delay).to(result.unit,
-                            equivalencies=u.dimensionless_angles())
+            for cp in self.PhaseComponent_list:
+                if param in cp.deriv_funcs:
+                    result += cp.d_phase_d_params(toas, [param,], delay)[param]
         else:
             # Apply chain rule for the parameters in the delay.
             # total_phase = Phase1(delay(param)) + Phase2(delay(param))
@@ -624,9 +912,7 @@ class TimingModel(object):
             #                         d_delay_d_param
 
             d_delay_d_p = self.d_delay_d_param(toas, param)
-            dpdd_result = np.longdouble(np.zeros(len(toas))) * u.cycle/u.second
-            for dpddf in self.d_phase_d_delay_funcs:
-                dpdd_result += dpddf(toas, delay)
+            dpdd_result = self.d_phase_d_delay(toas, delay)
             result = dpdd_result * d_delay_d_p
         return result.to(result.unit, equivalencies=u.dimensionless_angles())
 
@@ -640,9 +926,9 @@ class TimingModel(object):
         if param not in list(delay_derivs.keys()):
             raise AttributeError("Derivative function for '%s' is not provided"
                                  " or not registered. "%param)
-        for df in delay_derivs[param]:
-            result += df(toas, param, acc_delay).to(result.unit, \
-                        equivalencies=u.dimensionless_angles())
+        for cp in self.DelayComponent_list:
+            if param in cp.deriv_funcs:
+                result += cp.d_delay_d_params(toas, [param,], acc_delay)[param]
         return result
 
     def d_phase_d_param_num(self, toas, param, step=1e-2):
@@ -700,15 +986,198 @@ class TimingModel(object):
         par.value = ori_value
         return d_delay * (u.second/unit)
 
+    def num_deriv_step(self, param, step_frac=0.1, rel_step=1e-2):
+        """Return the finite difference step for a parameter.
+
+        The step is `step_frac` times the parameter uncertainty if it is
+        known, otherwise `rel_step` times the parameter value (or `rel_step`
+        if the value is zero).
+        """
+        par = getattr(self, param)
+        ucty = par.uncertainty_value
+        if ucty is not None and ucty > 0:
+            return step_frac * ucty
+        if par.value is None or par.value == 0:
+            return rel_step
+        return abs(par.value) * rel_step
+
+    def numerical_derivs(self, toas, params, quantity='phase', order=2,
+                         steps=None, step_frac=0.1, rel_step=1e-2, pool=None):
+        """Return the numerical derivatives of phase or delay with respect to
+        a group of parameters.
+
+        Parameters
+        ----------
+        toas: TOAs table
+            The TOAs the derivatives are evaluated at.
+        params: list
+            Parameter names.
+        quantity: str, optional
+            'phase' or 'delay'.
+        order: int, optional
+            The order of the central difference stencil, 2, 4 or 6.
+        steps: dict, optional
+            Finite difference steps in the parameter units. The parameters not
+            in it get steps from `num_deriv_step()`.
+        step_frac, rel_step: float, optional
+            See `num_deriv_step()`.
+        pool: pool object, optional
+            A process pool from `pint.parallel.make_pool`, made with these
+            TOAs. All the stencil evaluations of all the parameters are
+            distributed over the pool, each on a snapshot of this model with
+            one parameter shifted.
+
+        Return
+        ----------
+        A dictionary maps parameter name to the derivative quantity, in the
+        unit of cycle/parameter unit for phase and second/parameter unit for
+        delay.
+
+        Note
+        ----
+        Complex-step derivatives are not supported, since the model is
+        evaluated in longdouble and astropy Time, which have no complex
+        arithmetic.
+        """
+        if order not in num_deriv_stencils:
+            raise ValueError("Stencil order %s is not supported, use one of "
+                             "%s." % (order, list(num_deriv_stencils.keys())))
+        if quantity not in ['phase', 'delay']:
+            raise ValueError("Unknown quantity '%s'." % quantity)
+        offsets, weights = num_deriv_stencils[order]
+        if steps is None:
+            steps = {}
+        if quantity == 'phase':
+            # This sets up the phase reference (TZRMJD) from the unshifted
+            # model, so the shifted evaluations share it.
+            self.phase(toas)
+        hs = {}
+        for param in params:
+            par = getattr(self, param)
+            if par.value is None:
+                raise ValueError("Parameter '%s' has no value." % param)
+            hs[param] = steps.get(param, self.num_deriv_step(param, step_frac,
+                                                             rel_step))
+        evals = [(param, off) for param in params for off in offsets]
+        if pool is None:
+            results = []
+            for param, off in evals:
+                par = getattr(self, param)
+                ori_quantity = par.quantity
+                par.value = par.value + off * hs[param]
+                try:
+                    results.append(_evaluate_model(self, toas, quantity))
+                finally:
+                    par.quantity = ori_quantity
+        else:
+            base = self.snapshot()
+            check = (len(toas), toas_fingerprint(toas))
+            tasks = []
+            for param, off in evals:
+                par = getattr(self, param)
+                ori_quantity = par.quantity
+                par.value = par.value + off * hs[param]
+                state = dict(base)
+                state.update(self.snapshot([param,]))
+                par.quantity = ori_quantity
+                tasks.append((state, quantity, check))
+            results = pool.map(_num_deriv_task, tasks)
+
+        derivs = {}
+        nsten = len(offsets)
+        for ii, param in enumerate(params):
+            res = results[ii * nsten:(ii + 1) * nsten]
+            diff = np.zeros(len(toas), dtype=np.longdouble)
+            if quantity == 'phase':
+                # Subtract the integer part of one evaluation first, so the
+                # weighted sum keeps the precision of the fractional parts.
+                ref_int = res[0][0]
+                for (ph_int, ph_frac), w in zip(res, weights):
+                    diff += w * ((ph_int - ref_int) + ph_frac)
+                unit = u.cycle
+            else:
+                for dly, w in zip(res, weights):
+                    diff += w * dly
+                unit = u.second
+            par = getattr(self, param)
+            derivs[param] = diff / hs[param] * unit / par.units
+        return derivs
+
+    def get_deriv_groups(self, params, numerical=False):
+        """Group parameters by the component that provides their derivatives.
+
+        Parameters
+        ----------
+        params: list
+            Parameter names.
+        numerical: bool, optional
+            If True, the parameters without derivative functions are put in
+            a last group (None, 'numerical', parameter list). Otherwise an
+            AttributeError is raised for them.
+
+        Return
+        ----------
+        A list of (component name, derivative type, parameter list) tuples.
+        The derivative type is 'phase' for the parameters with phase
+        derivatives, otherwise 'delay'. A parameter with delay derivatives in
+        more than one component appears in each of those groups.
+        """
+        phase_derivs = self.phase_deriv_funcs
+        delay_derivs = self.delay_deriv_funcs
+        groups = []
+        num_params = []
+        for param in params:
+            if param not in phase_derivs and param not in delay_derivs:
+                if not numerical:
+                    raise AttributeError("Derivative function for '%s' is "
+                                         "not provided or not registered. "
+                                         % param)
+                num_params.append(param)
+        for ct, dtype in [('PhaseComponent', 'phase'),
+                          ('DelayComponent', 'delay')]:
+            for cp in getattr(self, ct + '_list'):
+                cp_params = [p for p in params if p in cp.deriv_funcs]
+                if dtype == 'delay':
+                    cp_params = [p for p in cp_params if p not in phase_derivs]
+                if cp_params != []:
+                    groups.append((cp.__class__.__name__, dtype, cp_params))
+        if num_params != []:
+            groups.append((None, 'numerical', num_params))
+        return groups
+
     def designmatrix(self, toas,acc_delay=None, scale_by_F0=True, \
-                     incfrozen=False, incoffset=True):
+                     incfrozen=False, incoffset=True, pool=None,
+                     chunk_size=None, params=None):
         """
         Return the design matrix: the matrix with columns of d_phase_d_param/F0
         or d_toa_d_param
+
+        Parameters
+        ----------
+        toas: TOAs table
+            The TOAs the design matrix is evaluated at.
+            Parameters without derivative functions get numerical
+            derivatives from `numerical_derivs()`.
+        pool: pool object, optional
+            A pool with a `map` method to distribute the column computations.
+            A `multiprocessing.pool.ThreadPool` shares this model and the
+            TOAs, and only runs the components with thread_safe_derivs (see
+            `Component`). Any other pool is treated as a process pool created
+            by `pint.parallel.make_pool`, whose workers hold their own copy of
+            the model and the TOAs; a ValueError is raised if their TOAs are
+            not the toas argument.
+        chunk_size: int, optional
+            If given, the derivatives are computed in TOA chunks of this
+            size. The TOA table should be grouped by 'obs' (as TOAs.table
+            is), so a chunk keeps the row order when it is regrouped.
+        params: list, optional
+            The parameters of the columns (besides 'Offset'). Default is all
+            the free parameters, or all the parameters if incfrozen.
         """
-        params = ['Offset',] if incoffset else []
-        params += [par for par in self.params if incfrozen or
-                not getattr(self, par).frozen]
+        if params is None:
+            params = [par for par in self.params if incfrozen or
+                      not getattr(self, par).frozen]
+        params = (['Offset',] if incoffset else []) + list(params)
 
         F0 = self.F0.quantity        # 1/sec
         ntoas = len(toas)
@@ -722,20 +1191,84 @@ class TimingModel(object):
         #    tt -= df(toas)
 
         M = np.zeros((ntoas, nparams))
+        col_idx = {}
         for ii, param in enumerate(params):
             if param == 'Offset':
                 M[:,ii] = 1.0
                 units.append(u.s/u.s)
             else:
-                # NOTE Here we have negative sign here. Since in pulsar timing
-                # the residuals are calculated as (Phase - int(Phase)), which is different
-                # from the conventional definition of least square definition (Data - model)
-                # We decide to add minus sign here in the design matrix, so the fitter
-                # keeps the conventional way.
-                q = - self.d_phase_d_param(toas, delay,param)
-                M[:,ii] = q
+                col_idx[param] = ii
                 units.append(u.Unit("")/ getattr(self, param).units)
 
+        groups = self.get_deriv_groups(list(col_idx.keys()), numerical=True)
+        num_params = []
+        if groups != [] and groups[-1][1] == 'numerical':
+            num_params = groups.pop()[2]
+            log.info("Using numerical derivatives for %s." % num_params)
+        if chunk_size is None or chunk_size >= ntoas:
+            bounds = [(0, ntoas)]
+        else:
+            bounds = [(ii, min(ii + chunk_size, ntoas)) for ii in
+                      range(0, ntoas, int(chunk_size))]
+        # d_phase_d_delay is shared by all the delay parameters, compute it
+        # once. It also sets up the phase reference over the full TOAs.
+        dpdd = self.d_phase_d_delay(toas, delay)
+
+        if pool is None or isinstance(pool, ThreadPool):
+            # The same model object is used by all the tasks, so the chunks
+            # of one component are computed in the same task.
+            tasks = [(self, toas, None, cn, dt, ps, bounds, delay, None)
+                     for cn, dt, ps in groups]
+        else:
+            state = self.snapshot()
+            check = (ntoas, toas_fingerprint(toas))
+            tasks = [(None, None, state, cn, dt, ps, [b,], delay[b[0]:b[1]],
+                      check) for cn, dt, ps in groups for b in bounds]
+        if pool is None:
+            results = [_designmatrix_task(t) for t in tasks]
+        elif isinstance(pool, ThreadPool):
+            # Only the thread safe components share the model at the same
+            # time, the others follow in this thread.
+            threaded = [ii for ii, t in enumerate(tasks) if
+                        self.components[t[3]].thread_safe_derivs]
+            results = [None] * len(tasks)
+            for ii, res in zip(threaded, pool.map(_designmatrix_task,
+                                                  [tasks[ii] for ii in threaded])):
+                results[ii] = res
+            for ii, t in enumerate(tasks):
+                if results[ii] is None:
+                    results[ii] = _designmatrix_task(t)
+        else:
+            results = pool.map(_designmatrix_task, tasks)
+
+        d_delay = {}
+        for (_, _, _, cn, dtype, ps, bds, _, _), res in zip(tasks, results):
+            for (st, ed), cols in zip(bds, res):
+                for param, col in cols.items():
+                    if dtype == 'phase':
+                        # NOTE Here we have negative sign here. Since in
+                        # pulsar timing the residuals are calculated as
+                        # (Phase - int(Phase)), which is different from the
+                        # conventional definition of least square definition
+                        # (Data - model). We decide to add minus sign here in
+                        # the design matrix, so the fitter keeps the
+                        # conventional way.
+                        M[st:ed, col_idx[param]] -= col
+                    else:
+                        if param not in d_delay:
+                            d_delay[param] = np.zeros(ntoas,
+                                                      dtype=np.longdouble)
+                        d_delay[param][st:ed] += col
+        # Chain rule for the delay parameters, see d_phase_d_param()
+        dpdd_value = dpdd.to(u.cycle/u.second).value
+        for param, dd in d_delay.items():
+            M[:, col_idx[param]] = - dpdd_value * dd
+        if num_params != []:
+            num_pool = None if isinstance(pool, ThreadPool) else pool
+            num_derivs = self.numerical_derivs(toas, num_params, pool=num_pool)
+            for param, nd in num_derivs.items():
+                M[:, col_idx[param]] = - nd.value
+
         if scale_by_F0:
             mask = []
             for ii, un in enumerate(units):
@@ -746,6 +1279,60 @@ class TimingModel(object):
             M[:, mask] /= F0.value
         return M, params, units, scale_by_F0
 
+    def designmatrix_blocks(self, toas, acc_delay=None, scale_by_F0=True,
+                            incfrozen=False, incoffset=True, pool=None,
+                            chunk_size=None):
+        """Return the design matrix split into a dense block and a sparse
+        block.
+
+        The parameters whose component provides sparse derivatives (the
+        `sparse_deriv_params` and `d_delay_d_params_sparse()` of a delay
+        component, e.g. DMX) go to a scipy.sparse block, which is never
+        densified. The other columns are the same as `designmatrix()`.
+
+        Return
+        ----------
+        The dense matrix, the sparse matrix (in csc format), the parameter
+        names of hstack([dense, sparse]) columns, their units and
+        scale_by_F0.
+        """
+        params = [par for par in self.params if incfrozen or
+                  not getattr(self, par).frozen]
+        sparse_groups = []
+        for cp in self.DelayComponent_list:
+            if not hasattr(cp.__class__, 'd_delay_d_params_sparse'):
+                continue
+            cp_params = [par for par in cp.sparse_deriv_params
+                         if par in params]
+            # Only if all the delay derivatives come from this component
+            cp_params = [par for par in cp_params if
+                         [c for c in self.DelayComponent_list
+                          if par in c.deriv_funcs] == [cp]]
+            if cp_params != []:
+                sparse_groups.append((cp, cp_params))
+        sparse_params = [par for _, ps in sparse_groups for par in ps]
+        dense_params = [par for par in params if par not in sparse_params]
+        M, dense_params, units, scale_by_F0 = self.designmatrix(toas,
+            acc_delay=acc_delay, scale_by_F0=scale_by_F0, incfrozen=incfrozen,
+            incoffset=incoffset, pool=pool, chunk_size=chunk_size,
+            params=dense_params)
+        if sparse_groups == []:
+            S = sparse.csc_matrix((len(toas), 0))
+            return M, S, dense_params, units, scale_by_F0
+        # Chain rule for the delay parameters, see designmatrix()
+        delay = self.delay(toas)
+        dpdd = self.d_phase_d_delay(toas, delay).to(u.cycle/u.second).value
+        scale = -np.asarray(dpdd, dtype=np.float64)
+        if scale_by_F0:
+            scale = scale / self.F0.value
+        blocks = [cp.d_delay_d_params_sparse(toas, ps)
+                  for cp, ps in sparse_groups]
+        S = sparse.diags(scale).dot(sparse.hstack(blocks)).tocsc()
+        for par in sparse_params:
+            un = u.Unit("") / getattr(self, par).units
+            units.append(un * u.second if scale_by_F0 else un)
+        return M, S, dense_params + sparse_params, units, scale_by_F0
+
     def read_parfile(self, filename):
         """Read values from the specified parfile into the model parameters."""
         checked_param = []
@@ -852,12 +1439,22 @@ class ModelMeta(abc.ABCMeta):
 @six.add_metaclass(ModelMeta)
 class Component(object):
     """ This is a base class for timing model components.
+
+    The derivative functions of a component with thread_safe_derivs = True
+    only read the model and the TOAs, so `TimingModel.designmatrix` may run
+    them in a thread pool next to the other components. The other components
+    (e.g. the ones that update a binary model object or add TOA table
+    columns) are run one after the other in the calling thread.
     """
+    thread_safe_derivs = False
+
     def __init__(self,):
         self.params = []
         self._parent = None
         self.category = ''
         self.deriv_funcs = {}
+        self.constant_deriv_params = []
+        self._column_cache = {}
         self.component_special_params = []
         
     def setup(self,):
@@ -869,7 +1466,10 @@ class Component(object):
         except AttributeError:
             try:
                 p = super(Component, self).__getattribute__('_parent')
-                if p is None:
+                # Special methods, e.g. __deepcopy__, are not taken from the
+                # parent model
+                if p is None or (name.startswith('__') and
+                                 name.endswith('__')):
                     raise AttributeError("'%s' object has no attribute '%s'." %
                                         (self.__class__.__name__, name))
                 else:
@@ -971,7 +1571,7 @@ class Component(object):
         # if not found any thing.
         return ''
 
-    def register_deriv_funcs(self, func, param):
+    def register_deriv_funcs(self, func, param, constant=False):
         """
         This is a function to register the derivative function in to the
         deriv_func dictionaries.
@@ -981,6 +1581,12 @@ class Component(object):
             The method calculates the derivative
         param: str
             Name of parameter the derivative respect to
+        constant: bool, optional
+            If True, the derivative only depends on the TOAs and on the
+            definition of the parameter (see `deriv_cache_key()`), not on the
+            current parameter values. The derivative will be cached between
+            calls. A parameter is treated as constant only if all its
+            derivative functions are registered as constant.
         """
         pn = self.match_param_aliases(param)
         if pn == '':
@@ -988,8 +1594,80 @@ class Component(object):
 
         if pn not in list(self.deriv_funcs.keys()):
             self.deriv_funcs[pn] = [func,]
+            if constant:
+                self.constant_deriv_params.append(pn)
         else:
-            self.deriv_funcs[pn] += [func,]
+            if func not in self.deriv_funcs[pn]:
+                self.deriv_funcs[pn] += [func,]
+            if not constant and pn in self.constant_deriv_params:
+                self.constant_deriv_params.remove(pn)
+
+    def deriv_cache_key(self, param):
+        """Return the definition of a parameter that its constant derivative
+        depends on. The cached derivative is recomputed when the key changes.
+        By default, it is the key and key values for a mask parameter and
+        None for the others.
+        """
+        par = getattr(self, param)
+        if isinstance(par, maskParameter):
+            return (par.key, tuple(str(kv) for kv in par.key_value))
+        return None
+
+    def cached_column(self, toas, name, def_key, func, token=None):
+        """Return a cached TOA-dependent array, or compute and cache it.
+
+        Parameters
+        ----------
+        toas: TOAs table
+            The TOAs the array is computed for.
+        name: str
+            Name of the cached array.
+        def_key: hashable
+            The definition the array depends on besides the TOAs. The array
+            is recomputed if it changes.
+        func: callable
+            Computes the array without argument.
+        token: hashable, optional
+            The identity of the TOAs, from `toas_table_token()`. It will be
+            computed if not given.
+        """
+        if token is None:
+            token = toas_table_token(toas)
+        cached = self._column_cache.get(name)
+        if cached is not None and cached[0] == token and cached[1] == def_key:
+            return cached[2].copy()
+        result = func()
+        self._column_cache[name] = (token, def_key, result)
+        return result.copy()
+
+    def clear_column_cache(self):
+        """Remove all the cached arrays of this component."""
+        self._column_cache = {}
+
+    def _d_params(self, toas, params, arg, unit):
+        """Sum the registered derivative functions for a group of parameters.
+        The constant derivatives are served from the column cache.
+        """
+        result = {}
+        token = None
+        for param in params:
+            par = getattr(self, param)
+
+            def compute(param=param, par=par):
+                res = np.longdouble(np.zeros(len(toas))) * unit/par.units
+                for df in self.deriv_funcs[param]:
+                    res += df(toas, param, arg).to(res.unit, \
+                              equivalencies=u.dimensionless_angles())
+                return res
+
+            if param in self.constant_deriv_params:
+                if token is None:
+                    token = toas_table_token(toas)
+                result[param] = self.cached_column(toas, ('deriv', param),
+                        self.deriv_cache_key(param), compute, token)
+            else:
+                result[param] = compute()
+        return result
 
     def is_in_parfile(self,para_dict):
         """ Check if this subclass included in parfile.
@@ -1055,6 +1733,31 @@ class DelayComponent(Component):
         super(DelayComponent, self).__init__()
         self.delay_funcs_component = []
 
+    def d_delay_d_params(self, toas, params, acc_delay=None):
+        """Return the derivatives of this component's delay with respect to
+        a group of parameters.
+
+        Components can override this method to compute the derivatives of
+        several parameters in one pass, for instance when they share the
+        intermediate quantities.
+
+        Parameters
+        ----------
+        toas: TOAs table
+            The TOAs the derivatives are evaluated at.
+        params: list
+            Parameter names. All of them should have registered derivative
+            functions in this component.
+        acc_delay: numpy.ndarray, optional
+            The accumulated delay passed to the derivative functions.
+
+        Return
+        ----------
+        A dictionary maps parameter name to the derivative quantity in the
+        unit of second/parameter unit.
+        """
+        return self._d_params(toas, params, acc_delay, u.s)
+
 
 class PhaseComponent(Component):
     def __init__(self,):
@@ -1062,6 +1765,27 @@ class PhaseComponent(Component):
         self.phase_funcs_component = []
         self.phase_derivs_wrt_delay = []
 
+    def d_phase_d_params(self, toas, params, delay):
+        """Return the derivatives of this component's phase with respect to
+        a group of parameters.
+
+        Parameters
+        ----------
+        toas: TOAs table
+            The TOAs the derivatives are evaluated at.
+        params: list
+            Parameter names. All of them should have registered derivative
+            functions in this component.
+        delay: numpy.ndarray
+            The total delay from the delay components.
+
+        Return
+        ----------
+        A dictionary maps parameter name to the derivative quantity in the
+        unit of cycle/parameter unit.
+        """
+        return self._d_params(toas, params, delay, u.cycle)
+
 
 class TimingModelError(Exception):
     """Generic base class for timing model errors."""
@@ -1086,3 +1810,128 @@ class MissingParameter(TimingModelError):
         if self.msg is not None:
             result += "\n  " + self.msg
         return result
+
+
+def toas_table_token(toas):
+    """Return a hashable identity of the content of a TOAs table.
+
+    It is used to validate the cached TOA-dependent arrays, such as the
+    constant derivatives. It is made of the version stamps of the columns
+    that the TOA selections and the derivatives are computed from, so it
+    costs O(1) in the number of TOAs (see pint.toa_select.column_version).
+    """
+    token = [len(toas)]
+    for col in ['mjd_float', 'freq', 'tdbld', 'obs', 'flags', 'ssb_obs_vel']:
+        if col not in toas.colnames:
+            continue
+        if hasattr(toas[col], 'meta'):
+            token.append(column_version(toas[col]))
+        else:
+            token.append(hash(np.ascontiguousarray(toas[col]).tobytes()))
+    return tuple(token)
+
+
+def toas_fingerprint(toas):
+    """Return a digest of the TOA MJDs and frequencies of a table.
+
+    Unlike `toas_table_token()`, it is the same in all the processes, so a
+    pool worker can check that its TOAs are the ones a task was made for. It
+    is recomputed only when the TOAs change.
+    """
+    token = toas_table_token(toas)
+    cache = column_cache(toas['mjd_float'])
+    cached = cache.get('fingerprint')
+    if cached is not None and cached[0] == token:
+        return cached[1]
+    digest = hashlib.sha1(str(len(toas)).encode())
+    for col in ['mjd_float', 'freq']:
+        if col in toas.colnames:
+            digest.update(np.ascontiguousarray(toas[col],
+                                               dtype=np.float64).tobytes())
+    fingerprint = digest.hexdigest()
+    cache['fingerprint'] = (token, fingerprint)
+    return fingerprint
+
+
+def _evaluate_model(model, toas, quantity):
+    """Evaluate the phase, as (int, frac) longdouble arrays, or the delay."""
+    if quantity == 'phase':
+        ph = model.phase(toas)
+        return (np.asarray(ph.int.value, dtype=np.longdouble),
+                np.asarray(ph.frac.value, dtype=np.longdouble))
+    return np.asarray(model.delay(toas).to(u.second).value,
+                      dtype=np.longdouble)
+
+
+def _num_deriv_task(task):
+    """Evaluate a shifted parameter state in a worker process."""
+    state, quantity, check = task
+    model = get_worker_model(state)
+    return _evaluate_model(model, _checked_worker_table(check), quantity)
+
+
+def _checked_worker_table(check):
+    """Return the TOA table of the worker process, after checking that it
+    has the (number of TOAs, `toas_fingerprint()`) of the task.
+    """
+    toas = get_worker_table()
+    ntoas, fingerprint = check
+    if len(toas) != ntoas or toas_fingerprint(toas) != fingerprint:
+        raise ValueError("The TOAs of the pool workers are not the TOAs the "
+                         "model is evaluated at. Create the pool with "
+                         "make_pool() from these TOAs.")
+    return toas
+
+
+def _designmatrix_task(task):
+    """Compute the derivative columns of one component over TOA chunks.
+
+    The task is (model, toas, state, component name, derivative type,
+    parameters, chunk bounds, delay, check). If model is None, the model and
+    TOA table of the worker process are used, the model is updated with the
+    state and the table is checked against check (see
+    `_checked_worker_table()`).
+    """
+    model, toas, state, comp_name, dtype, params, bounds, delay, check = task
+    if model is None:
+        model = get_worker_model(state)
+        toas = _checked_worker_table(check)
+        offset = bounds[0][0]
+    else:
+        offset = 0
+    cp = model.components[comp_name]
+    ntoas = len(toas)
+    result = []
+    for st, ed in bounds:
+        if st == 0 and ed == ntoas:
+            tbl = toas
+        else:
+            tbl = toas[st:ed].group_by('obs')
+        dly = delay[st - offset:ed - offset]
+        if dtype == 'phase':
+            cols = cp.d_phase_d_params(tbl, params, dly)
+        else:
+            cols = cp.d_delay_d_params(tbl, params)
+        result.append(dict((p, np.asarray(c.value)) for p, c in cols.items()))
+    return result
+
+
+def _unpickle_timing_model(name, parfile_str, state, attrs=None):
+    """Rebuild a pickled TimingModel from its parfile string and snapshot."""
+    fd, parfile = tempfile.mkstemp(suffix='.par')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(parfile_str)
+        tm = model_builder.ModelBuilder(parfile, name).timing_model
+    finally:
+        os.remove(parfile)
+    tm.restore(state)
+    if attrs is not None:
+        for k, v in attrs.items():
+            setattr(tm, k, v)
+    return tm
+
+
+# model_builder imports this module, so it is imported once the classes above
+# are defined.
+from . import model_builder
@@ -5,7 +5,7 @@ All times are in days, distances in light-seconds, and masses in solar masses.
 from __future__ import division
 import collections
 import numpy as np
-from scipy.optimize import newton, fsolve
+from scipy.optimize import fsolve
 from scipy.linalg import block_diag
 import scipy.linalg
 
@@ -33,6 +33,82 @@ def true_from_eccentric(e, eccentric_anomaly):
     true_anomaly_prime = (np.sqrt(1-e**2)/(1-e*np.cos(eccentric_anomaly)))
     return true_anomaly, true_anomaly_de, true_anomaly_prime
 
+def _markley_start(e, mean_anomaly):
+    """Starting guess for Kepler's equation, Markley (1995), CeMDA 63, 101.
+
+    The mean anomaly must be in [0, pi]; the guess is good to about 1e-4
+    for all eccentricities in [0, 1).
+    """
+    pi2 = np.pi**2
+    alpha = (3*pi2 + 1.6*np.pi*(np.pi-mean_anomaly)/(1+e))/(pi2-6)
+    d = 3*(1-e) + alpha*e
+    q = 2*alpha*d*(1-e) - mean_anomaly**2
+    r = 3*alpha*d*(d-1+e)*mean_anomaly + mean_anomaly**3
+    w = (np.abs(r) + np.sqrt(q**3 + r**2))**(2./3)
+    return (2*r*w/(w**2 + w*q + q**2) + mean_anomaly)/d
+
+def solve_kepler(e, mean_anomaly, tol=1e-15, maxiter=20):
+    """Solve Kepler's equation E - e*sin(E) = M for the eccentric anomaly.
+
+    The mean anomaly is reduced to [-pi, pi], the solution is started from
+    Markley's guess and refined with Halley steps in double precision,
+    iterating only the elements that have not converged yet. If the mean
+    anomaly or the eccentricity is given in longdouble, a final Newton step
+    is done in longdouble, which brings the result to the full longdouble
+    precision.
+
+    Inputs:
+        e - the eccentricity, in [0, 1)
+        mean_anomaly - the mean anomaly in radians
+        tol - the convergence tolerance of the double precision iterations
+        maxiter - the maximum number of Halley steps; the steps of an
+            element stop earlier once its residual is at the rounding level
+
+    Outputs:
+        eccentric_anomaly - the eccentric anomaly in radians, in the dtype
+            of the inputs (at least float64)
+    """
+    e_in, ma_in = np.broadcast_arrays(np.asarray(e), np.asarray(mean_anomaly))
+    if np.any(e_in < 0) or np.any(e_in >= 1):
+        raise ValueError('Eccentricity should be in the range of [0,1).')
+    dtype = np.result_type(e_in.dtype, ma_in.dtype, np.float64)
+    ecc = np.array(e_in, dtype=np.float64, ndmin=1)
+    ma = np.array(ma_in, dtype=dtype, ndmin=1)
+    norbits = np.round(ma/(2*np.pi))
+    ma_red = (ma - norbits*(2*np.pi)).astype(np.float64)
+    sign = np.where(ma_red < 0, -1.0, 1.0)
+    ma_abs = np.abs(ma_red)
+    E = _markley_start(ecc, ma_abs)
+    eps = np.finfo(np.float64).eps
+    todo = np.arange(len(E))
+    last_step = np.full(len(E), np.inf)
+    for _ in range(maxiter):
+        Et, et = E[todo], ecc[todo]
+        esin, ecos = et*np.sin(Et), et*np.cos(Et)
+        f = Et - esin - ma_abs[todo]
+        fp = 1 - ecos
+        dE = -f/(fp + 0.5*f*esin/fp)
+        E[todo] = Et + dE
+        # Near periastron of very eccentric orbits fp is small and the
+        # rounding noise of f/fp can exceed tol, so an element is also done
+        # once its residual is at the rounding level or its steps stop
+        # getting smaller.
+        step = np.abs(dE)
+        done = ((step <= tol*np.maximum(1, np.abs(Et))) |
+                (np.abs(f) <= 4*eps*(np.abs(Et) + ma_abs[todo])) |
+                ((step >= last_step[todo]) & (step < 1e-8)))
+        last_step[todo] = step
+        todo = todo[~done]
+        if len(todo) == 0:
+            break
+    E = (sign*E).astype(dtype) + norbits*(2*np.pi)
+    if dtype != np.float64:
+        # One Newton step from a double precision solution is enough
+        # for the longdouble precision.
+        ecc = np.array(e_in, dtype=dtype, ndmin=1)
+        E = E - (E - ecc*np.sin(E) - ma)/(1 - ecc*np.cos(E))
+    return E.reshape(ma_in.shape)[()]
+
 def eccentric_from_mean(e, mean_anomaly):
     """Compute the eccentric anomaly from the mean anomaly.
 
@@ -44,10 +120,7 @@ def eccentric_from_mean(e, mean_anomaly):
         eccentric_anomaly - the true anomaly
         derivatives - pair of derivatives with respect to the two inputs
     """
-    eccentric_anomaly = newton(
-            lambda E: E-e*np.sin(E)-mean_anomaly,
-            mean_anomaly,
-            lambda E: 1-e*np.cos(E))
+    eccentric_anomaly = solve_kepler(e, mean_anomaly)
     eccentric_anomaly_de = (np.sin(eccentric_anomaly)
                              /(1-e*np.cos(eccentric_anomaly)))
     eccentric_anomaly_prime = (1-e*np.cos(eccentric_anomaly))**(-1)
@@ -0,0 +1,205 @@
+# parallel.py
+# Helpers for evaluating timing models in a process pool
+"""Process-pool helpers for PINT.
+
+A `TimingModel` pickles through its parfile representation plus a parameter
+snapshot (see `TimingModel.snapshot`), so it can be sent to worker processes.
+The TOA table is usually much larger than the model, so `SharedTOATable`
+writes its numeric columns once to memory-mapped files and the workers map
+the same pages instead of receiving a copy of the data with every task.
+
+The typical pattern is to send the model and the table once through the pool
+initializer and afterwards only send parameter snapshots::
+
+    shared = SharedTOATable(toas.table)
+    pool = make_pool(model, shared, processes=4)
+    results = pool.map(func, [model.snapshot() for i in range(10)])
+    pool.close()
+    shared.close()
+
+where `func(state)` calls `get_worker_model(state)` and `get_worker_table()`.
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import shutil
+import tempfile
+import multiprocessing
+import numpy as np
+from astropy import log
+from astropy.table import Table, Column
+from astropy.table.groups import TableGroups
+from six.moves import cPickle as pickle
+
+
+__all__ = ['SharedTOATable', 'make_pool', 'get_worker_model',
+           'get_worker_table']
+
+
+def _shared_dir():
+    """Prefer the RAM backed file system if it exists."""
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return None
+
+
+class SharedTOATable(object):
+    """A TOA table which can be handed to worker processes without copying.
+
+    Parameters
+    ----------
+    table: astropy.table.Table
+        The TOA table, normally `TOAs.table`. It should be grouped by 'obs'.
+    path: str, optional
+        The directory for the memory-mapped column files. Default is a new
+        temporary directory, in /dev/shm if it is available.
+
+    Notes
+    -----
+    Only the numeric and string columns are memory-mapped. Object columns
+    (e.g. 'mjd', 'tdb' and 'flags') are pickled with the handle. The table
+    returned by `attach()` is read only; a column added or changed by a
+    worker does not propagate back to the parent process.
+    """
+    def __init__(self, table, path=None):
+        self._owner = path is None
+        if path is None:
+            path = tempfile.mkdtemp(prefix='pint_toas_', dir=_shared_dir())
+        self.path = path
+        self.nrows = len(table)
+        self.meta = dict(table.meta)
+        self.columns = []
+        self.mapped = {}
+        self.objects = {}
+        for name in table.colnames:
+            col = table[name]
+            info = {'unit': col.unit, 'description': col.description,
+                    'meta': dict(col.meta)}
+            self.columns.append((name, info))
+            data = np.asarray(col)
+            if data.dtype.hasobject:
+                self.objects[name] = data
+                continue
+            fname = os.path.join(path, name + '.npy')
+            mm = np.lib.format.open_memmap(fname, mode='w+', dtype=data.dtype,
+                                           shape=data.shape)
+            mm[...] = data
+            mm.flush()
+            del mm
+            self.mapped[name] = fname
+        if table.groups.keys is not None:
+            self.group_keys = table.groups.keys.colnames
+            self.group_indices = np.array(table.groups.indices)
+        else:
+            self.group_keys = None
+            self.group_indices = None
+        self._table = None
+
+    def attach(self):
+        """Return an astropy Table view of the shared columns.
+
+        The groups of the original table are put back without sorting, since
+        sorting would copy the mapped data into the process memory.
+        """
+        if self._table is not None:
+            return self._table
+        cols = []
+        for name, info in self.columns:
+            if name in self.mapped:
+                data = np.load(self.mapped[name], mmap_mode='r')
+            else:
+                data = self.objects[name]
+            cols.append(Column(data, name=name, unit=info['unit'],
+                               description=info['description'],
+                               meta=info['meta'], copy=False))
+        tbl = Table(cols, meta=self.meta, copy=False)
+        if self.group_keys is not None:
+            keys = tbl[self.group_keys][self.group_indices[:-1]]
+            tbl._groups = TableGroups(tbl, indices=self.group_indices,
+                                      keys=keys)
+        self._table = tbl
+        return tbl
+
+    def close(self):
+        """Remove the column files. Only the creating process removes them.
+        """
+        self._table = None
+        if self._owner and os.path.isdir(self.path):
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_table'] = None
+        state['_owner'] = False
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+# Per-process state set by the pool initializer.
+_worker_model = None
+_worker_table = None
+
+
+def _init_worker(model_pickle, shared_table):
+    global _worker_model, _worker_table
+    _worker_model = pickle.loads(model_pickle)
+    _worker_table = shared_table
+
+
+def get_worker_model(state=None):
+    """Return the timing model of this worker process.
+
+    Parameters
+    ----------
+    state: dict, optional
+        A parameter snapshot from `TimingModel.snapshot()` to load into the
+        worker model before returning it.
+    """
+    if _worker_model is None:
+        raise RuntimeError("No timing model in this process. Was the pool "
+                           "created by make_pool()?")
+    if state is not None:
+        _worker_model.restore(state)
+    return _worker_model
+
+
+def get_worker_table():
+    """Return the TOA table of this worker process."""
+    if _worker_table is None:
+        raise RuntimeError("No TOA table in this process. Was the pool "
+                           "created by make_pool()?")
+    if isinstance(_worker_table, SharedTOATable):
+        return _worker_table.attach()
+    return _worker_table
+
+
+def make_pool(model, table=None, processes=None):
+    """Create a multiprocessing pool with the model and TOAs in every worker.
+
+    Parameters
+    ----------
+    model: TimingModel
+        The model is pickled once and rebuilt in each worker.
+    table: SharedTOATable or astropy.table.Table, optional
+        The TOA table for the workers. A plain Table is sent as a copy.
+    processes: int, optional
+        The number of worker processes. Default is the number of CPUs.
+
+    Return
+    ----------
+    A `multiprocessing.Pool`. The caller is responsible for closing it.
+    """
+    model_pickle = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+    log.debug("Pickled timing model size %d bytes." % len(model_pickle))
+    return multiprocessing.Pool(processes=processes, initializer=_init_worker,
+                                initargs=(model_pickle, table))
@@ -10,6 +10,7 @@ from collections import namedtuple
 import numpy
 import astropy.units as u
 from pint import dimensionless_cycles
+from .doubledouble import DDArray
 
 class Phase(namedtuple('Phase', 'int frac')):
     """
@@ -19,6 +20,10 @@ class Phase(namedtuple('Phase', 'int frac')):
     def __new__(cls, arg1, arg2=None):
         # Assume inputs are numerical, could add an extra
         # case to parse strings as input.
+        # A double-double phase (in cycles) is split into integer and
+        # fractional parts without loss of precision.
+        if isinstance(arg1, DDArray) and arg2 is None:
+            arg1, arg2 = arg1.split_int_frac()
         # if it is not a list, convert to a list
         if not hasattr(arg1, 'unit'):
             arg1 = arg1 * u.cycle
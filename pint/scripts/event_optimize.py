@@ -401,11 +401,9 @@ def main(argv=None):
     # Read in initial model
     modelin = pint.models.get_model(parfile)
 
-    # The custom_timing version below is to manually construct the TimingModel
-    # class, which allows it to be pickled. This is needed for parallelizing
-    # the emcee call over a number of threads.  So far, it isn't quite working
-    # so it is disabled.  The code above constructs the TimingModel class
-    # dynamically, as usual.
+    # TimingModel instances can now be pickled (they are rebuilt from their
+    # parfile and a parameter snapshot), see pint.parallel for pool helpers.
+    # The custom_timing version below is kept for reference only.
     #modelin = custom_timing(parfile)
 
     # Remove the dispersion delay as it is unnecessary
@@ -0,0 +1,61 @@
+#!/usr/bin/env python -W ignore::FutureWarning -W ignore::UserWarning -W ignore::DeprecationWarning
+"""Batch fitting of many pulsars with PINT
+
+The pulsars are given as a list file with a par file and a TOA file on each
+line (blank lines and lines starting with '#' are ignored). They are fitted
+over a process pool, the most TOAs first, and a summary table with the
+chi^2 and the timings of each fit is printed (or written with --summary).
+A pulsar that fails does not stop the others.
+"""
+from __future__ import division, print_function
+
+import os,sys
+import pint.batch
+import argparse
+
+from astropy import log
+
+def read_job_list(filename):
+    """Return the (parfile, timfile) pairs of a list file. Relative names
+    are relative to the directory of the list file.
+    """
+    base = os.path.dirname(filename)
+    pairs = []
+    for line in open(filename):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        k = line.split()
+        if len(k) != 2:
+            raise ValueError("Expected a par file and a TOA file in line "
+                             "'%s' of %s" % (line, filename))
+        pairs.append(tuple(os.path.join(base, f) for f in k))
+    return pairs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit many pulsars with PINT")
+    parser.add_argument("joblist",help="file with a par file and a TOA file name per line")
+    parser.add_argument("--outdir",help="Directory of the fitted par files (default=None)", default=None)
+    parser.add_argument("--summary",help="Output summary table file name (default=None)", default=None)
+    parser.add_argument("--processes",help="Number of processes (default=number of CPUs)", type=int, default=None)
+    parser.add_argument("--fitter",help="Fitter class in pint.fitter (default=WlsFitter)", default='WlsFitter')
+    parser.add_argument("--maxiter",help="Number of fit iterations (default=1)", type=int, default=1)
+    parser.add_argument("--ephem",help="Solar system ephemeris (default=DE421)", default='DE421')
+    parser.add_argument("--observatories",help="Observatory codes whose clock files each process reads before its first job", nargs='*', default=[])
+    args = parser.parse_args(argv)
+
+    pairs = read_job_list(args.joblist)
+    log.info("Fitting {0} pulsars".format(len(pairs)))
+    summary = pint.batch.fit_batch(pairs, processes=args.processes,
+                                   fitter=args.fitter, maxiter=args.maxiter,
+                                   ephem=args.ephem, outdir=args.outdir,
+                                   observatories=args.observatories)
+
+    if args.summary is not None:
+        summary.write(args.summary, format='ascii.ecsv', overwrite=True)
+    else:
+        summary.write(sys.stdout, format='ascii.fixed_width')
+    nfailed = sum(summary['status'] != 'ok')
+    if nfailed:
+        log.warn("{0} of {1} pulsars failed".format(nfailed, len(summary)))
+    return 0 if nfailed == 0 else 1
@@ -13,6 +13,7 @@ try:
 except ImportError:
     from astropy._erfa import DAYSEC as SECS_PER_DAY
 from .solar_system_ephemerides import objPosVel_wrt_SSB
+from .toa_select import bump_column_version
 from pint import ls, J2000, J2000ld
 from .config import datapath
 from astropy import log
@@ -28,7 +29,7 @@ JD_MJD = 2400000.5
 
 def get_TOAs(timfile, ephem="DE421", include_bipm=True, bipm_version='BIPM2015',
              include_gps=True, planets=False, usepickle=False,
-             tdb_method="astropy"):
+             tdb_method="astropy", model=None):
     """Convenience function to load and prepare TOAs for PINT use.
 
     Loads TOAs from a '.tim' file, applies clock corrections, computes
@@ -38,7 +39,14 @@ def get_TOAs(timfile, ephem="DE421", include_bipm=True, bipm_version='BIPM2015',
     Includes options to specify solar system ephemeris [default DE421],
     gps clock corrections [default=True], and BIPM clock corrections
     [default=True].
+
+    If a timing model is given, the planet positions are computed only if
+    the model needs them for the planetary Shapiro delay (PLANET_SHAPIRO),
+    instead of following the planets argument.
     """
+    if model is not None:
+        planet_shapiro = getattr(model, 'PLANET_SHAPIRO', None)
+        planets = planet_shapiro is not None and bool(planet_shapiro.value)
     updatepickle = False
     if usepickle:
         picklefile = _check_pickle(timfile)
@@ -56,7 +64,8 @@ def get_TOAs(timfile, ephem="DE421", include_bipm=True, bipm_version='BIPM2015',
     if 'tdb' not in t.table.colnames:
         log.info("Getting IERS params and computing TDBs.")
         t.compute_TDBs(method=tdb_method, ephem=ephem)
-    if 'ssb_obs_pos' not in t.table.colnames:
+    if 'ssb_obs_pos' not in t.table.colnames or \
+            (planets and 'obs_jupiter_pos' not in t.table.colnames):
         log.info("Computing observatory positions and velocities.")
         t.compute_posvels(ephem, planets)
     # Update pickle if needed:
@@ -118,7 +127,8 @@ def get_TOAs_list(toa_list,ephem="DE421", include_bipm=True,
     if 'tdb' not in t.table.colnames:
         log.info("Getting IERS params and computing TDBs.")
         t.compute_TDBs(method=tdb_method, ephem=ephem)
-    if 'ssb_obs_pos' not in t.table.colnames:
+    if 'ssb_obs_pos' not in t.table.colnames or \
+            (planets and 'obs_jupiter_pos' not in t.table.colnames):
         log.info("Computing observatory positions and velocities.")
         t.compute_posvels(ephem, planets)
     return t
@@ -554,6 +564,24 @@ class TOAs(object):
         else:
             log.warn("TOA selection not implemented for TOA lists.")
 
+    def append(self, other):
+        """Append the TOAs of another TOAs instance to the TOA table.
+
+        The other TOAs have to be processed the same way (clock corrections,
+        TDBs, positions and velocities, with or without planets), so that
+        the two tables have the same columns.
+        """
+        if set(self.table.colnames) != set(other.table.colnames):
+            raise ValueError("The TOA tables have different columns: %s" %
+                             sorted(set(self.table.colnames) ^
+                                    set(other.table.colnames)))
+        new = other.table.copy()
+        if 'index' in new.colnames and len(self.table) > 0:
+            new['index'] += self.table['index'].max() + 1
+        # Our TOA table must be grouped by observatory for phase calcs
+        self.table = table.vstack([self.table, new],
+                                  metadata_conflicts='silent').group_by('obs')
+
     def unselect(self):
         """Return to previous selected version of the TOA table (stored in stack)."""
         if hasattr(self, "table_selects") and len(self.table_selects):
@@ -611,10 +639,12 @@ class TOAs(object):
             raise ValueError('Shape of mjd column and delta must be compatible')
         for ii in range(len(col)):
             col[ii] = col[ii] + delta[ii]
+        bump_column_version(col)
 
         # This adjustment invalidates the derived columns in the table, so delete
         # and recompute them
         self.table['mjd_float'] = self.get_mjds(high_precision=False)
+        bump_column_version(self.table['mjd_float'])
         self.compute_TDBs()
         self.compute_posvels()
 
@@ -705,6 +735,8 @@ class TOAs(object):
             for jj in range(loind, hiind):
                 if corr[jj]:
                     flags[jj]['clkcorr'] = corr[jj]
+        bump_column_version(self.table['mjd'])
+        bump_column_version(flags)
 
     def compute_TDBs(self, method="astropy", ephem=None):
         """Compute and add TDB and TDB long double columns to the TOA table.
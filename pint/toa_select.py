@@ -1,5 +1,98 @@
 import numpy as np
 import copy
+import uuid
+import weakref
+
+
+class _ColumnStamp(object):
+    """The version stamp and the cached results of a column."""
+    def __init__(self, column):
+        key = id(column)
+
+        def forget(ref):
+            if getattr(_column_stamps.get(key), 'ref', None) is ref:
+                del _column_stamps[key]
+        self.ref = weakref.ref(column, forget)
+        self.uid = uuid.uuid4().hex
+        self.version = 0
+        # Results derived from the column, e.g. the shared TOA selections
+        self.results = {}
+
+
+# The stamps of the table columns, {id(column): _ColumnStamp}. They are kept
+# out of the column meta, which astropy copies along with the column, and an
+# entry only counts for the column object it refers to. Entries are removed
+# when their column is freed.
+_column_stamps = {}
+
+
+def _column_stamp(column):
+    stamp = _column_stamps.get(id(column))
+    if stamp is None or stamp.ref() is not column:
+        stamp = _ColumnStamp(column)
+        _column_stamps[id(column)] = stamp
+    return stamp
+
+
+def column_version(column):
+    """Return the version stamp of a TOA table column.
+
+    The stamp is a (uid, version) tuple. A column object gets a new uid when
+    it is first stamped, so copies and slices of a column (e.g. after a TOA
+    selection or deepcopy) never share the stamp of the original, and the
+    version is increased by bump_column_version() whenever the column is
+    changed in place. Comparing two stamps is O(1), independent of the
+    number of TOAs.
+
+    Parameter
+    ---------
+    column: toas.table column
+        An astropy table column.
+    """
+    stamp = _column_stamp(column)
+    return (stamp.uid, stamp.version)
+
+
+def bump_column_version(column):
+    """Mark a TOA table column as changed in place.
+
+    Any code that edits the values of a column in place, instead of
+    replacing the column, has to call this so the cached TOA selections are
+    recomputed.
+    """
+    stamp = _column_stamp(column)
+    stamp.version += 1
+    stamp.results = {}
+
+
+def column_cache(column):
+    """Return a dictionary for the results derived from a TOA table column.
+
+    The dictionary belongs to the column object: it is emptied when the
+    column is bumped by bump_column_version() and dropped with the column.
+    """
+    return _column_stamp(column).results
+
+
+def _group_index(column):
+    """Return a dictionary of the TOA indices for each value in a column."""
+    try:
+        keys, inverse = np.unique(np.asarray(column), return_inverse=True)
+    except TypeError:
+        # Object columns with mixed types, e.g. flag values with None.
+        groups = {}
+        for ii, v in enumerate(column):
+            groups.setdefault(v, []).append(ii)
+        return dict((k, np.array(v, dtype=int)) for k, v in groups.items())
+    if keys.dtype.kind == 'S':
+        keys = np.char.decode(keys)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind='mergesort')
+    bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+    return dict((k, order[bounds[ii]:bounds[ii + 1]])
+                for ii, k in enumerate(keys))
+
+
 class TOASelect(object):
     """
     This class is designed for select toas from toa table based on a given
@@ -20,6 +113,14 @@ class TOASelect(object):
         {'JUMP1': 'L-wide', ...}
 
     Putting an object as condition will slow the process dramtically.
+
+    The table columns are compared through their version stamps (see
+    column_version()). The selection results on a table column are kept
+    with its stamp and shared by all the TOASelect instances, so the mask
+    parameters that select on the same column and condition value compute
+    it once. They are dropped with the column or when it is changed in
+    place. The hash or the column copy is only used for the arrays that are
+    not table columns.
     """
     def __init__(self, is_range, use_hash=False):
         self.is_range = is_range
@@ -68,7 +169,14 @@ class TOASelect(object):
         True for column is the same as old one
         False for column has been changed.
         """
-        if self.use_hash:
+        if hasattr(new_column, 'meta'):
+            stamp = column_version(new_column)
+            if self.columns_info.get(new_column.name) == stamp:
+                return True
+            else:
+                self.columns_info[new_column.name] = stamp
+                return False
+        elif self.use_hash:
             if new_column.name not in self.hash_dict.keys():
                 self.hash_dict[new_column.name] = hash(new_column.tostring())
                 return False
@@ -110,7 +218,35 @@ class TOASelect(object):
             result[k] = index
         return result
 
+    def get_shared_select(self, condition, column):
+        """Get the selected toa index from the results shared between the
+        TOASelect instances, computing only the missing entries.
+        """
+        results = column_cache(column)
+        select = {}
+        if self.is_range:
+            for k, v in condition.items():
+                key = ('range', v)
+                if key not in results:
+                    results[key] = self.get_select_range({k: v}, column)[k]
+                select[k] = results[key]
+        else:
+            if 'groups' not in results:
+                results['groups'] = _group_index(column)
+            groups = results['groups']
+            for k, v in condition.items():
+                try:
+                    select[k] = groups.get(v, np.array([], dtype=int))
+                except TypeError:
+                    # Unhashable condition value
+                    select[k] = self.get_select_non_range({k: v}, column)[k]
+        return select
+
     def get_select_index(self, condition, column):
+        if hasattr(column, 'meta'):
+            select = self.get_shared_select(condition, column)
+            self.select_result.update(select)
+            return select
         # Check if condition get changed
         cd_unchg, cd_chg = self.check_condition(condition)
         # check if column get changed.
@@ -0,0 +1,41 @@
+"""Benchmark of the Taylor series evaluation of the spindown phase in
+longdouble (pint.utils.taylor_horner) and in double-double
+(pint.doubledouble.dd_taylor_horner).
+
+Run as
+    python bench_doubledouble.py [number of points]
+"""
+from __future__ import print_function, division
+import sys
+import time
+import numpy as np
+from pint.utils import taylor_horner
+from pint.doubledouble import DDArray, dd_taylor_horner
+
+
+def best_time(func, repeat=5):
+    best = np.inf
+    for ii in range(repeat):
+        t0 = time.time()
+        result = func()
+        best = min(best, time.time() - t0)
+    return best, result
+
+
+if __name__ == '__main__':
+    npoints = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rng = np.random.RandomState(0)
+    # Seconds from PEPOCH over a 20 year span, and F0, F1, F2 of a MSP
+    x_ld = rng.uniform(-3e8, 3e8, npoints).astype(np.longdouble) / 3
+    x_dd = DDArray.from_longdouble(x_ld)
+    coeffs = [0.0, 186.494081567, -6.2e-16, 1e-27]
+    coeffs_ld = [np.longdouble(c) for c in coeffs]
+
+    t_ld, r_ld = best_time(lambda: taylor_horner(x_ld, coeffs_ld))
+    t_dd, r_dd = best_time(lambda: dd_taylor_horner(x_dd, coeffs))
+    diff = np.abs(r_dd.to_longdouble() - r_ld).max()
+    print("Points:                   %d" % npoints)
+    print("longdouble taylor_horner: %.4f s" % t_ld)
+    print("dd_taylor_horner:         %.4f s" % t_dd)
+    print("Speed up:                 %.2f" % (t_ld / t_dd))
+    print("Max difference (cycles):  %.3g" % diff)
@@ -87,6 +87,7 @@ cmdclass.update(versioneer.get_cmdclass())
 console_scripts = [ 'photonphase=pint.scripts.photonphase:main',
                     'event_optimize=pint.scripts.event_optimize:main',
                     'pintempo=pint.scripts.pintempo:main', 
+                    'pintbatch=pint.scripts.pintbatch:main', 
                     'zima=pint.scripts.zima:main', 
                     'pintbary=pint.scripts.pintbary:main', 
                     'fermiphase=pint.scripts.fermiphase:main' ]
@@ -101,7 +102,7 @@ setup(
     url = 'https://github.com/nanograv/PINT',
     license = 'TBD',
 
-    install_requires = ['astropy>=1.3'],
+    install_requires = ['astropy>=1.3', 'numpy>=1.13'],
 
     entry_points={  
         'console_scripts': console_scripts, 
@@ -0,0 +1,60 @@
+"""Test the single-pass astrometric delay derivatives."""
+import os
+import unittest
+import numpy as np
+import astropy.units as u
+import pint.toa as toa
+from pint.models import get_model
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+class TestAstrometryPartials(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.toas = toa.get_TOAs('B1855+09_NANOGrav_9yv1.tim', ephem="DE421",
+                                planets=False, include_bipm=False)
+        # ELONG/ELAT and RAJ/DECJ models
+        cls.models = [get_model('B1855+09_NANOGrav_9yv1.gls.par'),
+                      get_model('B1855+09_NANOGrav_dfg+12_TAI_FB90.par')]
+
+    def test_delay(self):
+        for m in self.models:
+            cp = m.search_cmp_attr('sky_params')
+            delay = cp.astrometric_delay_and_partials(self.toas.table)[0]
+            assert np.all(delay == cp.solar_system_geometric_delay(
+                                          self.toas.table))
+
+    def test_against_numerical(self):
+        for m in self.models:
+            cp = m.search_cmp_attr('sky_params')
+            params = ['PX'] + cp.sky_params
+            jac = cp.astrometric_delay_and_partials(self.toas.table,
+                                                    params)[1]
+            assert list(jac.keys()) == params
+            for p in params:
+                par = getattr(m, p)
+                ori = par.value
+                h = 1e-8 if p in cp.sky_params[:2] else 1e-2
+                par.value = ori + h
+                dp = cp.solar_system_geometric_delay(self.toas.table)
+                par.value = ori - h
+                dm = cp.solar_system_geometric_delay(self.toas.table)
+                par.value = ori
+                num = ((dp - dm) / (2 * h)).value
+                scale = np.abs(jac[p].value).max()
+                assert np.abs(num - jac[p].value).max() < 1e-5 * scale, p
+
+    def test_d_delay_d_param(self):
+        m = self.models[1]
+        for p in ['RAJ', 'DECJ', 'PMRA', 'PMDEC', 'PX']:
+            single = getattr(m, 'd_delay_astrometry_d_' + p)(self.toas.table)
+            d = m.d_delay_d_param(self.toas.table, p)
+            scale = np.abs(d.value).max()
+            assert np.abs(d.value - single.to(d.unit).value).max() < \
+                1e-5 * scale, p
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""Test the cache of the binary model intermediate variables."""
+import os
+import unittest
+import numpy as np
+import pint.toa as toa
+from pint.models import get_model
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+class TestBinaryCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.parf = 'B1855+09_NANOGrav_9yv1.gls.par'
+        cls.timf = 'B1855+09_NANOGrav_9yv1.tim'
+        cls.toas = toa.get_TOAs(cls.timf, ephem="DE421", planets=False,
+                                include_bipm=False)
+        cls.model = get_model(cls.parf)
+        cls.binary = cls.model.components['BinaryDD']
+
+    def test_same_input_keeps_cache(self):
+        self.model.delay(self.toas.table)
+        bi = self.binary.binary_instance
+        version = bi.input_version
+        E = bi.E()
+        self.model.delay(self.toas.table)
+        assert bi.input_version == version
+        assert bi.E() is E
+
+    def test_changed_input_invalidates(self):
+        d1 = self.model.delay(self.toas.table)
+        bi = self.binary.binary_instance
+        version = bi.input_version
+        ecc = self.model.ECC.value
+        self.model.ECC.value = ecc * 1.1
+        try:
+            d2 = self.model.delay(self.toas.table)
+            assert bi.input_version > version
+            E2 = bi.E()
+            assert np.all(E2 == bi.compute_eccentric_anomaly(bi.ecc(),
+                                                              bi.M()))
+        finally:
+            self.model.ECC.value = ecc
+        d3 = self.model.delay(self.toas.table)
+        assert np.any(d1 != d2)
+        assert np.all(d1 == d3)
+
+    def test_derivative_unchanged(self):
+        d1 = self.model.d_delay_d_param(self.toas.table, 'A1')
+        d2 = self.model.d_delay_d_param(self.toas.table, 'A1')
+        assert np.all(d1 == d2)
+
+
+if __name__ == '__main__':
+    unittest.main()
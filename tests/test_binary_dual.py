@@ -0,0 +1,146 @@
+"""Test the dual number (forward-mode AD) binary delay derivatives."""
+import os
+import unittest
+import numpy as np
+import astropy.units as u
+import pint.toa as toa
+from pint import ls
+from pint.models import get_model
+from pint.dual import Dual, seed_duals
+from pint.models.stand_alone_psr_binaries.DD_model import DDmodel
+from pint.models.stand_alone_psr_binaries.BT_model import BTmodel
+from pint.models.stand_alone_psr_binaries.ELL1_model import ELL1model
+from pint.models.stand_alone_psr_binaries.ELL1H_model import ELL1Hmodel
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+def test_dual_arithmetic():
+    t = np.linspace(0, 10, 7)
+    f = lambda a, b: np.sin(a * t) * np.sqrt(1 + b**2) / (2 + np.cos(b)) + \
+        np.log(2 + a) - np.arctan(b * t)
+    a, b = seed_duals([0.3, 1.7])
+    r = f(a, b)
+    h = 1e-6
+    assert np.allclose(r.value, f(0.3, 1.7))
+    assert np.allclose(r.full_derivs()[0], (f(0.3 + h, 1.7) -
+                                            f(0.3 - h, 1.7)) / (2 * h))
+    assert np.allclose(r.full_derivs()[1], (f(0.3, 1.7 + h) -
+                                            f(0.3, 1.7 - h)) / (2 * h))
+
+
+class TestBinaryDual(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        t = np.linspace(53000, 56000, 500).astype(np.longdouble) * u.day
+        cls.dd_inputs = dict(barycentric_toa=t, PB=12.327 * u.day,
+                             A1=9.23 * ls, ECC=0.17, T0=54000.3 * u.day,
+                             OM=276.0 * u.deg, OMDOT=0.01 * u.deg / u.year,
+                             M2=0.26 * u.M_sun, SINI=0.999, GAMMA=1e-4 * u.s,
+                             EDOT=1e-15 / u.s, A1DOT=1e-14 * ls / u.s,
+                             A0=1e-6 * u.s, B0=2e-6 * u.s, DR=1e-5, DTH=2e-5)
+        cls.ell1_inputs = dict(barycentric_toa=t, PB=1.53 * u.day,
+                               A1=1.89 * ls, TASC=54000.1 * u.day,
+                               EPS1=1e-5, EPS2=-2e-5,
+                               EPS1DOT=1e-17 / u.s, EPS2DOT=2e-17 / u.s,
+                               A1DOT=1e-14 * ls / u.s)
+
+    def compare(self, model, inputs, params, reference=None):
+        model.update_input(**inputs)
+        delay, jac = model.binary_delay_and_jacobian_dual(params)
+        assert np.allclose(delay.to(u.s).value,
+                           model.binary_delay().to(u.s).value,
+                           rtol=0, atol=1e-12)
+        if reference is None:
+            reference = model.binary_delay_and_jacobian(params)[1]
+        for p in params:
+            ref = reference[p]
+            d = jac[p].to(ref.unit, equivalencies=u.dimensionless_angles())
+            scale = np.abs(ref.value).max()
+            assert np.abs(d.value - ref.value).max() <= 1e-6 * scale, p
+
+    def finite_difference(self, model, inputs, params, steps):
+        result = {}
+        for p in params:
+            plus = dict(inputs)
+            plus[p] = inputs[p] + steps[p]
+            minus = dict(inputs)
+            minus[p] = inputs[p] - steps[p]
+            model.update_input(**plus)
+            dp = model.binary_delay()
+            model.update_input(**minus)
+            dm = model.binary_delay()
+            result[p] = (dp - dm) / (2 * steps[p])
+        model.update_input(**inputs)
+        return result
+
+    def test_dd(self):
+        params = ['PB', 'A1', 'ECC', 'T0', 'OM', 'OMDOT', 'M2', 'SINI',
+                  'GAMMA', 'EDOT', 'A1DOT', 'A0', 'B0', 'DR', 'DTH']
+        self.compare(DDmodel(), self.dd_inputs, params)
+
+    def test_bt(self):
+        inputs = dict(self.dd_inputs)
+        for p in ['M2', 'SINI', 'A0', 'B0', 'DR', 'DTH']:
+            inputs.pop(p)
+        params = ['PB', 'ECC', 'OM', 'A1']
+        steps = {'PB': 1e-7 * u.day, 'ECC': 1e-7, 'OM': 1e-5 * u.deg,
+                 'A1': 1e-6 * ls}
+        model = BTmodel()
+        ref = self.finite_difference(model, inputs, params, steps)
+        self.compare(model, inputs, params, ref)
+
+    def test_ell1(self):
+        inputs = dict(self.ell1_inputs, M2=0.2 * u.M_sun, SINI=0.97)
+        params = ['A1', 'EPS1', 'EPS2', 'EPS1DOT', 'EPS2DOT', 'M2', 'SINI',
+                  'A1DOT']
+        self.compare(ELL1model(), inputs, params)
+
+    def test_ell1h(self):
+        inputs = dict(self.ell1_inputs, H3=3e-7 * u.s, STIGMA=0.6)
+        model = ELL1Hmodel()
+        model.fit_params = ['H3', 'STIGMA']
+        self.compare(model, inputs, ['PB', 'A1', 'TASC', 'EPS1', 'EPS2', 'H3'])
+
+    def test_use_dual(self):
+        model = DDmodel()
+        model.update_input(**self.dd_inputs)
+        jac = model.binary_delay_and_jacobian(['PB', 'ECC'])[1]
+        model.use_dual = True
+        jac_dual = model.binary_delay_and_jacobian(['PB', 'ECC'])[1]
+        for p in ['PB', 'ECC']:
+            assert np.allclose(jac_dual[p].to_value(jac[p].unit),
+                               jac[p].value, rtol=1e-6)
+
+
+class TestComponentDual(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = get_model('B1855+09_NANOGrav_9yv1.gls.par')
+        cls.toas = toa.get_TOAs('B1855+09_NANOGrav_9yv1.tim', ephem="DE421",
+                                planets=False, include_bipm=False)
+
+    def test_designmatrix(self):
+        binary = self.model.components['BinaryDD']
+        params = [p for p in binary.params if not getattr(self.model, p).frozen]
+        M = self.model.designmatrix(self.toas.table, params=params)[0]
+        binary.use_dual = True
+        try:
+            assert binary.binary_instance.use_dual
+            M_dual = self.model.designmatrix(self.toas.table, params=params)[0]
+        finally:
+            binary.use_dual = False
+        assert not binary.binary_instance.use_dual
+        for ii in range(1, M.shape[1]):
+            scale = np.abs(M[:, ii]).max()
+            assert np.abs(M_dual[:, ii] - M[:, ii]).max() <= 1e-6 * scale, \
+                params[ii - 1]
+
+    def test_no_phase_table(self):
+        with self.assertRaises(ValueError):
+            self.model.components['BinaryDD'].use_phase_table = True
+
+
+if __name__ == '__main__':
+    unittest.main()
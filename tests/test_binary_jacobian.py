@@ -0,0 +1,50 @@
+"""Test the single-pass binary delay derivatives."""
+import os
+import unittest
+import numpy as np
+import pint.toa as toa
+from pint.models import get_model
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+class TestBinaryJacobian(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.parf = 'B1855+09_NANOGrav_9yv1.gls.par'
+        cls.timf = 'B1855+09_NANOGrav_9yv1.tim'
+        cls.toas = toa.get_TOAs(cls.timf, ephem="DE421", planets=False,
+                                include_bipm=False)
+        cls.model = get_model(cls.parf)
+        cls.binary = cls.model.components['BinaryDD']
+
+    def test_against_single(self):
+        params = ['PB', 'A1', 'ECC', 'T0', 'OM', 'M2', 'SINI']
+        delay, jac = self.binary.binary_delay_and_jacobian(self.toas.table,
+                                                           params)
+        assert list(jac.keys()) == params
+        assert np.all(delay == self.binary.binarymodel_delay(self.toas.table))
+        for p in params:
+            d = self.binary.d_binary_delay_d_xxxx(self.toas.table, p, None)
+            assert np.allclose(jac[p].value,
+                               d.to(jac[p].unit).value, rtol=1e-12), p
+
+    def test_default_params(self):
+        jac = self.binary.binary_delay_and_jacobian(self.toas.table)[1]
+        free = [p for p in self.binary.params
+                if not getattr(self.model, p).frozen]
+        assert list(jac.keys()) == free
+
+    def test_designmatrix_columns(self):
+        M, params, units, _ = self.model.designmatrix(self.toas.table)
+        delay = self.model.delay(self.toas.table)
+        F0 = self.model.F0.value
+        for p in ['PB', 'A1', 'ECC']:
+            col = -self.model.d_phase_d_param(self.toas.table, delay, p)
+            ii = params.index(p)
+            assert np.allclose(M[:, ii], col.value / F0, rtol=1e-12), p
+
+
+if __name__ == '__main__':
+    unittest.main()
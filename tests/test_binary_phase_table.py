@@ -0,0 +1,90 @@
+"""Test the orbital phase table for the ELL1 type binary delays."""
+import os
+import unittest
+import numpy as np
+import astropy.units as u
+import pint.toa as toa
+from pint import ls
+from pint.models import get_model
+from pint.models.stand_alone_psr_binaries.ELL1_model import ELL1model
+from pint.models.stand_alone_psr_binaries.ELL1H_model import ELL1Hmodel
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+class TestPhaseTable(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        t = np.linspace(53000, 56000, 20000).astype(np.longdouble) * u.day
+        cls.inputs = dict(barycentric_toa=t, PB=1.53 * u.day,
+                          A1=1.89 * ls, TASC=54000.1 * u.day,
+                          EPS1=1e-5, EPS2=-2e-5, A1DOT=1e-14 * ls / u.s)
+
+    def compare(self, model, inputs):
+        model.update_input(**inputs)
+        exact = model.binary_delay()
+        model.use_phase_table = True
+        model.update_input(A1=1.8901 * ls)
+        model.update_input(**inputs)
+        tabulated = model.binary_delay()
+        table = model.phase_table
+        assert table is not None
+        assert table.error_bound <= model.phase_table_tol
+        err = np.abs((tabulated - exact).to_value(u.s)).max()
+        assert err <= table.error_bound.to_value(u.s)
+        # Only PB and TASC change: reuse the table
+        model.update_input(PB=1.5301 * u.day, TASC=54000.2 * u.day)
+        model.binary_delay()
+        assert model.phase_table is table
+        # The shape changes: rebuild
+        model.update_input(EPS1=2e-5)
+        model.binary_delay()
+        assert model.phase_table is not table
+
+    def test_ell1(self):
+        inputs = dict(self.inputs, M2=0.2 * u.M_sun, SINI=0.999)
+        self.compare(ELL1model(), inputs)
+
+    def test_ell1h(self):
+        inputs = dict(self.inputs, H3=3e-7 * u.s, STIGMA=0.6)
+        for ii in range(3):
+            model = ELL1Hmodel()
+            model.fit_params = ['H3', 'STIGMA']
+            model.ds_func = model.ds_func_list[ii]
+            self.compare(model, inputs)
+
+    def test_fallback(self):
+        model = ELL1model()
+        inputs = dict(self.inputs, M2=0.2 * u.M_sun, SINI=0.97,
+                      EPS1DOT=1e-17 / u.s)
+        model.update_input(**inputs)
+        exact = model.binary_delay()
+        model.use_phase_table = True
+        assert np.all(model.binary_delay() == exact)
+        assert model.phase_table is None
+
+
+class TestComponentPhaseTable(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = get_model('J0613-0200_NANOGrav_9yv1_ELL1H.gls.par')
+        cls.toas = toa.get_TOAs('J0613-0200_NANOGrav_9yv1.tim',
+                                ephem="DE421", planets=False)
+
+    def test_delay(self):
+        binary = self.model.components['BinaryELL1H']
+        exact = self.model.delay(self.toas.table)
+        binary.use_phase_table = True
+        try:
+            tabulated = self.model.delay(self.toas.table)
+            table = binary.binary_instance.phase_table
+        finally:
+            binary.use_phase_table = False
+        assert table is not None
+        err = np.abs((tabulated - exact).to_value(u.s)).max()
+        assert err <= table.error_bound.to_value(u.s)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""Test the structured noise covariance solvers."""
+import numpy as np
+import scipy.sparse as sparse
+from pint.covariance import ShermanMorrison, Woodbury, weighted_gram
+
+
+def make_noise(ntoa=300, nepoch=40):
+    np.random.seed(2)
+    nvec = np.random.uniform(0.5, 2.0, ntoa) * 1e-12
+    jvec = np.random.uniform(0.1, 3.0, nepoch) * 1e-12
+    index = np.random.randint(-1, nepoch, ntoa)
+    U = np.zeros((ntoa, nepoch))
+    U[index >= 0, index[index >= 0]] = 1
+    cov = np.diag(nvec) + np.dot(U * jvec, U.T)
+    return ShermanMorrison(nvec, jvec, index), cov, U
+
+
+def test_sherman_morrison():
+    sm, cov, U = make_noise()
+    cinv = np.linalg.inv(cov)
+    X = np.random.normal(size=(cov.shape[0], 5))
+    r = np.random.normal(size=cov.shape[0])
+    assert np.allclose(sm.solve(X), np.dot(cinv, X))
+    assert np.allclose(sm.solve(r), np.dot(cinv, r))
+    assert np.allclose(sm.inner(X), np.dot(X.T, np.dot(cinv, X)))
+    assert np.allclose(sm.inner(X, r), np.dot(X.T, np.dot(cinv, r)))
+    S = sparse.random(cov.shape[0], 4, density=0.1, format='csc')
+    assert np.allclose(sm.inner(S, X), np.dot(S.toarray().T, np.dot(cinv, X)))
+    assert np.allclose(sm.inner(X, S), np.dot(X.T, np.dot(cinv, S.toarray())))
+    assert np.isclose(sm.logdet(), np.linalg.slogdet(cov)[1])
+
+
+def test_epoch_offsets():
+    # The offsets are the ECORR basis coefficients of a fit with the basis
+    # in the design matrix and the ECORR variances as prior.
+    sm, cov, U = make_noise()
+    r = np.random.normal(size=cov.shape[0]) * 1e-6
+    dinv = 1.0 / sm.nvec
+    A = np.dot(U.T, dinv[:,None] * U) + np.diag(1.0 / sm.jvec)
+    b = np.linalg.solve(A, np.dot(U.T, dinv * r))
+    assert np.allclose(sm.epoch_offsets(r), np.dot(U, b), rtol=1e-8,
+                       atol=1e-20)
+
+
+def test_weighted_gram():
+    np.random.seed(3)
+    A = np.random.normal(size=(50, 3))
+    B = sparse.random(50, 4, density=0.2, format='csc')
+    w = np.random.uniform(size=50)
+    ref = np.dot(A.T, w[:,None] * B.toarray())
+    assert np.allclose(weighted_gram(A, B, w), ref)
+    assert np.allclose(weighted_gram(B, A, w), ref.T)
+    assert np.allclose(weighted_gram(A, A[:, 0], w),
+                       np.dot(A.T, w * A[:, 0]))
+
+
+def test_woodbury():
+    sm, cov, U = make_noise()
+    np.random.seed(4)
+    T = np.random.normal(size=(cov.shape[0], 6))
+    phi = np.random.uniform(1, 2, 6) * 1e-12
+    wb = Woodbury(sm, T, phi)
+    cov_full = cov + np.dot(T * phi, T.T)
+    cinv = np.linalg.inv(cov_full)
+    X = np.random.normal(size=(cov.shape[0], 3))
+    r = np.random.normal(size=cov.shape[0])
+    assert np.allclose(wb.inner(X), np.dot(X.T, np.dot(cinv, X)))
+    assert np.allclose(wb.inner(X, r), np.dot(X.T, np.dot(cinv, r)))
+    assert np.allclose(wb.solve(r), np.dot(cinv, r))
+    assert np.isclose(wb.logdet(), np.linalg.slogdet(cov_full)[1])
+    # Only the basis weights change
+    TNT = wb.TNT
+    wb.set_phi(phi * 2)
+    assert wb.TNT is TNT
+    cov_full = cov + np.dot(T * phi * 2, T.T)
+    assert np.isclose(wb.logdet(), np.linalg.slogdet(cov_full)[1])
+    assert np.allclose(wb.inner(X), np.dot(X.T, np.linalg.solve(cov_full, X)))
+
+
+def test_woodbury_sparse_basis():
+    # e.g. a quantization matrix of epochs overlapping the white noise ones
+    sm, cov, U = make_noise()
+    np.random.seed(6)
+    T = np.random.normal(size=(cov.shape[0], 3))
+    T = np.hstack((T, U[:, ::-1]))
+    phi = np.random.uniform(1, 2, T.shape[1]) * 1e-12
+    dense = Woodbury(sm, T, phi)
+    wb = Woodbury(sm, sparse.csr_matrix(T), phi)
+    X = np.random.normal(size=(cov.shape[0], 3))
+    r = np.random.normal(size=cov.shape[0])
+    assert np.allclose(wb.inner(X), dense.inner(X))
+    assert np.allclose(wb.dot(X), dense.dot(X))
+    assert np.allclose(wb.solve(r), dense.solve(r))
+    assert np.isclose(wb.logdet(), dense.logdet())
+    assert np.allclose(wb.noise_realization(r), dense.noise_realization(r))
+
+
+def test_noise_realization():
+    # The noise realization is what a fit of the basis and epoch
+    # coefficients, with their prior variances, would subtract.
+    sm, cov, U = make_noise()
+    np.random.seed(5)
+    T = np.random.normal(size=(cov.shape[0], 4))
+    phi = np.random.uniform(1, 2, 4) * 1e-12
+    wb = Woodbury(sm, T, phi)
+    r = np.random.normal(size=cov.shape[0]) * 1e-6
+    A = np.hstack((T, U))
+    dinv = 1.0 / sm.nvec
+    prior = np.diag(1.0 / np.concatenate((phi, sm.jvec)))
+    b = np.linalg.solve(np.dot(A.T, dinv[:,None] * A) + prior,
+                        np.dot(A.T, dinv * r))
+    assert np.allclose(wb.noise_realization(r), np.dot(A, b), rtol=1e-8,
+                       atol=1e-20)
+
+
+def test_dot():
+    sm, cov, U = make_noise()
+    np.random.seed(6)
+    T = np.random.normal(size=(cov.shape[0], 4))
+    phi = np.random.uniform(1, 2, 4) * 1e-12
+    wb = Woodbury(sm, T, phi)
+    cov_full = cov + np.dot(T * phi, T.T)
+    X = np.random.normal(size=(cov.shape[0], 3))
+    r = np.random.normal(size=cov.shape[0])
+    assert np.allclose(sm.dot(X), np.dot(cov, X), rtol=1e-10, atol=0)
+    assert np.allclose(sm.dot(r), np.dot(cov, r), rtol=1e-10, atol=0)
+    assert np.allclose(wb.dot(X), np.dot(cov_full, X), rtol=1e-10, atol=0)
+    assert np.allclose(wb.solve(wb.dot(r)), r)
@@ -0,0 +1,74 @@
+"""Test the cache of the constant derivative columns."""
+import os
+import unittest
+import numpy as np
+import pint.toa as toa
+from pint.models import get_model
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+class TestDerivCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.parf = 'B1855+09_NANOGrav_9yv1.gls.par'
+        cls.timf = 'B1855+09_NANOGrav_9yv1.tim'
+        cls.toas = toa.get_TOAs(cls.timf, ephem="DE421", planets=False,
+                                include_bipm=False)
+        cls.model = get_model(cls.parf)
+
+    def test_dmx_cached(self):
+        dmx = self.model.components['DispersionDMX']
+        assert 'DMX_0001' in dmx.constant_deriv_params
+        dmx.clear_column_cache()
+        d1 = self.model.d_delay_d_param(self.toas.table, 'DMX_0001')
+        assert ('deriv', 'DMX_0001') in dmx._column_cache
+        d2 = self.model.d_delay_d_param(self.toas.table, 'DMX_0001')
+        assert np.all(d1 == d2)
+
+    def test_dmx_range_change(self):
+        dmx = self.model.components['DispersionDMX']
+        d1 = self.model.d_delay_d_param(self.toas.table, 'DMX_0001')
+        r2 = self.model.DMXR2_0001.value
+        self.model.DMXR2_0001.value = self.model.DMXR1_0001.value
+        try:
+            d2 = self.model.d_delay_d_param(self.toas.table, 'DMX_0001')
+            dmx.clear_column_cache()
+            d3 = self.model.d_delay_d_param(self.toas.table, 'DMX_0001')
+        finally:
+            self.model.DMXR2_0001.value = r2
+        assert np.all(d2 == d3)
+        assert np.count_nonzero(d2.value) < np.count_nonzero(d1.value)
+
+    def test_astrometry_change(self):
+        # The DMX derivatives depend on the astrometry through the
+        # barycentric frequencies
+        dmx = self.model.components['DispersionDMX']
+        d1 = self.model.d_delay_d_param(self.toas.table, 'DMX_0001')
+        pmra = self.model.PMRA.value
+        self.model.PMRA.value = pmra + 1e6
+        try:
+            d2 = self.model.d_delay_d_param(self.toas.table, 'DMX_0001')
+            dmx.clear_column_cache()
+            d3 = self.model.d_delay_d_param(self.toas.table, 'DMX_0001')
+        finally:
+            self.model.PMRA.value = pmra
+        assert np.all(d2 == d3)
+        assert np.any(d2 != d1)
+
+    def test_toas_change(self):
+        d1 = self.model.d_delay_d_param(self.toas.table, 'DMX_0001')
+        sub = self.toas.table[:100].group_by('obs')
+        d2 = self.model.d_delay_d_param(sub, 'DMX_0001')
+        assert len(d2) == 100
+        assert np.all(d1[:100] == d2)
+
+    def test_designmatrix_repeat(self):
+        M1 = self.model.designmatrix(self.toas.table)[0]
+        M2 = self.model.designmatrix(self.toas.table)[0]
+        assert np.all(M1 == M2)
+
+
+if __name__ == '__main__':
+    unittest.main()
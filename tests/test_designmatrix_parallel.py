@@ -0,0 +1,77 @@
+"""Test the chunked and pooled design matrix against the serial one."""
+import os
+import unittest
+import numpy as np
+from multiprocessing.pool import ThreadPool
+import pint.toa as toa
+from pint.models import get_model
+from pint.parallel import SharedTOATable, make_pool
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+class TestDesignMatrixParallel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.parf = 'B1855+09_NANOGrav_9yv1.gls.par'
+        cls.timf = 'B1855+09_NANOGrav_9yv1.tim'
+        cls.toas = toa.get_TOAs(cls.timf, ephem="DE421", planets=False,
+                                include_bipm=False)
+        cls.model = get_model(cls.parf)
+        cls.M, cls.params, cls.units, _ = \
+            cls.model.designmatrix(cls.toas.table)
+
+    def test_column_by_column(self):
+        delay = self.model.delay(self.toas.table)
+        F0 = self.model.F0.value
+        for ii, p in enumerate(self.params):
+            if p == 'Offset':
+                continue
+            col = -self.model.d_phase_d_param(self.toas.table, delay, p)
+            assert np.allclose(self.M[:, ii], col.value / F0,
+                               rtol=1e-12, atol=0), p
+
+    def test_chunked(self):
+        M, params, units, _ = self.model.designmatrix(self.toas.table,
+                                                      chunk_size=1000)
+        assert params == self.params
+        assert np.allclose(M, self.M, rtol=1e-10, atol=1e-20)
+
+    def test_thread_pool(self):
+        pool = ThreadPool(2)
+        try:
+            M, params, units, _ = self.model.designmatrix(self.toas.table,
+                                                          pool=pool,
+                                                          chunk_size=2000)
+        finally:
+            pool.close()
+        assert np.allclose(M, self.M, rtol=1e-10, atol=1e-20)
+
+    def test_process_pool(self):
+        with SharedTOATable(self.toas.table) as shared:
+            pool = make_pool(self.model, shared, processes=2)
+            try:
+                M, params, units, _ = \
+                    self.model.designmatrix(self.toas.table, pool=pool,
+                                            chunk_size=2000)
+            finally:
+                pool.close()
+                pool.join()
+        assert np.allclose(M, self.M, rtol=1e-10, atol=1e-20)
+
+    def test_process_pool_other_toas(self):
+        # The workers hold the full table, not the selected TOAs
+        sub = self.toas.table[:1000].group_by('obs')
+        with SharedTOATable(self.toas.table) as shared:
+            pool = make_pool(self.model, shared, processes=2)
+            try:
+                with self.assertRaises(ValueError):
+                    self.model.designmatrix(sub, pool=pool)
+            finally:
+                pool.close()
+                pool.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""Test the double-double arithmetic and the double-double phase backend."""
+import os
+import math
+import unittest
+from fractions import Fraction
+import numpy as np
+import pint.toa as toa
+from pint.models import get_model
+from pint.doubledouble import DDArray, two_sum, two_prod, dd_taylor_horner, \
+    tdb_dd
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+def exact(x, i):
+    return Fraction(float(x.hi[i])) + Fraction(float(x.lo[i]))
+
+
+def test_error_free_transformations():
+    rng = np.random.RandomState(0)
+    a = rng.uniform(-1e8, 1e8, 50)
+    b = rng.uniform(-1e-3, 1e-3, 50)
+    s, e = two_sum(a, b)
+    p, f = two_prod(a, b)
+    for i in range(50):
+        assert Fraction(s[i]) + Fraction(e[i]) == \
+            Fraction(a[i]) + Fraction(b[i])
+        assert Fraction(p[i]) + Fraction(f[i]) == \
+            Fraction(a[i]) * Fraction(b[i])
+
+
+def test_arithmetic():
+    rng = np.random.RandomState(1)
+    a = DDArray(rng.uniform(-1e5, 1e5, 50), rng.uniform(-1e-12, 1e-12, 50))
+    b = DDArray(rng.uniform(1, 1e3, 50), rng.uniform(-1e-14, 1e-14, 50))
+    ops = [lambda x, y: x + y, lambda x, y: x - y,
+           lambda x, y: x * y, lambda x, y: x / y]
+    for op in ops:
+        r = op(a, b)
+        for i in range(50):
+            e = op(exact(a, i), exact(b, i))
+            assert abs(float((exact(r, i) - e) / e)) < 1e-30
+
+
+def test_taylor_horner_and_split():
+    x = DDArray(np.array([1.0e8, -3.0e8]), np.array([1e-9, 0.0]))
+    coeffs = [0.0, 186.494081567, -6.2e-16, 1e-27]
+    r = dd_taylor_horner(x, coeffs)
+    for i in range(2):
+        xi = exact(x, i)
+        e = sum(Fraction(c) * xi**n / math.factorial(n)
+                for n, c in enumerate(coeffs))
+        assert abs(float(exact(r, i) - e)) < 1e-14
+    # Several blocks
+    r2 = dd_taylor_horner(x[[0, 1, 0]], coeffs, block_size=2)
+    assert np.all(r2.hi == r.hi[[0, 1, 0]])
+    assert np.all(r2.lo == r.lo[[0, 1, 0]])
+    ii, ff = r.split_int_frac()
+    assert np.all(np.abs(ff) <= 0.5)
+    assert np.all(ii == np.rint(ii))
+
+
+class TestDDBackend(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.parf = 'B1855+09_NANOGrav_9yv1.gls.par'
+        cls.timf = 'B1855+09_NANOGrav_9yv1.tim'
+        cls.toas = toa.get_TOAs(cls.timf, ephem="DE421", planets=False,
+                                include_bipm=False)
+        cls.model = get_model(cls.parf)
+
+    def test_tdb_dd(self):
+        assert 'tdb_hi' not in self.toas.table.colnames
+        tdb = tdb_dd(self.toas.table)
+        assert tdb_dd(self.toas.table) is tdb
+        diff = tdb.to_longdouble() - self.toas.table['tdbld']
+        assert np.abs(diff).max() * 86400 < 1e-9
+
+    def test_phase(self):
+        ph_ld = self.model.phase(self.toas.table)
+        self.model.phase_backend = 'dd'
+        try:
+            ph_dd = self.model.phase(self.toas.table)
+        finally:
+            self.model.phase_backend = 'longdouble'
+        assert np.all(ph_ld.int.value == ph_dd.int.value)
+        assert np.abs(ph_ld.frac.value - ph_dd.frac.value).max() < 1e-7
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""Test the index form of the ECORR quantization matrix."""
+import os
+import unittest
+import numpy as np
+import pint.toa as toa
+from pint.models import get_model
+from pint.models.noise_model import quantization_index, \
+    create_quantization_matrix
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+def loop_quantization_matrix(toas, dt=1, nmin=2):
+    # The per-TOA loop the quantization matrix used to be built with
+    isort = np.argsort(toas)
+    bucket_ref = [toas[isort[0]]]
+    bucket_ind = [[isort[0]]]
+    for i in isort[1:]:
+        if toas[i] - bucket_ref[-1] < dt:
+            bucket_ind[-1].append(i)
+        else:
+            bucket_ref.append(toas[i])
+            bucket_ind.append([i])
+    bucket_ind2 = [ind for ind in bucket_ind if len(ind) >= nmin]
+    U = np.zeros((len(toas), len(bucket_ind2)), 'd')
+    for i, l in enumerate(bucket_ind2):
+        U[l, i] = 1
+    return U
+
+
+def test_quantization_index():
+    np.random.seed(1)
+    for dt in [0.5, 1, 3]:
+        # Chains of TOAs closer than dt, longer than dt in total
+        t = np.random.permutation(np.round(np.random.uniform(0, 50, 300), 1))
+        for nmin in [1, 2, 3]:
+            U = create_quantization_matrix(t, dt, nmin)
+            assert np.all(U == loop_quantization_matrix(t, dt, nmin))
+            index, nepoch = quantization_index(t, dt, nmin)
+            assert nepoch == U.shape[1]
+            assert np.all(index[U.sum(axis=1) == 0] == -1)
+
+
+class TestEcorrEpochs(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = get_model('B1855+09_NANOGrav_9yv1.gls.par')
+        cls.toas = toa.get_TOAs('B1855+09_NANOGrav_9yv1.tim', ephem="DE421",
+                                planets=False, include_bipm=False)
+        cls.cp = cls.model.components['EcorrNoise']
+
+    def test_basis(self):
+        U, weight = self.cp.ecorr_basis_weight_pair(self.toas.table)
+        Us, weight_s = self.cp.ecorr_basis_sparse(self.toas.table)
+        assert np.all(Us.toarray() == U)
+        assert np.all(weight_s == weight)
+        assert np.all(U.sum(axis=1) <= 1)
+        t = self.toas.table['tdbld'].astype(float) * 86400.0
+        nctot = 0
+        for ec in self.cp.get_ecorrs():
+            mask = ec.select_toa_mask(self.toas.table)
+            Uec = loop_quantization_matrix(t[mask])
+            nn = Uec.shape[1]
+            assert np.all(U[mask, nctot:nctot + nn] == Uec)
+            nctot += nn
+        assert nctot == U.shape[1]
+
+    def test_cache(self):
+        epochs = self.cp.ecorr_epochs(self.toas.table)
+        ec = self.cp.get_ecorrs()[0]
+        old = ec.key_value
+        ec.key_value = ['L-wide_PUPPI']
+        assert not np.array_equal(self.cp.ecorr_epochs(self.toas.table),
+                                  epochs)
+        ec.key_value = old
+        assert np.all(self.cp.ecorr_epochs(self.toas.table) == epochs)
+
+
+if __name__ == '__main__':
+    unittest.main()
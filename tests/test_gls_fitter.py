@@ -1,5 +1,6 @@
 #! /usr/bin/env python
 import time, sys, os, unittest
+import tempfile
 import pint.models.model_builder as mb
 from pint.phase import Phase
 from pint import toa
@@ -11,6 +12,20 @@ import json
 from pinttestdata import testdir, datadir
 
 os.chdir(datadir)
+
+def overlapping_ecorr_model(parfile):
+    """Return the model of parfile with an ECORR on the L-wide receiver,
+    which overlaps the ECORRs of the L-wide receiver and backend pairs."""
+    with open(parfile) as f:
+        par = f.read() + 'ECORR -fe L-wide 0.5\n'
+    fd, name = tempfile.mkstemp(suffix='.par')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(par)
+        return mb.get_model(name)
+    finally:
+        os.remove(name)
+
 class TestGLS(unittest.TestCase):
     """Compare delays from the dd model with tempo and PINT"""
     @classmethod
@@ -52,3 +67,57 @@ class TestGLS(unittest.TestCase):
         self.fit(full_cov=True)
         chi22 = self.f.resids.chi2
         assert np.allclose(chi21, chi22)
+
+    def test_epoch_blocks(self):
+        self.f.reset_model()
+        chi21 = self.f.fit_toas()
+        values = self.f.get_fitparams_num()
+        self.f.reset_model()
+        chi22 = self.f.fit_toas(epoch_blocks=True)
+        assert np.allclose(chi21, chi22)
+        for p, v in values.items():
+            par = getattr(self.f.model, p)
+            assert np.abs(par.value - v) < 1e-3 * par.uncertainty.value, p
+
+    def test_woodbury(self):
+        self.f.reset_model()
+        chi21 = self.f.fit_toas()
+        values = self.f.get_fitparams_num()
+        for epoch_blocks in [False, True]:
+            self.f.reset_model()
+            chi22 = self.f.fit_toas(woodbury=True, epoch_blocks=epoch_blocks)
+            assert np.allclose(chi21, chi22)
+            for p, v in values.items():
+                par = getattr(self.f.model, p)
+                assert np.abs(par.value - v) < 1e-3 * par.uncertainty.value, p
+
+    def test_overlapping_ecorr(self):
+        m = overlapping_ecorr_model(self.par)
+        t = self.t.table
+        assert not m.epoch_blocks_available(t)
+        f = GLSFitter(self.t, m)
+        f.update_resids()
+        r = f.resids.time_resids.to(u.s).value
+        # The dense covariance fit
+        M = f.get_designmatrix()[0]
+        M = M / np.sqrt(np.sum(M**2, axis=0))
+        C = m.covariance_matrix(t)
+        cinv_M = np.linalg.solve(C, M)
+        xhat = np.linalg.solve(np.dot(M.T, cinv_M), np.dot(cinv_M.T, r))
+        newres = r - np.dot(M, xhat)
+        chi2 = f.fit_toas(full_cov=True)
+        assert np.isclose(chi2, np.dot(newres, np.linalg.solve(C, newres)))
+
+    def test_chunks(self):
+        for kwargs in [{}, {'woodbury': True, 'epoch_blocks': True}]:
+            self.f.reset_model()
+            chi21 = self.f.fit_toas(**kwargs)
+            values = self.f.get_fitparams_num()
+            errors = self.f.get_fitparams_uncertainty()
+            self.f.reset_model()
+            chi22 = self.f.fit_toas(chunk_size=1000, **kwargs)
+            assert np.allclose(chi21, chi22)
+            for p, v in values.items():
+                par = getattr(self.f.model, p)
+                assert np.abs(par.value - v) < 1e-6 * par.uncertainty.value, p
+                assert np.isclose(par.uncertainty_value, errors[p]), p
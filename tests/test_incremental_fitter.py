@@ -0,0 +1,68 @@
+"""Test the incremental fitter against a fit of all the TOAs."""
+import os
+import copy
+import unittest
+import numpy as np
+import pint.toa as toa
+from pint.models import get_model
+from pint.fitter import WlsFitter, IncrementalFitter
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+class TestIncrementalFitter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = get_model('B1855+09_NANOGrav_dfg+12_TAI_FB90.par')
+        cls.toas = toa.get_TOAs('B1855+09_NANOGrav_dfg+12.tim', ephem='DE405')
+        for p in cls.model.params:
+            getattr(cls.model, p).frozen = p not in ['F0', 'F1', 'DM', 'PX']
+        cls.full = WlsFitter(cls.toas, cls.model)
+        cls.full.fit_toas(maxiter=2)
+
+    def split_toas(self, ncut):
+        mjds = self.toas.table['mjd_float']
+        cut = np.sort(mjds)[ncut]
+        old = copy.deepcopy(self.toas)
+        old.select(mjds < cut)
+        new = copy.deepcopy(self.toas)
+        new.select(mjds >= cut)
+        return old, new
+
+    def test_add_toas(self):
+        old, new = self.split_toas(self.toas.ntoas - 60)
+        f = IncrementalFitter(old, self.full.model, chunk_size=200)
+        f.fit_toas()
+        # Three sessions of 20 TOAs
+        mjds = new.table['mjd_float']
+        edges = np.sort(mjds)[[0, 20, 40]]
+        for lo, hi in zip(edges, list(edges[1:]) + [np.inf]):
+            part = copy.deepcopy(new)
+            part.select((mjds >= lo) & (mjds < hi))
+            f.add_toas(part)
+        assert f.toas.ntoas == self.toas.ntoas
+        for p in ['F0', 'F1', 'DM', 'PX']:
+            par = getattr(f.model, p)
+            ref = getattr(self.full.model, p)
+            assert np.abs(par.value - ref.value) < 1e-3 * ref.uncertainty_value, p
+            assert np.isclose(par.uncertainty_value, ref.uncertainty_value,
+                              rtol=1e-6), p
+        f.update_resids()
+        assert np.isclose(f.resids.chi2, self.full.resids.chi2, rtol=1e-4)
+
+    def test_relinearize(self):
+        old, new = self.split_toas(self.toas.ntoas // 2)
+        f = IncrementalFitter(old, self.full.model, tolerance=1e-3)
+        f.fit_toas()
+        model_lin = f.model_lin
+        f.add_toas(new)
+        assert f.model_lin is not model_lin
+        for p in ['F0', 'F1', 'DM', 'PX']:
+            par = getattr(f.model, p)
+            ref = getattr(self.full.model, p)
+            assert np.abs(par.value - ref.value) < 1e-2 * ref.uncertainty_value, p
+
+
+if __name__ == '__main__':
+    unittest.main()
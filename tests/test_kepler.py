@@ -94,3 +94,32 @@ def test_kepler_two_body_inverse():
 
     assert_allclose(p, p2, atol=1e-8)
 
+
+def test_solve_kepler():
+    rng = np.random.RandomState(0)
+    e = rng.uniform(0, 0.999999, 1000)
+    ma = rng.uniform(-100, 100, 1000)
+    E = kepler.solve_kepler(e, ma)
+    assert_allclose(E - e*np.sin(E), ma, rtol=0, atol=1e-13)
+    ma_ld = ma.astype(np.longdouble)
+    E_ld = kepler.solve_kepler(e, ma_ld)
+    assert E_ld.dtype == np.longdouble
+    assert np.all(np.abs(E_ld - e*np.sin(E_ld) - ma_ld) <=
+                  100*np.finfo(np.longdouble).eps*np.abs(ma_ld).max())
+
+def test_solve_kepler_high_eccentricity():
+    # Near periastron the rounding noise of the steps is larger than tol
+    e = np.array([0.99, 0.99, 0.999])
+    ma = np.array([0.0018606185723748503, 0.00645545102811651,
+                   -0.0004534986585293943])
+    E = kepler.solve_kepler(e, ma)
+    assert_allclose(E - e*np.sin(E), ma, rtol=0, atol=1e-15)
+    ma_ld = ma.astype(np.longdouble)
+    E_ld = kepler.solve_kepler(e, ma_ld)
+    assert np.all(np.abs(E_ld - e*np.sin(E_ld) - ma_ld) <=
+                  10*np.finfo(np.longdouble).eps)
+
+def test_solve_kepler_scalar():
+    E = kepler.solve_kepler(0.5, 1.0)
+    assert np.ndim(E) == 0
+    assert_allclose(E - 0.5*np.sin(E), 1.0, atol=1e-15)
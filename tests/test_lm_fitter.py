@@ -0,0 +1,49 @@
+"""Test the Levenberg-Marquardt fitter against the WLS fitter."""
+import os
+import unittest
+import numpy as np
+import pint.toa as toa
+from pint.models import get_model
+from pint.fitter import WlsFitter, LMFitter
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+class TestLMFitter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = get_model('B1855+09_NANOGrav_dfg+12_TAI_FB90.par')
+        cls.toas = toa.get_TOAs('B1855+09_NANOGrav_dfg+12.tim', ephem='DE405')
+        cls.fit_params = ['F0', 'F1', 'DM', 'PX', 'A1', 'PB']
+        for p in cls.model.params:
+            getattr(cls.model, p).frozen = p not in cls.fit_params
+        cls.model.F1.value *= 1.001
+        cls.model.A1.value *= 1 + 1e-6
+
+    def test_lm_fitter(self):
+        wls = WlsFitter(self.toas, self.model)
+        chi2_wls = wls.fit_toas(maxiter=5)
+        lm = LMFitter(self.toas, self.model)
+        chi2_lm = lm.fit_toas(maxiter=20)
+        assert chi2_lm <= chi2_wls * (1 + 1e-6)
+        for p in self.fit_params:
+            par = getattr(lm.model, p)
+            ref = getattr(wls.model, p)
+            assert np.abs(par.value - ref.value) < 0.01 * ref.uncertainty_value, p
+            assert np.isclose(par.uncertainty_value, ref.uncertainty_value,
+                              rtol=1e-3), p
+        iterations = lm.iterations
+        assert len(iterations) < 20
+        assert all(it['time'] > 0 for it in iterations)
+        accepted = [it['chi2'] for it in iterations if it['accepted']]
+        assert np.all(np.diff(accepted) < 0)
+
+    def test_no_broyden(self):
+        lm = LMFitter(self.toas, self.model)
+        lm.fit_toas(broyden=False)
+        assert all(it['jacobian'] == 'exact' for it in lm.iterations)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+"""Test pickling and snapshots of timing models, and the shared TOA table."""
+import os
+import copy
+import pickle
+import unittest
+import numpy as np
+import astropy.units as u
+import pint.toa as toa
+from pint.models import get_model
+from pint.parallel import SharedTOATable
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+class TestModelPickle(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.parf = 'B1855+09_NANOGrav_9yv1.gls.par'
+        cls.timf = 'B1855+09_NANOGrav_9yv1.tim'
+        cls.toas = toa.get_TOAs(cls.timf, ephem="DE421", planets=False,
+                                include_bipm=False)
+        cls.model = get_model(cls.parf)
+
+    def test_pickle_round_trip(self):
+        m2 = pickle.loads(pickle.dumps(self.model))
+        assert set(m2.components.keys()) == set(self.model.components.keys())
+        for p in self.model.params:
+            q1 = getattr(self.model, p).quantity
+            q2 = getattr(m2, p).quantity
+            if isinstance(q1, u.Quantity):
+                assert np.all(q1 == q2), p
+        d1 = self.model.delay(self.toas.table)
+        d2 = m2.delay(self.toas.table)
+        assert np.all(d1 == d2)
+
+    def test_snapshot_restore(self):
+        m = copy.deepcopy(self.model)
+        state = m.snapshot()
+        f0 = m.F0.quantity
+        m.F0.quantity = f0 * 1.1
+        m.F0.frozen = not m.F0.frozen
+        m.restore(state)
+        assert m.F0.quantity == f0
+        assert m.F0.frozen == self.model.F0.frozen
+
+    def test_deepcopy_independent(self):
+        m = copy.deepcopy(self.model)
+        m.F0.quantity = self.model.F0.quantity * 2
+        assert m.F0.quantity != self.model.F0.quantity
+        assert sorted(m.components.keys()) == \
+            sorted(self.model.components.keys())
+        for cp in m.components.values():
+            assert cp._parent is m
+
+    def test_shared_table(self):
+        with SharedTOATable(self.toas.table) as shared:
+            shared2 = pickle.loads(pickle.dumps(shared))
+            tbl = shared2.attach()
+            assert len(tbl) == len(self.toas.table)
+            assert len(tbl.groups) == len(self.toas.table.groups)
+            d1 = self.model.delay(self.toas.table)
+            d2 = self.model.delay(tbl)
+            assert np.all(d1 == d2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Test the marginalized noise likelihood."""
+import os
+import tempfile
+import unittest
+import numpy as np
+import astropy.units as u
+import pint.toa as toa
+from pint.models import get_model
+from pint.residuals import resids
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+class TestNoiseLoglike(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = get_model('B1855+09_NANOGrav_9yv1.gls.par')
+        cls.toas = toa.get_TOAs('B1855+09_NANOGrav_9yv1.tim', ephem="DE421",
+                                planets=False, include_bipm=False)
+        cls.res = resids(cls.toas, cls.model).time_resids.to(u.s).value
+
+    def dense_loglike(self, model=None):
+        if model is None:
+            model = self.model
+        t = self.toas.table
+        C = model.covariance_matrix(t)
+        M = model.designmatrix(t)[0]
+        M = M / np.sqrt(np.sum(M**2, axis=0))
+        cinv_M = np.linalg.solve(C, M)
+        cinv_r = np.linalg.solve(C, self.res)
+        MCM = np.dot(M.T, cinv_M)
+        d = np.dot(M.T, cinv_r)
+        chi2 = np.dot(self.res, cinv_r) - np.dot(d, np.linalg.solve(MCM, d))
+        norm = np.sqrt(np.sum(model.designmatrix(t)[0]**2, axis=0))
+        return -0.5 * (chi2 + np.linalg.slogdet(C)[1] +
+                       np.linalg.slogdet(MCM)[1] + 2 * np.sum(np.log(norm)) +
+                       (len(t) - M.shape[1]) * np.log(2 * np.pi))
+
+    def test_loglike(self):
+        for epoch_blocks in [True, False]:
+            ll = self.model.noise_loglike(self.toas.table, self.res,
+                                          epoch_blocks=epoch_blocks)
+            assert np.isclose(ll, self.dense_loglike(), rtol=0, atol=1e-3)
+
+    def test_overlapping_ecorr(self):
+        # An ECORR on the L-wide receiver overlaps the ECORRs of the L-wide
+        # receiver and backend pairs: they can not be epoch blocks.
+        with open('B1855+09_NANOGrav_9yv1.gls.par') as f:
+            par = f.read() + 'ECORR -fe L-wide 0.5\n'
+        fd, name = tempfile.mkstemp(suffix='.par')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(par)
+            model = get_model(name)
+        finally:
+            os.remove(name)
+        assert not model.epoch_blocks_available(self.toas.table)
+        ll = model.noise_loglike(self.toas.table, self.res)
+        assert np.isclose(ll, self.dense_loglike(model), rtol=0, atol=1e-3)
+
+    def test_samples(self):
+        t = self.toas.table
+        orig = dict((p, getattr(self.model, p).value)
+                    for p in ['RNAMP', 'EFAC1'])
+        ll0 = self.model.noise_loglike(t, self.res)
+        engine = self.model.noise_engine(t)
+        # Only the red noise weights change: the engine is reused
+        ll1 = self.model.noise_loglike(t, self.res, {'RNAMP': 0.03})
+        assert self.model.noise_engine(t) is engine
+        assert np.isclose(ll1, self.dense_loglike(), rtol=0, atol=1e-3)
+        ll2 = self.model.noise_loglike(t, self.res, {'EFAC1': 1.3})
+        assert self.model.noise_engine(t) is not engine
+        assert np.isclose(ll2, self.dense_loglike(), rtol=0, atol=1e-3)
+        ll3 = self.model.noise_loglike(t, self.res, orig)
+        assert np.isclose(ll3, ll0, rtol=0, atol=1e-6)
+
+    def test_structured_covariance(self):
+        t = self.toas.table
+        C = self.model.covariance_matrix(t)
+        engine = self.model.covariance_matrix(t, structured=True)
+        assert np.allclose(engine.dot(self.res), np.dot(C, self.res),
+                           rtol=1e-10, atol=0)
+        assert np.allclose(engine.solve(self.res),
+                           np.linalg.solve(C, self.res))
+        assert np.isclose(engine.logdet(), np.linalg.slogdet(C)[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""Test the numerical derivative engine against the analytic derivatives."""
+import os
+import unittest
+import numpy as np
+import pint.toa as toa
+from pint.models import get_model
+from pint.parallel import SharedTOATable, make_pool
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+class TestNumericalDerivs(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.parf = 'B1855+09_NANOGrav_9yv1.gls.par'
+        cls.timf = 'B1855+09_NANOGrav_9yv1.tim'
+        cls.toas = toa.get_TOAs(cls.timf, ephem="DE421", planets=False,
+                                include_bipm=False)
+        cls.model = get_model(cls.parf)
+        cls.params = ['F0', 'F1', 'DMX_0001', 'PX']
+
+    def test_against_analytic(self):
+        delay = self.model.delay(self.toas.table)
+        for order in [2, 4]:
+            nd = self.model.numerical_derivs(self.toas.table, self.params,
+                                             order=order)
+            for p in self.params:
+                ad = self.model.d_phase_d_param(self.toas.table, delay, p)
+                ndp = nd[p].to(ad.unit).value
+                diff = np.abs(ndp - ad.value).max()
+                assert diff <= 1e-3 * np.abs(ad.value).max(), (p, order)
+
+    def test_values_restored(self):
+        before = self.model.snapshot(self.params)
+        self.model.numerical_derivs(self.toas.table, self.params, order=6)
+        after = self.model.snapshot(self.params)
+        for p in self.params:
+            assert before[p][0] == after[p][0]
+
+    def test_process_pool(self):
+        nd1 = self.model.numerical_derivs(self.toas.table, self.params)
+        with SharedTOATable(self.toas.table) as shared:
+            pool = make_pool(self.model, shared, processes=2)
+            try:
+                nd2 = self.model.numerical_derivs(self.toas.table,
+                                                  self.params, pool=pool)
+            finally:
+                pool.close()
+                pool.join()
+        for p in self.params:
+            assert np.allclose(nd1[p].value, nd2[p].value, rtol=1e-8)
+
+    def test_bad_order(self):
+        with self.assertRaises(ValueError):
+            self.model.numerical_derivs(self.toas.table, ['F0'], order=3)
+
+
+if __name__ == '__main__':
+    unittest.main()
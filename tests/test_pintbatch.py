@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+from __future__ import division, print_function
+import sys, os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pint.batch
+import pint.scripts.pintbatch as pintbatch
+from pinttestdata import testdir, datadir
+
+parfile = os.path.join(datadir, 'NGC6440E.par')
+timfile = os.path.join(datadir, 'NGC6440E.tim')
+
+
+def fit_or_die(job):
+    """Stand-in for pint.batch.fit_pulsar whose worker dies on 'die.par'"""
+    if job['parfile'] == 'die.par':
+        os._exit(1)
+    result = pint.batch._failed_result(job)
+    result['status'] = 'ok'
+    return result
+
+
+class TestPintbatch(unittest.TestCase):
+
+    def setUp(self):
+        self.outdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.outdir)
+
+    def test_fit_batch(self):
+        pairs = [(parfile, timfile), (parfile, 'no_such_file.tim'),
+                 (parfile, timfile)]
+        summary = pint.batch.fit_batch(pairs, processes=2, outdir=self.outdir)
+        assert list(summary['status']) == ['ok', 'failed', 'ok']
+        assert summary['error'][1] != ''
+        ok = summary[summary['status'] == 'ok']
+        assert np.all(ok['chi2'] == ok['chi2'][0])
+        assert np.all(ok['ntoas'] > 0)
+        assert np.all(ok['fit_time'] > 0)
+        assert os.path.isfile(ok['outfile'][0])
+
+    @unittest.skipIf(pint.batch.ProcessPoolExecutor is None,
+                     "A dead worker blocks the batch on Python 2")
+    def test_worker_dies(self):
+        pairs = [('a.par', 'a.tim'), ('die.par', 'b.tim'), ('c.par', 'c.tim'),
+                 ('d.par', 'd.tim')]
+        fit_pulsar = pint.batch.fit_pulsar
+        pint.batch.fit_pulsar = fit_or_die
+        try:
+            summary = pint.batch.fit_batch(pairs, processes=2)
+        finally:
+            pint.batch.fit_pulsar = fit_pulsar
+        assert list(summary['status']) == ['ok', 'failed', 'ok', 'ok']
+        assert 'died' in summary['error'][1]
+
+    def test_count_toa_lines(self):
+        included = os.path.join(self.outdir, 'included.tim')
+        with open(included, 'w') as f:
+            f.write('FORMAT 1\nC a comment\n'
+                    'a 1400.0 55000.0 1.0 ao\nb 1400.0 55001.0 1.0 ao\n')
+        top = os.path.join(self.outdir, 'top.tim')
+        with open(top, 'w') as f:
+            f.write('FORMAT 1\n# a comment\nINCLUDE {0}\n\nJUMP\n'
+                    'c 1400.0 55002.0 1.0 ao\nJUMP\n'.format(included))
+        assert pint.batch._count_toa_lines(top) == 3
+        assert pint.batch._count_toa_lines('no_such_file.tim') == 0
+
+    def test_script(self):
+        joblist = os.path.join(self.outdir, 'jobs.txt')
+        with open(joblist, 'w') as f:
+            f.write('# par tim\n{0} {1}\n'.format(parfile, timfile))
+        summary = os.path.join(self.outdir, 'summary.ecsv')
+        ret = pintbatch.main([joblist, '--processes', '1', '--summary',
+                              summary])
+        assert ret == 0
+        assert os.path.isfile(summary)
+
+if __name__ == '__main__':
+    unittest.main()
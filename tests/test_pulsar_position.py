@@ -68,3 +68,23 @@ class TestPulsarPosition(unittest.TestCase):
         self.assertTrue(np.isclose(self.m1.ELAT.value, ELAT_v))
         self.assertTrue(np.isclose(self.m1.PMELONG.value, PMELONG_v))
         self.assertTrue(np.isclose(self.m1.PMELAT.value, PMELAT_v))
+
+    def test_against_coords(self):
+        for m in [self.m1, self.m2]:
+            p = m.ssb_to_psb_xyz_ICRS(epoch=self.t)
+            p_coords = m.coords_as_ICRS(epoch=self.t).cartesian.xyz.transpose()
+            self.assertTrue(np.max(np.abs(p - p_coords)) < 1e-12)
+            p0 = m.ssb_to_psb_xyz_ICRS()
+            p0_coords = m.coords_as_ICRS().cartesian.xyz.transpose()
+            self.assertTrue(np.max(np.abs(p0 - p0_coords)) < 1e-12)
+
+    def test_cache(self):
+        p1 = self.m2.ssb_to_psb_xyz_ICRS(epoch=self.t)
+        self.assertTrue(self.m2.ssb_to_psb_xyz_ICRS(epoch=self.t.copy()) is p1)
+        self.assertFalse(self.m2.ssb_to_psb_xyz_ICRS(epoch=self.t + 1) is p1)
+        PMRA = self.m2.PMRA.value
+        self.m2.PMRA.value = PMRA + 1.0
+        p2 = self.m2.ssb_to_psb_xyz_ICRS(epoch=self.t)
+        self.m2.PMRA.value = PMRA
+        self.assertFalse(p2 is p1)
+        self.assertTrue(np.max(np.abs(p2 - p1)) > 0)
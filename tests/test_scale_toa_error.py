@@ -0,0 +1,59 @@
+"""Test the scaled TOA uncertainties from EFAC and EQUAD."""
+import os
+import unittest
+import numpy as np
+import astropy.units as u
+import pint.toa as toa
+from pint.models import get_model
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+class TestScaleToaError(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = get_model('B1855+09_NANOGrav_9yv1.gls.par')
+        cls.toas = toa.get_TOAs('B1855+09_NANOGrav_9yv1.tim', ephem="DE421",
+                                planets=False, include_bipm=False)
+        cls.cp = cls.model.components['ScaleToaError']
+
+    def mask_sigma(self):
+        # Scale the uncertainties mask by mask
+        t = self.toas.table
+        sigma_old = t['error'].quantity
+        sigma_scaled = np.zeros_like(sigma_old)
+        for efac, equad in self.cp.pair_EFAC_EQUAD():
+            mask = efac.select_toa_mask(t)
+            sigma_scaled[mask] = efac.quantity * \
+                np.sqrt(sigma_old[mask]**2 + equad.quantity**2)
+        return sigma_scaled
+
+    def test_scale_sigma(self):
+        sigma = self.cp.scale_sigma(self.toas.table)
+        assert sigma.unit == self.toas.table['error'].unit
+        assert np.allclose(sigma.value, self.mask_sigma().to(sigma.unit).value,
+                           rtol=1e-14, atol=0)
+        assert np.all(sigma.value > 0)
+
+    def test_cache(self):
+        pairs = self.cp.pair_EFAC_EQUAD()
+        assert self.cp.pair_EFAC_EQUAD() == pairs
+        index = self.cp.toa_pair_index(self.toas.table)
+        efac, equad = pairs[0]
+        old = efac.key_value
+        efac.key_value = ['no_such_backend']
+        equad.key_value = ['no_such_backend']
+        try:
+            new_index = self.cp.toa_pair_index(self.toas.table)
+            assert np.all(new_index[index == 0] == -1)
+            sigma = self.cp.scale_sigma(self.toas.table)
+            assert np.all(sigma.value[index == 0] == 0)
+        finally:
+            efac.key_value = old
+            equad.key_value = old
+        assert np.all(self.cp.toa_pair_index(self.toas.table) == index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""Test the vectorized solar system Shapiro delay."""
+import os
+import unittest
+import numpy as np
+import astropy.units as u
+import pint.toa as toa
+from pint.models import get_model
+from pinttestdata import testdir, datadir
+
+os.chdir(datadir)
+
+
+class TestSolarSystemShapiro(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = get_model('B1855+09_NANOGrav_9yv1.gls.par')
+        cls.toas = toa.get_TOAs('B1855+09_NANOGrav_9yv1.tim', ephem="DE421",
+                                planets=True, include_bipm=False)
+        cls.cp = cls.model.components['SolarSystemShapiro']
+
+    def group_delay(self):
+        # The per observatory and per object calculation
+        toas = self.toas.table
+        delay = np.zeros(len(toas))
+        for ii, key in enumerate(toas.groups.keys):
+            grp = toas.groups[ii]
+            loind, hiind = toas.groups.indices[ii:ii+2]
+            psr_dir = self.cp.ssb_to_psb_xyz_ICRS(
+                epoch=grp['tdbld'].astype(np.float64))
+            for b in self.cp.shapiro_bodies():
+                delay[loind:hiind] += self.cp.ss_obj_shapiro_delay(
+                    grp['obs_' + b + '_pos'], psr_dir,
+                    self.cp._ss_mass_sec[b])
+        return delay
+
+    def test_vectorized(self):
+        for planets in [False, True]:
+            self.model.PLANET_SHAPIRO.value = planets
+            delay = self.cp.solar_system_shapiro_delay(self.toas.table)
+            assert np.allclose(delay.to(u.s).value, self.group_delay(),
+                               rtol=0, atol=1e-15)
+        self.model.PLANET_SHAPIRO.value = False
+
+    def test_sun_only(self):
+        self.model.PLANET_SHAPIRO.value = False
+        t = toa.get_TOAs('B1855+09_NANOGrav_9yv1.tim', ephem="DE421",
+                         planets=True, include_bipm=False, model=self.model)
+        assert 'obs_jupiter_pos' not in t.table.colnames
+        delay = self.cp.solar_system_shapiro_delay(t.table)
+        assert np.all(delay == self.cp.solar_system_shapiro_delay(
+                                           self.toas.table))
+        self.model.PLANET_SHAPIRO.value = True
+        with self.assertRaises(ValueError):
+            self.cp.solar_system_shapiro_delay(t.table)
+        self.model.PLANET_SHAPIRO.value = False
+
+
+if __name__ == '__main__':
+    unittest.main()
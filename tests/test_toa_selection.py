@@ -5,12 +5,45 @@ import numpy as np
 from astropy.table import Table
 import astropy.units as u
 import os, unittest
-from pint.toa_select import TOASelect
+from pint.toa_select import TOASelect, column_version, bump_column_version
 import copy
 from pinttestdata import testdir, datadir
 import logging
 os.chdir(datadir)
 
+def test_column_version():
+    t = Table([np.linspace(50000, 51000, 100),
+               np.array(['L-wide', '430', None, 'S'] * 25, dtype=object)],
+              names=('mjd_float', 'fe'))
+    stamp = column_version(t['mjd_float'])
+    assert column_version(t['mjd_float']) == stamp
+    # A copy gets its own stamp
+    t2 = copy.deepcopy(t)
+    assert column_version(t2['mjd_float']) != stamp
+    # Nor does a copy made after the original column is freed, which can
+    # reuse its address.
+    t0 = Table([np.arange(5.0)], names=('freq',))
+    stamp0 = column_version(t0['freq'])
+    t1 = t0[np.array([True, False, True, False, True])]
+    del t0
+    for ii in range(20):
+        assert column_version(t1.copy()['freq']) != stamp0
+    t['mjd_float'][:10] = 50500.0
+    bump_column_version(t['mjd_float'])
+    assert column_version(t['mjd_float']) != stamp
+    sel = TOASelect(is_range=True).get_select_index(
+        {'DMX_0001': (50400, 50600)}, t['mjd_float'])
+    msk = (t['mjd_float'] >= 50400) & (t['mjd_float'] <= 50600)
+    assert np.all(sel['DMX_0001'] == np.where(msk)[0])
+    # Selections on the same column are shared between the selectors
+    sel1 = TOASelect(is_range=False).get_select_index({'JUMP1': '430'},
+                                                       t['fe'])
+    sel2 = TOASelect(is_range=False).get_select_index({'JUMP2': '430'},
+                                                       t['fe'])
+    assert sel1['JUMP1'] is sel2['JUMP2']
+    assert np.all(sel1['JUMP1'] == np.where(t['fe'] == '430')[0])
+
+
 class TestTOAselection(unittest.TestCase):
     @classmethod
     def setUpClass(self):
@@ -80,38 +113,26 @@ class TestTOAselection(unittest.TestCase):
         dmx_new = self.model.dmx_dm(self.sort_table).value
         assert np.allclose(dmx_old, dmx_new)
 
-    def test_hash(self):
-        self.model.dmx_toas_selector.use_hash = True
-        dmx_old = self.get_dmx_old(self.toas.table).value
-        dmx_new = self.model.dmx_dm(self.toas.table).value
-        assert np.allclose(dmx_old, dmx_new)
-        assert self.model.dmx_toas_selector.use_hash
+    def test_bin_index_cache(self):
+        names, idx = self.model.dmx_bin_index(self.toas.table)
+        names2, idx2 = self.model.dmx_bin_index(self.toas.table)
+        assert names == names2
+        assert np.all(idx == idx2)
         dmx_old = self.get_dmx_old(self.sort_table).value
         dmx_new = self.model.dmx_dm(self.sort_table).value
         assert np.allclose(dmx_old, dmx_new)
 
     def test_change_condition(self):
-        log= logging.getLogger( "TestTOAselection.test_change_condition" )
-        dmx_old = self.get_dmx_old(self.toas.table).value
-        dmx_new = self.model.dmx_dm(self.toas.table).value
-        indx0004 = self.model.dmx_toas_selector.select_result['DMX_0004']
-        indx0005 = self.model.dmx_toas_selector.select_result['DMX_0005']
-        for l in indx0004:
-            log.debug( "indx0004= %s", str(l))
-        for l in indx0005:
-            log.debug( "indx0005= %s", str(l))
+        names, idx = self.model.dmx_bin_index(self.toas.table)
+        indx0004 = np.where(idx == names.index('DMX_0004'))[0]
+        indx0005 = np.where(idx == names.index('DMX_0005'))[0]
         Temp1 = self.model.DMXR2_0004.value
         Temp2 = self.model.DMXR1_0005.value
         self.model.DMXR2_0004.value = self.model.DMXR2_0005.value
         self.model.DMXR1_0005.value = self.model.DMXR2_0005.value
-        dmx_old = self.get_dmx_old(self.toas.table).value
-        dmx_new = self.model.dmx_dm(self.toas.table).value
-        indx0004_2 = self.model.dmx_toas_selector.select_result['DMX_0004']
-        indx0005_2 = self.model.dmx_toas_selector.select_result['DMX_0005']
-        for l in indx0004_2:
-            log.debug( "indx0004_2= %s", str(l))
-        for l in indx0005_2:
-            log.debug( "indx0005_2= %s", str(l))
+        names, idx = self.model.dmx_bin_index(self.toas.table)
+        indx0004_2 = np.where(idx == names.index('DMX_0004'))[0]
+        indx0005_2 = np.where(idx == names.index('DMX_0005'))[0]
         self.model.DMXR2_0004.value = Temp1
         self.model.DMXR1_0005.value = Temp2
         run1 = np.concatenate((indx0004, indx0005))
@@ -122,5 +143,15 @@ class TestTOAselection(unittest.TestCase):
         assert len(run1) == len(run2)
         assert np.allclose(run1, run2)
 
+    def test_sparse_block(self):
+        params = self.model.sparse_deriv_params
+        block = self.model.d_delay_d_params_sparse(self.toas.table, params)
+        assert block.shape == (len(self.toas.table), len(params))
+        assert np.all(np.diff(block.tocsr().indptr) <= 1)
+        for ii in [0, len(params) // 2, len(params) - 1]:
+            col = self.model.d_delay_d_DMX(self.toas.table, params[ii])
+            assert np.allclose(block[:, ii].toarray().ravel(),
+                               col.to(u.s / self.model.DM.units).value)
+
 if __name__ =="__main__":
     unittest.main()
@@ -41,3 +41,17 @@ class Testwls(unittest.TestCase):
             tol = 2.6
             msg = "Fitting parameter " + p + " failed. with chi2_red " + str(chi2_red)
             assert chi2_red < tol, msg
+
+    def test_chunks(self):
+        self.perturb_param('F1', self.per_param['F1'])
+        self.f.set_fitparams(*self.per_param.keys())
+        self.f.fit_toas()
+        values = self.f.get_fitparams_num()
+        errors = self.f.get_fitparams_uncertainty()
+        self.perturb_param('F1', self.per_param['F1'])
+        self.f.set_fitparams(*self.per_param.keys())
+        self.f.fit_toas(chunk_size=100)
+        for p, v in values.items():
+            par = getattr(self.f.model, p)
+            assert numpy.abs(par.value - v) < 1e-6 * par.uncertainty.value, p
+            assert numpy.isclose(par.uncertainty_value, errors[p]), p